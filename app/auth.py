@@ -8,12 +8,13 @@ from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
 from models import User
 from schemas import TokenData
-from settings import ALGORITHM, SECRET_KEY
+from settings import ALGORITHM, BCRYPT_ROUNDS, SECRET_KEY
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 ACCESS_TOKEN_EXPIRE_MINUTES = 120
 oauth2_scheme = HTTPBearer()
+optional_oauth2_scheme = HTTPBearer(auto_error=False)
 
 
 def get_password_hash(password: str) -> str:
@@ -23,7 +24,8 @@ def get_password_hash(password: str) -> str:
     :param password: исходный пароль в виде строки
     :return: захешированный пароль в виде строки
     """
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -105,6 +107,25 @@ async def get_current_user(
     return user
 
 
+def get_token_user_id(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_oauth2_scheme),
+) -> Optional[int]:
+    """
+    Достаёт id пользователя из необязательного Bearer токена без запроса к БД.
+    Используется только для выбора реплики/основной БД, не для авторизации
+
+    :param credentials: заголовок Authorization с Bearer токеном (может отсутствовать)
+    :return: id пользователя или None
+    """
+    if credentials is None:
+        return None
+    try:
+        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        return int(payload["sub"])
+    except (JWTError, KeyError, TypeError, ValueError):
+        return None
+
+
 async def get_current_user_ws(token: str, db: AsyncSession) -> Optional[User]:
     """
     Получает текущего пользователя по JWT токену из WebSocket-соединения
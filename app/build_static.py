@@ -0,0 +1,60 @@
+import argparse
+import gzip
+import os
+import sys
+from pathlib import Path
+
+from http_compression import brotli
+
+# Уже сжатые форматы повторно не сжимаем
+SKIP_SUFFIXES = {".gz", ".br", ".png", ".jpg", ".jpeg", ".gif", ".webp", ".woff", ".woff2", ".zip"}
+
+
+def build_variants(path: Path) -> list[Path]:
+    """
+    Создаёт рядом с файлом максимально сжатые варианты file.gz и file.br.
+    Вариант сохраняется, только если он меньше исходного файла
+
+    :param path: путь к исходному файлу
+    :return: список созданных файлов
+    """
+    data = path.read_bytes()
+    compressors = [(".gz", lambda body: gzip.compress(body, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        compressors.append((".br", lambda body: brotli.compress(body, quality=11)))
+
+    created = []
+    for extension, compress in compressors:
+        target = path.with_name(path.name + extension)
+        compressed = compress(data)
+        if len(compressed) < len(data):
+            target.write_bytes(compressed)
+            created.append(target)
+        elif target.exists():
+            target.unlink()
+    return created
+
+
+def main() -> None:
+    """
+    Точка входа: python app/build_static.py [каталог]
+    Запускается при сборке образа, чтобы сервер не сжимал статику на лету
+    """
+    default_dir = Path(__file__).resolve().parent.parent / "static"
+    parser = argparse.ArgumentParser(description="Сжатие статики gzip/brotli на этапе сборки")
+    parser.add_argument("directory", nargs="?", default=str(default_dir))
+    args = parser.parse_args()
+
+    if brotli is None:
+        print("brotli не установлен: создаются только .gz", file=sys.stderr)
+    for root, _, files in os.walk(args.directory):
+        for name in files:
+            path = Path(root) / name
+            if path.suffix.lower() in SKIP_SUFFIXES:
+                continue
+            for target in build_variants(path):
+                print(f"{target} ({target.stat().st_size} из {path.stat().st_size} байт)")
+
+
+if __name__ == "__main__":
+    main()
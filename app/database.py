@@ -1,13 +1,90 @@
-from collections.abc import AsyncGenerator
+from collections.abc import AsyncGenerator, Hashable
 from contextlib import asynccontextmanager
+from typing import Any
 
-from settings import DATABASE_URL
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from cache import LRUCache
+from settings import (DATABASE_SCHEMA, DATABASE_URL, RECENT_WRITES_CACHE_SIZE,
+                      REPLICA_DATABASE_URL, REPLICA_LAG_SECONDS)
+from sqlalchemy import event, make_url
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import (AsyncEngine, AsyncSession,
+                                    create_async_engine)
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
-engine = create_async_engine(DATABASE_URL, echo=False, future=True)
+
+def engine_options(url: str) -> dict[str, Any]:
+    """
+    Параметры движка для диалекта: search_path для DATABASE_SCHEMA в Postgres.
+    База SQLite в памяти живёт, пока открыто соединение, поэтому все сессии
+    используют одно соединение (StaticPool)
+
+    :param url: адрес базы данных
+    :return: именованные аргументы create_async_engine
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "postgresql":
+        if DATABASE_SCHEMA is None:
+            return {}
+        return {"connect_args": {"server_settings": {"search_path": DATABASE_SCHEMA}}}
+    if parsed.get_backend_name() != "sqlite":
+        return {}
+    options: dict[str, Any] = {"connect_args": {"check_same_thread": False}}
+    if parsed.database in (None, "", ":memory:"):
+        options["poolclass"] = StaticPool
+    return options
+
+
+def configure_sqlite_connection(dbapi_connection: Any, connection_record: Any) -> None:
+    """
+    Включает проверку внешних ключей и отключает собственное управление транзакциями
+    драйвера: BEGIN выдаёт begin_sqlite_transaction, иначе не работают SAVEPOINT
+    """
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def begin_sqlite_transaction(connection: Any) -> None:
+    """Явно начинает транзакцию SQLite"""
+    connection.exec_driver_sql("BEGIN")
+
+
+def configure_sqlite_engine(async_engine: AsyncEngine) -> None:
+    """
+    Подключает обработчики соединений SQLite к движку
+
+    :param async_engine: асинхронный движок SQLAlchemy
+    """
+    if async_engine.dialect.name == "sqlite":
+        event.listen(async_engine.sync_engine, "connect", configure_sqlite_connection)
+        event.listen(async_engine.sync_engine, "begin", begin_sqlite_transaction)
+
+
+engine = create_async_engine(DATABASE_URL, echo=False, future=True, **engine_options(DATABASE_URL))
+configure_sqlite_engine(engine)
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+# Без реплики чтение идёт через основной движок
+read_engine = (
+    create_async_engine(
+        REPLICA_DATABASE_URL, echo=False, future=True, **engine_options(REPLICA_DATABASE_URL)
+    )
+    if REPLICA_DATABASE_URL
+    else engine
+)
+if read_engine is not engine:
+    configure_sqlite_engine(read_engine)
+ReadSessionLocal = sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+
+# insert с ON CONFLICT DO NOTHING / DO UPDATE для диалекта основной БД:
+# у Postgres и SQLite одинаковый интерфейс on_conflict_* и excluded
+dialect_insert = sqlite.insert if engine.dialect.name == "sqlite" else postgresql.insert
+
+# Ключи недавних записей: пока реплика может отставать, их чтения идут на основную БД
+recent_writes = LRUCache(RECENT_WRITES_CACHE_SIZE, ttl=REPLICA_LAG_SECONDS)
+
 
 async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
     """
@@ -28,3 +105,36 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """
     async with AsyncSessionLocal() as session:
         yield session
+
+
+def mark_write(*keys: Hashable) -> None:
+    """
+    Отмечает недавнюю запись, чтобы её автор прочитал свои данные с основной БД
+
+    :param keys: ключи записи, например ("message", user_id, chat_id)
+    """
+    for key in keys:
+        recent_writes.set(key, True)
+
+
+@asynccontextmanager
+async def get_read_db(
+    *keys: Hashable, primary: AsyncSession | None = None
+) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Сессия только для чтения: реплика, либо основная БД, если по одному из ключей
+    была запись в пределах REPLICA_LAG_SECONDS (read-your-writes).
+    Если чтение идёт с основной БД, а у вызывающего уже есть её сессия, используется она:
+    второе соединение из того же пула на запрос может исчерпать пул под нагрузкой
+
+    :param keys: ключи читаемых данных
+    :param primary: уже открытая сессия основной БД (необязательно)
+    :return: объект AsyncSession в контексте
+    """
+    use_primary = read_engine is engine or any(key in recent_writes for key in keys)
+    if use_primary and primary is not None:
+        yield primary
+        return
+    session_factory = AsyncSessionLocal if use_primary else ReadSessionLocal
+    async with session_factory() as session:
+        yield session
@@ -1,16 +1,30 @@
+import hmac
 from typing import Any
+from urllib.parse import quote
 
-from auth import get_current_user
-from database import get_db_session
-from fastapi import APIRouter, Depends, Form, Path, Query, status
+from auth import get_current_user, get_token_user_id
+from database import get_db_session, get_read_db
+from fastapi import (APIRouter, Depends, Form, Header, HTTPException, Path,
+                     Query, Request, Response, status)
+from fastapi.responses import FileResponse
 from fastapi.security import OAuth2PasswordRequestForm
+from metrics import render_metrics
 from models import User
-from queries import (create_chat_query, create_seed_data_query,
-                     get_history_query, get_user_chats_query, join_group_query,
-                     login_query, register_user_query)
-from schemas import ChatCreate, MessageWithSender, Token, UserRead
+from queries import (create_chat_query, create_chats_batch_query,
+                     create_seed_data_query, get_attachment_query,
+                     get_chat_version_query, get_history_query,
+                     get_pending_query, get_user_chats_query,
+                     get_user_chats_version_query, join_group_query,
+                     leave_group_query, login_query, register_user_query,
+                     update_user_name_query, upload_attachment_query)
+from responses import FastJSONResponse
+from schemas import (AttachmentRead, ChatBatchCreate, ChatCreate,
+                     MessageWithSender, Token, UserRead, UserUpdate)
+from settings import ATTACHMENTS_ACCEL_PREFIX, METRICS_TOKEN
+from sharding import chat_route
 from sqlalchemy.ext.asyncio import AsyncSession
-from utils import validate_password
+from storage import storage
+from utils import etag_matches, make_etag, validate_password
 
 router = APIRouter()
 
@@ -47,6 +61,23 @@ async def login(
     return await login_query(form_data, db)
 
 
+@router.patch("/users/me", response_model=UserRead, status_code=status.HTTP_200_OK)
+async def update_me(
+    user_data: UserUpdate,
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user),
+) -> UserRead:
+    """
+    Изменить имя текущего пользователя
+
+    :param user_data: новое имя
+    :param db: сессия базы данных
+    :param current_user: текущий пользователь
+    :return: обновлённые данные пользователя
+    """
+    return await update_user_name_query(user_data.name, db, current_user)
+
+
 @router.post("/create_chats", status_code=status.HTTP_200_OK)
 async def create_chat(
     chat_data: ChatCreate,
@@ -56,7 +87,7 @@ async def create_chat(
     """
     Создать новый чат (личный или групповой)
 
-    :param chat_data: данные чата (название, тип)
+    :param chat_data: данные чата (название, тип, участники группы)
     :param db: сессия базы данных
     :param current_user: текущий пользователь
     :return: данные созданного чата + group_id (если это групповой чат)
@@ -64,18 +95,45 @@ async def create_chat(
     return await create_chat_query(chat_data, db, current_user)
 
 
-@router.get("/get_chats", status_code=status.HTTP_200_OK)
-async def get_user_chats(
-    db: AsyncSession = Depends(get_db_session), current_user: User = Depends(get_current_user)
+@router.post("/create_chats/batch", status_code=status.HTTP_200_OK)
+async def create_chats_batch(
+    batch: ChatBatchCreate,
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user),
 ) -> list[dict[str, Any]]:
     """
-    Получить список чатов, в которых участвует текущий пользователь.
+    Создать пачку чатов с участниками одной транзакцией
 
+    :param batch: список чатов (название, тип, участники группы)
     :param db: сессия базы данных
+    :param current_user: текущий пользователь (создатель групп)
+    :return: данные созданных чатов в порядке запроса
+    """
+    return await create_chats_batch_query(batch.chats, db, current_user)
+
+
+@router.get("/get_chats", response_model=list[dict[str, Any]], status_code=status.HTTP_200_OK)
+async def get_user_chats(
+    if_none_match: str | None = Header(default=None),
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user),
+) -> Any:
+    """
+    Получить список чатов, в которых участвует текущий пользователь.
+    Поддерживает условный запрос: при совпадении If-None-Match возвращается 304
+
+    :param if_none_match: заголовок If-None-Match
+    :param db: сессия основной БД (та же, что у get_current_user)
     :param current_user: текущий авторизованный пользователь
     :return: список чатов
     """
-    return await get_user_chats_query(db, current_user)
+    async with get_read_db(("chats", current_user.id), primary=db) as read_db:
+        version = await get_user_chats_version_query(read_db, current_user)
+        etag = make_etag("chats", current_user.id, *version)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        chats = await get_user_chats_query(read_db, current_user)
+    return FastJSONResponse(chats, headers={"ETag": etag})
 
 
 @router.post("/groups/{group_id}/join", status_code=status.HTTP_200_OK)
@@ -95,6 +153,23 @@ async def join_group(
     return await join_group_query(group_id, db, current_user)
 
 
+@router.post("/groups/{group_id}/leave", status_code=status.HTTP_200_OK)
+async def leave_group(
+    group_id: int,
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user),
+) -> dict[str, Any]:
+    """
+    Выйти из группы
+
+    :param group_id: идентификатор группы
+    :param db: сессия базы данных
+    :param current_user: текущий авторизованный пользователь
+    :return: результат выхода из группы
+    """
+    return await leave_group_query(group_id, db, current_user)
+
+
 @router.get(
     "/history/{chat_id}", response_model=list[MessageWithSender], status_code=status.HTTP_200_OK
 )
@@ -102,18 +177,133 @@ async def get_history(
     chat_id: int = Path(..., description="ID чата"),
     limit: int = Query(default=50, ge=1),
     offset: int = Query(default=0, ge=0),
-    db: AsyncSession = Depends(get_db_session),
-) -> list[MessageWithSender]:
+    after_seq: int | None = Query(default=None, ge=0),
+    if_none_match: str | None = Header(default=None),
+    reader_id: int | None = Depends(get_token_user_id),
+) -> Any:
     """
     Получить историю сообщений в заданном чате.
+    Поддерживает условный запрос: при совпадении If-None-Match возвращается 304.
+    Читается с реплики; автор недавно отправленного сообщения (по токену) читает с основной БД
 
     :param chat_id: идентификатор чата
     :param limit: максимальное количество сообщений
     :param offset: смещение (для пагинации)
+    :param after_seq: номер последнего полученного сообщения (догрузка пропуска)
+    :param if_none_match: заголовок If-None-Match
+    :param reader_id: id пользователя из необязательного токена
+    :return: список сообщений в формате MessageWithSender (без повторной валидации)
+    """
+    async with get_read_db(("message", reader_id, chat_id)) as db:
+        last_id, count, names = await get_chat_version_query(
+            chat_id, db, limit, offset, after_seq
+        )
+        headers = {}
+        # У пустого (или несуществующего) чата версии нет — отдаём обычный ответ/404
+        if count:
+            etag = make_etag("history", chat_id, limit, offset, after_seq, last_id, count, names)
+            if etag_matches(if_none_match, etag):
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+            headers["ETag"] = etag
+        messages = await get_history_query(chat_id, limit, offset, db, after_seq)
+    return FastJSONResponse(messages, headers=headers)
+
+
+@router.get("/pending", response_model=list[dict[str, Any]], status_code=status.HTTP_200_OK)
+async def get_pending(
+    db: AsyncSession = Depends(get_db_session), current_user: User = Depends(get_current_user)
+) -> Any:
+    """
+    Получить чаты, в которых у пользователя есть недоставленные сообщения.
+    Клиент после переподключения догружает только эти чаты
+
+    :param db: сессия базы данных
+    :param current_user: текущий авторизованный пользователь
+    :return: список {chat_id, delivered_seq, last_seq, pending}
+    """
+    return FastJSONResponse(await get_pending_query(db, current_user))
+
+
+@router.post("/attachments", response_model=AttachmentRead, status_code=status.HTTP_201_CREATED)
+async def upload_attachment(
+    request: Request,
+    filename: str = Query(..., min_length=1, description="Имя файла"),
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user),
+) -> AttachmentRead:
+    """
+    Загрузить вложение: тело запроса — содержимое файла (передаётся потоком),
+    Content-Type — тип файла. Отправляется в чат через new_message с attachment_id
+
+    :param request: запрос с телом файла
+    :param filename: имя файла
+    :param db: сессия базы данных
+    :param current_user: текущий авторизованный пользователь
+    :return: метаданные вложения
+    """
+    return await upload_attachment_query(request, filename, db, current_user)
+
+
+@router.get("/attachments/{attachment_id}", status_code=status.HTTP_200_OK)
+async def download_attachment(
+    attachment_id: int,
+    db: AsyncSession = Depends(get_db_session),
+    current_user: User = Depends(get_current_user),
+) -> Response:
+    """
+    Скачать вложение. Файл отдаётся с диска частями с поддержкой Range,
+    а при заданном ATTACHMENTS_ACCEL_PREFIX — через X-Accel-Redirect (sendfile в nginx)
+
+    :param attachment_id: идентификатор вложения
     :param db: сессия базы данных
-    :return: список сообщений (MessageWithSender)
+    :param current_user: текущий авторизованный пользователь
+    :return: содержимое файла
+    """
+    attachment = await get_attachment_query(attachment_id, db, current_user)
+    # Содержимое по ключу sha256 никогда не меняется
+    headers = {"ETag": f'"{attachment.sha256}"', "Cache-Control": "private, max-age=31536000"}
+    if ATTACHMENTS_ACCEL_PREFIX:
+        headers["X-Accel-Redirect"] = f"{ATTACHMENTS_ACCEL_PREFIX}/{attachment.storage_key}"
+        headers["Content-Disposition"] = (
+            f"attachment; filename*=utf-8''{quote(attachment.filename)}"
+        )
+        return Response(media_type=attachment.content_type, headers=headers)
+    return FileResponse(
+        storage.path(attachment.storage_key),
+        media_type=attachment.content_type,
+        filename=attachment.filename,
+        headers=headers,
+    )
+
+
+@router.get("/route/{chat_id}", status_code=status.HTTP_200_OK)
+async def get_chat_route(chat_id: int) -> dict[str, Any]:
+    """
+    Узел, обслуживающий WebSocket-соединения чата (для фронт-прокси и клиентов).
+    Без шардирования node и url равны None: подключаться можно к любому узлу
+
+    :param chat_id: идентификатор чата
+    :return: словарь с chat_id, node и url
+    """
+    node_id, url = chat_route(chat_id)
+    return {"chat_id": chat_id, "node": node_id, "url": url}
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics(authorization: str | None = Header(default=None)) -> Response:
+    """
+    Метрики процесса в текстовом формате Prometheus (гистограммы этапов обработки сообщений).
+    Доступны только по токену METRICS_TOKEN, без него эндпоинт выключен
+
+    :param authorization: заголовок Authorization: Bearer <METRICS_TOKEN>
+    :return: текст метрик
     """
-    return await get_history_query(chat_id, limit, offset, db)
+    if METRICS_TOKEN is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    expected = f"Bearer {METRICS_TOKEN}".encode()
+    if not hmac.compare_digest((authorization or "").encode(), expected):
+        raise HTTPException(status_code=401, detail="Нужен токен метрик")
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
 
 
 @router.post("/seed_data", status_code=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,131 @@
+import gzip
+from collections.abc import Sequence
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli — необязательная зависимость
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+
+def accepted_encodings(accept_encoding: str) -> set[str]:
+    """
+    Разбирает заголовок Accept-Encoding, отбрасывая кодировки с q=0
+
+    :param accept_encoding: значение заголовка Accept-Encoding
+    :return: множество названий кодировок в нижнем регистре
+    """
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in {"q=0", "q=0.0", "q=0.00", "q=0.000"}:
+            continue
+        accepted.add(name.strip())
+    return accepted
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """
+    Выбирает алгоритм сжатия по заголовку Accept-Encoding.
+    Brotli предпочтительнее gzip, если библиотека установлена
+
+    :param accept_encoding: значение заголовка Accept-Encoding
+    :return: "br", "gzip" или None, если клиент не поддерживает сжатие
+    """
+    accepted = accepted_encodings(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress_body(body: bytes, encoding: str, gzip_level: int, brotli_quality: int) -> bytes:
+    """
+    Сжимает тело ответа выбранным алгоритмом
+
+    :param body: исходное тело ответа
+    :param encoding: "br" или "gzip"
+    :param gzip_level: уровень сжатия gzip (1-9)
+    :param brotli_quality: качество brotli (0-11)
+    :return: сжатое тело
+    """
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    ASGI-мидлварь, сжимающая gzip/brotli ответы выбранных эндпоинтов,
+    если тело больше порога. Ответы этих эндпоинтов целиком помещаются
+    в память, поэтому тело буферизуется и сжимается одним вызовом
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        paths: Sequence[str],
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 5,
+    ) -> None:
+        self.app = app
+        self.paths = tuple(paths)
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def matches(self, path: str) -> bool:
+        """
+        Относится ли путь к сжимаемым эндпоинтам (совпадение по сегментам:
+        /history и /history/1 подходят, /historyfoo — нет)
+
+        :param path: путь запроса
+        :return: True, если ответ нужно сжимать
+        """
+        return any(path == prefix or path.startswith(prefix + "/") for prefix in self.paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.matches(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start_message: Message | None = None
+        chunks: list[bytes] = []
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            headers = MutableHeaders(scope=start_message)
+            headers.add_vary_header("Accept-Encoding")
+            if (
+                encoding is not None
+                and len(body) >= self.minimum_size
+                and "content-encoding" not in headers
+                and start_message["status"] not in {204, 304}
+            ):
+                body = compress_body(body, encoding, self.gzip_level, self.brotli_quality)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
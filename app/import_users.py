@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import IO, Any
+
+from auth import get_password_hash
+from database import dialect_insert, engine, get_db
+from fastapi import HTTPException
+from models import User
+from pydantic import ValidationError
+from schemas import UserCreate
+from sqlalchemy import select
+from utils import validate_password
+
+
+def read_records(stream: IO[str], fmt: str) -> Iterator[dict[str, Any] | None]:
+    """
+    Построчно читает пользователей из CSV (с заголовком name,email,password) или NDJSON
+
+    :param stream: текстовый поток
+    :param fmt: формат: "csv" или "ndjson"
+    :return: итератор словарей с полями пользователя; None вместо строки,
+        которая не разбирается как JSON (отклоняется при проверке)
+    """
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                yield None
+
+
+def validate_records(
+    records: Iterable[dict[str, Any] | None],
+) -> tuple[list[UserCreate], int]:
+    """
+    Проверяет записи теми же правилами, что и /register, и убирает повторы email.
+    Неразобранные строки (None) и не-объекты JSON не проходят проверку модели
+
+    :param records: записи пачки
+    :return: валидные пользователи и количество отклонённых записей
+    """
+    users: dict[str, UserCreate] = {}
+    rejected = 0
+    for record in records:
+        try:
+            user = UserCreate.model_validate(record)
+            validate_password(user.password)
+        except (ValidationError, HTTPException):
+            rejected += 1
+            continue
+        users.setdefault(user.email, user)
+    return list(users.values()), rejected
+
+
+def hash_passwords(passwords: list[str]) -> list[str]:
+    """
+    Хеширует пароли последовательно (выполняется в процессе пула)
+
+    :param passwords: список паролей
+    :return: список bcrypt-хешей в том же порядке
+    """
+    return [get_password_hash(password) for password in passwords]
+
+
+async def hash_in_pool(pool: ProcessPoolExecutor, passwords: list[str], workers: int) -> list[str]:
+    """
+    Делит пароли на части по числу процессов и хеширует их параллельно на всех ядрах
+
+    :param pool: пул процессов
+    :param passwords: список паролей
+    :param workers: число процессов в пуле
+    :return: список хешей в исходном порядке
+    """
+    loop = asyncio.get_running_loop()
+    size = max(1, -(-len(passwords) // workers))
+    chunks = [passwords[i : i + size] for i in range(0, len(passwords), size)]
+    results = await asyncio.gather(
+        *(loop.run_in_executor(pool, hash_passwords, chunk) for chunk in chunks)
+    )
+    return [hashed for chunk in results for hashed in chunk]
+
+
+async def import_users(
+    stream: IO[str], fmt: str, batch_size: int, workers: int
+) -> tuple[int, int, int]:
+    """
+    Импортирует пользователей пачками: проверка конфликтов email одним запросом,
+    параллельное хеширование паролей, вставка пачки одним запросом
+
+    :param stream: текстовый поток с пользователями
+    :param fmt: формат: "csv" или "ndjson"
+    :param batch_size: размер пачки
+    :param workers: число процессов для хеширования
+    :return: количество добавленных, уже существовавших и отклонённых записей
+    """
+    records = read_records(stream, fmt)
+    processed = inserted = skipped = rejected = 0
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while batch := list(islice(records, batch_size)):
+            users, batch_rejected = validate_records(batch)
+            async with get_db() as db:
+                emails = [user.email for user in users]
+                existing = set(
+                    (await db.execute(select(User.email).where(User.email.in_(emails)))).scalars()
+                )
+                new_users = [user for user in users if user.email not in existing]
+                hashes = await hash_in_pool(pool, [user.password for user in new_users], workers)
+                if new_users:
+                    result = await db.execute(
+                        dialect_insert(User)
+                        .on_conflict_do_nothing(index_elements=[User.email])
+                        .returning(User.id),
+                        [
+                            {"name": user.name, "email": user.email, "password_hash": hashed}
+                            for user, hashed in zip(new_users, hashes)
+                        ],
+                    )
+                    batch_inserted = len(result.all())
+                    await db.commit()
+                else:
+                    batch_inserted = 0
+
+            processed += len(batch)
+            inserted += batch_inserted
+            rejected += batch_rejected
+            skipped += len(users) - batch_inserted
+            rate = processed / (time.perf_counter() - started)
+            print(
+                f"обработано {processed}: добавлено {inserted}, уже были {skipped}, "
+                f"отклонено {rejected} ({rate:.0f} польз./с)",
+                file=sys.stderr,
+            )
+    return inserted, skipped, rejected
+
+
+def main() -> None:
+    """
+    Точка входа: python app/import_users.py users.csv [--format ndjson] [--batch-size 1000]
+    Путь "-" читает данные из stdin
+    """
+    parser = argparse.ArgumentParser(description="Массовый импорт пользователей")
+    parser.add_argument("path", help="CSV/NDJSON файл или - для stdin")
+    parser.add_argument("--format", choices=["csv", "ndjson"], default=None)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+
+    async def run(stream: IO[str]) -> None:
+        await import_users(stream, fmt, args.batch_size, args.workers)
+        await engine.dispose()
+
+    if args.path == "-":
+        asyncio.run(run(sys.stdin))
+        return
+    with open(args.path, encoding="utf-8", newline="") as stream:
+        asyncio.run(run(stream))
+
+
+if __name__ == "__main__":
+    main()
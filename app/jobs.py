@@ -0,0 +1,64 @@
+import logging
+
+from database import engine, get_db
+from retention import purge_expired_messages, purge_unsent_attachments
+from scheduler import Scheduler
+from settings import (ATTACHMENT_PURGE_INTERVAL, IDEMPOTENCY_PURGE_INTERVAL,
+                      RETENTION_CRON, SCHEDULER_JITTER_SECONDS,
+                      WS_REAP_INTERVAL)
+from ws_endpoints import reap_dead_connections
+from ws_queries import purge_idempotency_keys
+
+logger = logging.getLogger("uvicorn.error")
+
+
+async def purge_idempotency_keys_job() -> None:
+    """
+    Удаляет ключи идемпотентности старше окна хранения
+    """
+    async with get_db() as db:
+        deleted = await purge_idempotency_keys(db)
+    logger.info("Удалено ключей идемпотентности: %s", deleted)
+
+
+async def reap_dead_connections_job() -> None:
+    """
+    Чистит реестр WebSocket-соединений своего воркера
+    """
+    reaped = reap_dead_connections()
+    if reaped:
+        logger.info("Убрано закрытых WebSocket-соединений: %s", reaped)
+
+
+def build_scheduler() -> Scheduler:
+    """
+    Планировщик с задачами приложения. Задачи над общей БД выполняются одним
+    воркером на кластер, задачи над памятью процесса — каждым воркером
+
+    :return: планировщик (запускается в lifespan)
+    """
+    scheduler = Scheduler(engine)
+    if RETENTION_CRON:
+        scheduler.add_cron(
+            "retention",
+            purge_expired_messages,
+            RETENTION_CRON,
+            jitter=SCHEDULER_JITTER_SECONDS,
+            single_instance=True,
+        )
+    scheduler.add_interval(
+        "purge_idempotency_keys",
+        purge_idempotency_keys_job,
+        IDEMPOTENCY_PURGE_INTERVAL,
+        jitter=SCHEDULER_JITTER_SECONDS,
+        single_instance=True,
+    )
+    scheduler.add_interval(
+        "purge_unsent_attachments",
+        purge_unsent_attachments,
+        ATTACHMENT_PURGE_INTERVAL,
+        jitter=SCHEDULER_JITTER_SECONDS,
+        single_instance=True,
+    )
+    scheduler.add_interval("reap_dead_connections", reap_dead_connections_job, WS_REAP_INTERVAL)
+    return scheduler
@@ -1,16 +1,37 @@
+# ruff: noqa: E402
+import time
+
+# Начало импортов приложения по стенным часам, как и остальные этапы старта
+IMPORTS_STARTED = time.perf_counter()
+
 import os
 from contextlib import asynccontextmanager
 from pathlib import Path
 
 import uvicorn
-from database import engine
+from database import engine, read_engine
 from endpoints import router
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from http_compression import CompressionMiddleware
+from jobs import build_scheduler
 from models import Base
+from request_profiling import ProfilingMiddleware, profiling_enabled
+from settings import (HTTP_BROTLI_QUALITY, HTTP_COMPRESSION_MIN_SIZE,
+                      HTTP_GZIP_LEVEL, POOL_WARMUP, SCHEDULER_ENABLED,
+                      SCHEMA_MODE, SLOW_QUERY_MS, STARTUP_TARGET_MS,
+                      STATIC_CACHE_MAX_BYTES, STATIC_MAX_AGE,
+                      WS_PER_MESSAGE_DEFLATE)
+from slow_queries import HandlerContextMiddleware, install_slow_query_log
+from startup import (SCHEMA_MODES, StartupReport, check_schema_revision,
+                     warm_pool)
+from static_files import PrecompressedStaticFiles
+from tracing import close_exporter
 from ws_endpoints import ws_router
 
+# Длительность импортов модулей приложения (без запуска интерпретатора)
+IMPORTS_MS = (time.perf_counter() - IMPORTS_STARTED) * 1000
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 static_dir = os.path.join(BASE_DIR, "static")
 
@@ -28,14 +49,44 @@ async def create_tables():
 async def lifespan(app: FastAPI):
     """
     Контекст жизненного цикла приложения.
-    При старте вызывает создание таблиц, затем запускает приложение
+    При старте готовит схему согласно SCHEMA_MODE (create_all / check / skip),
+    прогревает пул соединений и пишет в лог разбивку времени старта.
+    Фоновые задачи (SCHEDULER_ENABLED) работают, пока работает приложение
     """
-    await create_tables()
-    yield
+    if SCHEMA_MODE not in SCHEMA_MODES:
+        raise RuntimeError(
+            f"Неизвестный SCHEMA_MODE={SCHEMA_MODE!r}, допустимо: {', '.join(SCHEMA_MODES)}"
+        )
+    report = StartupReport()
+    report.phases["imports"] = IMPORTS_MS
+    with report.phase("schema"):
+        if SCHEMA_MODE == "create_all":
+            await create_tables()
+        elif SCHEMA_MODE == "check":
+            await check_schema_revision(engine, Base.metadata.tables)
+    if POOL_WARMUP:
+        with report.phase("pool_warmup"):
+            await warm_pool(engine, POOL_WARMUP)
+    report.log(STARTUP_TARGET_MS)
+    scheduler = build_scheduler() if SCHEDULER_ENABLED else None
+    if scheduler is not None:
+        scheduler.start()
+    try:
+        yield
+    finally:
+        if scheduler is not None:
+            await scheduler.stop()
+        close_exporter()
 
 
 app = FastAPI(lifespan=lifespan)
-app.mount("/static", StaticFiles(directory=static_dir), name="static")
+app.mount(
+    "/static",
+    PrecompressedStaticFiles(
+        directory=static_dir, cache_max_bytes=STATIC_CACHE_MAX_BYTES, max_age=STATIC_MAX_AGE
+    ),
+    name="static",
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -44,9 +95,33 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(
+    CompressionMiddleware,
+    paths=["/history", "/get_chats"],
+    minimum_size=HTTP_COMPRESSION_MIN_SIZE,
+    gzip_level=HTTP_GZIP_LEVEL,
+    brotli_quality=HTTP_BROTLI_QUALITY,
+)
+
+# Диагностика подключается только при включении: без неё нет ни мидлвари, ни хуков
+if SLOW_QUERY_MS > 0:
+    for db_engine in {engine, read_engine}:
+        install_slow_query_log(db_engine, SLOW_QUERY_MS)
+    app.add_middleware(HandlerContextMiddleware)
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
 
 app.include_router(router)
 app.include_router(ws_router)
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    from ws_protocol import DeflateWebSocketProtocol
+
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        reload=True,
+        ws=DeflateWebSocketProtocol,
+        ws_per_message_deflate=WS_PER_MESSAGE_DEFLATE,
+    )
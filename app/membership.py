@@ -0,0 +1,61 @@
+from cache import LRUCache
+from models import Chat, group_members
+from settings import MEMBERSHIP_CACHE_SIZE, MEMBERSHIP_CACHE_TTL
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# (user_id, chat_id) -> True. Кэшируются только разрешения: отказ всегда
+# перепроверяется в БД, поэтому вступление в группу на другом воркере видно сразу,
+# а выход на другом воркере — не позже чем через MEMBERSHIP_CACHE_TTL
+membership_cache = LRUCache(maxsize=MEMBERSHIP_CACHE_SIZE, ttl=MEMBERSHIP_CACHE_TTL)
+
+
+async def is_chat_member_query(user_id: int, chat_id: int, db: AsyncSession) -> bool:
+    """
+    Проверяет в БД одним запросом, может ли пользователь участвовать в чате.
+    Личные чаты доступны всем, групповые — участникам группы (как в get_user_chats_query)
+
+    :param user_id: идентификатор пользователя
+    :param chat_id: идентификатор чата
+    :param db: сессия базы данных
+    :return: True, если пользователь имеет доступ к чату
+    """
+    is_member = (
+        select(group_members)
+        .where(and_(group_members.c.group_id == chat_id, group_members.c.user_id == user_id))
+        .exists()
+    )
+    row = (
+        await db.execute(select(Chat.type, is_member.label("is_member")).where(Chat.id == chat_id))
+    ).first()
+    if row is None:
+        return False
+    return row.type == "personal" or bool(row.is_member)
+
+
+async def is_chat_member(user_id: int, chat_id: int, db: AsyncSession) -> bool:
+    """
+    Проверяет доступ пользователя к чату, в типичном случае без обращения к БД
+
+    :param user_id: идентификатор пользователя
+    :param chat_id: идентификатор чата
+    :param db: сессия базы данных
+    :return: True, если пользователь имеет доступ к чату
+    """
+    key = (user_id, chat_id)
+    if key in membership_cache:
+        return True
+    allowed = await is_chat_member_query(user_id, chat_id, db)
+    if allowed:
+        membership_cache.set(key, True)
+    return allowed
+
+
+def invalidate_membership(user_id: int, chat_id: int) -> None:
+    """
+    Сбрасывает закэшированное членство (вызывается при вступлении и выходе из группы)
+
+    :param user_id: идентификатор пользователя
+    :param chat_id: идентификатор чата
+    """
+    membership_cache.discard((user_id, chat_id))
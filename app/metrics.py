@@ -0,0 +1,77 @@
+import math
+from bisect import bisect_left
+from collections.abc import Sequence
+
+# Границы корзин в секундах: от 0.5 мс до 10 с
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+registry: list["Histogram"] = []
+
+
+class Histogram:
+    """
+    Гистограмма длительностей в формате Prometheus (корзины, сумма, количество).
+    Значения хранятся в памяти процесса; при нескольких воркерах каждый отдаёт свои
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labelvalues -> (счётчики по корзинам + переполнение, [сумма, количество])
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+        registry.append(self)
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        """
+        Учитывает одно наблюдение
+
+        :param value: значение (секунды)
+        :param labelvalues: значения меток в порядке labelnames
+        """
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = ([0] * (len(self.buckets) + 1), [0.0, 0])
+        counts, totals = series
+        counts[bisect_left(self.buckets, value)] += 1
+        totals[0] += value
+        totals[1] += 1
+
+    def render(self) -> list[str]:
+        """
+        Строки гистограммы в текстовом формате Prometheus
+
+        :return: список строк
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for labelvalues, (counts, (total, count)) in sorted(self._series.items()):
+            labels = [f'{name}="{value}"' for name, value in zip(self.labelnames, labelvalues)]
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == math.inf else repr(bound)
+                bucket_labels = ",".join([*labels, f'le="{le}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            suffix = f"{{{','.join(labels)}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+def render_metrics() -> str:
+    """
+    Все зарегистрированные метрики процесса в текстовом формате Prometheus
+
+    :return: текст для эндпоинта /metrics
+    """
+    return "\n".join(line for histogram in registry for line in histogram.render()) + "\n"
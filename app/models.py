@@ -1,7 +1,8 @@
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import Column, DateTime, ForeignKey, Table, Text
+from sqlalchemy import (BigInteger, Column, DateTime, ForeignKey, Index,
+                        String, Table, Text, UniqueConstraint, event, update)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 
@@ -35,6 +36,10 @@ class Chat(Base):
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     name: Mapped[str] = mapped_column(nullable=False)
     type: Mapped[str] = mapped_column(nullable=False)  # personal / group
+    # Последний выданный порядковый номер сообщения в чате
+    last_seq: Mapped[int] = mapped_column(default=0, server_default="0", nullable=False)
+    # Срок хранения сообщений в днях: None — общий RETENTION_DAYS, 0 — бессрочно
+    retention_days: Mapped[Optional[int]] = mapped_column(nullable=True)
 
 
 class Group(Base):
@@ -57,28 +62,126 @@ group_members = Table(
 )
 
 
+class Attachment(Base):
+    """
+    Метаданные вложения. Содержимое хранится вне БД (storage_key), одинаковые
+    файлы разных загрузок ссылаются на один объект по sha256
+    """
+
+    __tablename__ = "attachments"
+    __table_args__ = {"extend_existing": True}
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    uploader_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
+    filename: Mapped[str] = mapped_column(nullable=False)
+    content_type: Mapped[str] = mapped_column(nullable=False)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    sha256: Mapped[str] = mapped_column(String(64), index=True, nullable=False)
+    storage_key: Mapped[str] = mapped_column(nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+
 class Message(Base):
     """Модель сообщения"""
 
     __tablename__ = "messages"
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        # Версия истории чата (max(id), count) считается только по индексу
+        Index("ix_messages_chat_id_id", "chat_id", "id"),
+        UniqueConstraint("chat_id", "seq", name="uq_messages_chat_id_seq"),
+        {"extend_existing": True},
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     chat_id: Mapped[int] = mapped_column(ForeignKey("chats.id"), nullable=False)
     sender_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
+    # Порядковый номер сообщения в чате без пропусков (1, 2, 3, ...)
+    seq: Mapped[int] = mapped_column(nullable=False)
     text: Mapped[str] = mapped_column(Text, nullable=False)
     timestamp: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), nullable=False
     )
     is_read: Mapped[bool] = mapped_column(default=False)
-    client_id: Mapped[Optional[str]] = mapped_column(unique=True, nullable=True)
+    client_id: Mapped[Optional[str]] = mapped_column(nullable=True)
+    attachment_id: Mapped[Optional[int]] = mapped_column(
+        ForeignKey("attachments.id"), nullable=True
+    )
 
     chat: Mapped["Chat"] = relationship()
     sender: Mapped["User"] = relationship(back_populates="sent_messages")
 
+    # id и timestamp возвращаются через RETURNING при вставке, без refresh
+    __mapper_args__ = {"eager_defaults": True}
+
+
+@event.listens_for(Message, "before_insert")
+def assign_message_seq(mapper, connection, target: Message) -> None:
+    """
+    Выдаёт сообщению следующий порядковый номер в чате.
+    UPDATE ... RETURNING блокирует строку чата до конца транзакции, поэтому
+    параллельные вставки в один чат получают номера строго по очереди,
+    а откат транзакции откатывает и счётчик — пропусков не бывает
+    """
+    if target.seq is None:
+        chats = Chat.__table__
+        target.seq = connection.execute(
+            update(chats)
+            .where(chats.c.id == target.chat_id)
+            .values(last_seq=chats.c.last_seq + 1)
+            .returning(chats.c.last_seq)
+        ).scalar_one()
+
+
+class IdempotencyKey(Base):
+    """
+    Ключ идемпотентности отправки: client_id уникален в пределах отправителя
+    и хранится ограниченное время (IDEMPOTENCY_WINDOW_SECONDS)
+    """
+
+    __tablename__ = "idempotency_keys"
+    __table_args__ = {"extend_existing": True}
+
+    sender_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    client_id: Mapped[str] = mapped_column(primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), index=True, nullable=False
+    )
+
 
 class MessageRead(Base):
     __tablename__ = "message_reads"
+    # Отметки удаляются вместе с сообщениями при очистке по сроку хранения
+    __table_args__ = (Index("ix_message_reads_message_id", "message_id"),)
+
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
     message_id: Mapped[int] = mapped_column(ForeignKey("messages.id"), primary_key=True)
     read_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
+
+
+class DeliveryCursor(Base):
+    """
+    Позиция доставки сообщений чата пользователю: всё с seq > delivered_seq
+    пользователь ещё не подтвердил и получит при следующем подключении
+    """
+
+    __tablename__ = "delivery_cursors"
+    __table_args__ = {"extend_existing": True}
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    chat_id: Mapped[int] = mapped_column(ForeignKey("chats.id"), primary_key=True)
+    delivered_seq: Mapped[int] = mapped_column(default=0, nullable=False)
+
+
+class JobRun(Base):
+    """
+    Последний запуск фоновой задачи, выполняемой одним воркером на кластер:
+    по нему остальные воркеры пропускают задачу, уже выполненную в этом периоде
+    """
+
+    __tablename__ = "job_runs"
+    __table_args__ = {"extend_existing": True}
+
+    name: Mapped[str] = mapped_column(primary_key=True)
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
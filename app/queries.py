@@ -1,15 +1,22 @@
+from pathlib import PurePath
 from typing import Any
 
 from auth import (authenticate_user, create_access_token, get_current_user,
                   get_password_hash)
-from database import get_db_session
+from database import get_db_session, mark_write
 from fastapi import (APIRouter, Depends, Form, HTTPException, Path, Query,
-                     status)
+                     Request, status)
 from fastapi.security import OAuth2PasswordRequestForm
-from models import Chat, Group, Message, User, group_members
-from schemas import ChatCreate, MessageWithSender, Token, UserRead
-from sqlalchemy import and_, select
+from membership import invalidate_membership, is_chat_member
+from models import (Attachment, Chat, DeliveryCursor, Group, Message, User,
+                    group_members)
+from schemas import AttachmentRead, ChatCreate, ChatType, Token, UserRead
+from settings import ATTACHMENT_MAX_BYTES
+from sqlalchemy import Select, and_, func, insert, select, union
 from sqlalchemy.ext.asyncio import AsyncSession
+from storage import AttachmentTooLarge, storage
+from user_names import remember_user_name
+from ws_queries import message_rows, messages_select
 
 router = APIRouter()
 
@@ -52,6 +59,16 @@ async def login_query(
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+async def update_user_name_query(name: str, db: AsyncSession, current_user: User) -> User:
+    """
+    Переименовывает текущего пользователя и обновляет кэш имён для истории.
+    """
+    current_user.name = name
+    await db.commit()
+    remember_user_name(current_user.id, name)
+    return current_user
+
+
 async def create_chat_query(
     chat_data: ChatCreate,
     db: AsyncSession = Depends(get_db_session),
@@ -60,48 +77,80 @@ async def create_chat_query(
     """
     Создаёт чат (личный или групповой) и возвращает словарь с chat_id и при необходимости group_id.
     """
-    new_chat = Chat(name=chat_data.name, type=chat_data.type)
-    db.add(new_chat)
-    await db.commit()
-    await db.refresh(new_chat)
-
-    response = {
-        "chat_id": new_chat.id,
-        "name": new_chat.name,
-        "type": new_chat.type,
-    }
-
-    if chat_data.type == "group":
-        new_group = Group(name=chat_data.name, creator_id=current_user.id)
-        db.add(new_group)
-        await db.commit()
-        await db.refresh(new_group)
+    return (await create_chats_batch_query([chat_data], db, current_user))[0]
+
+
+async def create_chats_batch_query(
+    chats_data: list[ChatCreate], db: AsyncSession, current_user: User
+) -> list[dict[str, Any]]:
+    """
+    Создаёт пачку чатов с группами и участниками в одной транзакции.
+    Группа создаётся с тем же id, что и чат (на этом основаны выборки чатов
+    пользователя и проверка членства), id возвращаются через RETURNING без refresh.
+    """
+    member_ids = {user_id for chat_data in chats_data for user_id in chat_data.member_ids}
+    if member_ids:
+        found = set((await db.execute(select(User.id).where(User.id.in_(member_ids)))).scalars())
+        if missing := sorted(member_ids - found):
+            raise HTTPException(status_code=400, detail=f"Пользователи не найдены: {missing}")
+
+    chats = (
         await db.execute(
-            group_members.insert().values(group_id=new_group.id, user_id=current_user.id)
+            insert(Chat).returning(Chat.id, Chat.name, Chat.type, sort_by_parameter_order=True),
+            [{"name": chat_data.name, "type": chat_data.type.value} for chat_data in chats_data],
         )
-        await db.commit()
-        response["group_id"] = new_group.id
+    ).all()
 
+    groups = []
+    members = []
+    response = []
+    for chat, chat_data in zip(chats, chats_data):
+        item = {"chat_id": chat.id, "name": chat.name, "type": chat.type}
+        if chat_data.type == ChatType.group:
+            groups.append({"id": chat.id, "name": chat_data.name, "creator_id": current_user.id})
+            for user_id in dict.fromkeys([current_user.id, *chat_data.member_ids]):
+                members.append({"group_id": chat.id, "user_id": user_id})
+            item["group_id"] = chat.id
+        response.append(item)
+
+    if groups:
+        await db.execute(insert(Group), groups)
+        await db.execute(group_members.insert(), members)
+    await db.commit()
+    mark_write(("chats", current_user.id), *(("chats", m["user_id"]) for m in members))
     return response
 
 
-async def get_user_chats_query(
-    db: AsyncSession = Depends(get_db_session), current_user: User = Depends(get_current_user)
-) -> list[dict[str, Any]]:
+def _user_chats_select(current_user: User, *columns: Any) -> Select:
     """
-    Возвращает список чатов, в которых участвует текущий пользователь.
+    Строит запрос по чатам, доступным пользователю, с заданными колонками.
     """
-    stmt = (
-        select(Chat)
+    return (
+        select(*columns)
         .select_from(Chat)
         .join(group_members, group_members.c.group_id == Chat.id, isouter=True)
         .where((Chat.type == "personal") | (group_members.c.user_id == current_user.id))
     )
 
-    result = await db.execute(stmt)
-    chats = result.scalars().all()
 
-    return [{"id": chat.id, "name": chat.name, "type": chat.type} for chat in chats]
+async def get_user_chats_version_query(db: AsyncSession, current_user: User) -> tuple[Any, ...]:
+    """
+    Возвращает версию списка чатов пользователя (max id, количество) без загрузки строк.
+    """
+    row = (
+        await db.execute(_user_chats_select(current_user, func.max(Chat.id), func.count(Chat.id)))
+    ).one()
+    return tuple(row)
+
+
+async def get_user_chats_query(
+    db: AsyncSession = Depends(get_db_session), current_user: User = Depends(get_current_user)
+) -> list[dict[str, Any]]:
+    """
+    Возвращает список чатов, в которых участвует текущий пользователь.
+    """
+    result = await db.execute(_user_chats_select(current_user, Chat.id, Chat.name, Chat.type))
+    return [dict(row) for row in result.mappings()]
 
 
 async def join_group_query(
@@ -127,45 +176,181 @@ async def join_group_query(
 
     await db.execute(group_members.insert().values(group_id=group_id, user_id=current_user.id))
     await db.commit()
+    invalidate_membership(current_user.id, group_id)
+    mark_write(("chats", current_user.id))
     return {"detail": f"Пользователь {current_user.id} присоединился к группе {group_id}"}
 
 
+async def leave_group_query(group_id: int, db: AsyncSession, current_user: User) -> dict:
+    """
+    Удаляет текущего пользователя из группы и сбрасывает кэш членства.
+    """
+    result = await db.execute(
+        group_members.delete().where(
+            and_(group_members.c.group_id == group_id, group_members.c.user_id == current_user.id)
+        )
+    )
+    await db.commit()
+    invalidate_membership(current_user.id, group_id)
+    mark_write(("chats", current_user.id))
+    if not result.rowcount:
+        raise HTTPException(status_code=404, detail="Пользователь не состоит в группе.")
+    return {"detail": f"Пользователь {current_user.id} покинул группу {group_id}"}
+
+
+def _history_page(
+    stmt: Select, chat_id: int, limit: int, offset: int, after_seq: int | None
+) -> Select:
+    """
+    Ограничивает запрос по сообщениям страницей истории чата.
+    """
+    stmt = stmt.where(Message.chat_id == chat_id).offset(offset).limit(limit)
+    if after_seq is not None:
+        stmt = stmt.where(Message.seq > after_seq)
+    return stmt
+
+
+async def get_chat_version_query(
+    chat_id: int,
+    db: AsyncSession,
+    limit: int = 50,
+    offset: int = 0,
+    after_seq: int | None = None,
+) -> tuple[Any, ...]:
+    """
+    Возвращает версию страницы истории: последний id сообщения и количество по индексу,
+    а также имена отправителей страницы из БД. Имена сразу кладутся в кэш, поэтому
+    тело ответа совпадает с версией на любом воркере, а переименование меняет ETag
+    только тех страниц, где есть сообщения переименованного пользователя.
+    """
+    last_id, count = (
+        await db.execute(
+            select(func.max(Message.id), func.count(Message.id)).where(Message.chat_id == chat_id)
+        )
+    ).one()
+    if not count:
+        return last_id, count, ()
+
+    page = _history_page(
+        select(Message.sender_id).order_by(Message.seq.asc()), chat_id, limit, offset, after_seq
+    ).subquery()
+    names = tuple(
+        await db.execute(
+            select(User.id, User.name)
+            .where(User.id.in_(select(page.c.sender_id)))
+            .order_by(User.id)
+        )
+    )
+    for user_id, name in names:
+        remember_user_name(user_id, name)
+    return last_id, count, names
+
+
 async def get_history_query(
     chat_id: int = Path(..., description="ID чата"),
     limit: int = Query(default=50, ge=1),
     offset: int = Query(default=0, ge=0),
     db: AsyncSession = Depends(get_db_session),
-) -> list[MessageWithSender]:
+    after_seq: int | None = None,
+) -> list[dict[str, Any]]:
     """
     Возвращает сообщения из чата с учётом limit/offset либо поднимает 404, если чата нет.
+    При after_seq возвращаются только сообщения с seq > after_seq (догрузка пропуска).
     """
     # Проверяем существование чата
     chat_obj = (await db.execute(select(Chat).where(Chat.id == chat_id))).scalar_one_or_none()
     if not chat_obj:
         raise HTTPException(status_code=404, detail="Чат не найден")
 
+    result = await db.execute(_history_page(messages_select(), chat_id, limit, offset, after_seq))
+    # Строки отдаются как есть: структура совпадает с MessageWithSender,
+    # повторная валидация и model_dump на горячем пути не нужны
+    return await message_rows(result, db)
+
+
+async def get_pending_query(db: AsyncSession, current_user: User) -> list[dict[str, Any]]:
+    """
+    Возвращает чаты с недоставленными пользователю сообщениями одним запросом
+    по позициям доставки (без обхода всех чатов).
+    Группы пользователя учитываются и без позиции доставки (сокет чата ещё
+    не открывался): отсутствующая позиция считается нулевой.
+    """
+    chat_ids = union(
+        select(group_members.c.group_id.label("chat_id"))
+        .where(group_members.c.user_id == current_user.id),
+        select(DeliveryCursor.chat_id).where(DeliveryCursor.user_id == current_user.id),
+    ).subquery()
+    delivered_seq = func.coalesce(DeliveryCursor.delivered_seq, 0)
     result = await db.execute(
-        select(Message, User.name)
-        .join(User, User.id == Message.sender_id)
-        .where(Message.chat_id == chat_id)
-        .order_by(Message.timestamp.asc())
-        .offset(offset)
-        .limit(limit)
-    )
-    rows = result.all()
-
-    return [
-        MessageWithSender(
-            id=msg.id,
-            chat_id=msg.chat_id,
-            sender_id=msg.sender_id,
-            sender_name=user_name,
-            text=msg.text,
-            timestamp=msg.timestamp,
-            is_read=msg.is_read,
+        select(
+            chat_ids.c.chat_id,
+            delivered_seq.label("delivered_seq"),
+            Chat.last_seq,
+            (Chat.last_seq - delivered_seq).label("pending"),
         )
-        for msg, user_name in rows
-    ]
+        .join(Chat, Chat.id == chat_ids.c.chat_id)
+        .outerjoin(
+            DeliveryCursor,
+            and_(
+                DeliveryCursor.chat_id == chat_ids.c.chat_id,
+                DeliveryCursor.user_id == current_user.id,
+            ),
+        )
+        .where(Chat.last_seq > delivered_seq)
+    )
+    return [dict(row) for row in result.mappings()]
+
+
+async def upload_attachment_query(
+    request: Request, filename: str, db: AsyncSession, current_user: User
+) -> AttachmentRead:
+    """
+    Потоково сохраняет тело запроса в хранилище (с лимитом размера и подсчётом sha256)
+    и создаёт запись вложения. Повторная загрузка того же содержимого не занимает место.
+    """
+    content_length = request.headers.get("content-length", "")
+    too_large = HTTPException(
+        status_code=413, detail=f"Файл больше допустимого размера ({ATTACHMENT_MAX_BYTES} байт)"
+    )
+    if content_length.isdigit() and int(content_length) > ATTACHMENT_MAX_BYTES:
+        raise too_large
+    try:
+        key, sha256, size = await storage.save_stream(request.stream(), ATTACHMENT_MAX_BYTES)
+    except AttachmentTooLarge:
+        raise too_large
+
+    attachment = Attachment(
+        uploader_id=current_user.id,
+        filename=PurePath(filename).name[:255] or "file",
+        content_type=request.headers.get("content-type") or "application/octet-stream",
+        size=size,
+        sha256=sha256,
+        storage_key=key,
+    )
+    db.add(attachment)
+    await db.commit()
+    return AttachmentRead.model_validate(attachment)
+
+
+async def get_attachment_query(
+    attachment_id: int, db: AsyncSession, current_user: User
+) -> Attachment:
+    """
+    Возвращает вложение, если пользователь его загрузил или состоит в чате,
+    где оно было отправлено, иначе поднимает 404.
+    """
+    attachment = await db.get(Attachment, attachment_id)
+    if attachment is None:
+        raise HTTPException(status_code=404, detail="Вложение не найдено")
+    if attachment.uploader_id == current_user.id:
+        return attachment
+    chat_ids = await db.execute(
+        select(Message.chat_id).where(Message.attachment_id == attachment_id).distinct()
+    )
+    for chat_id in chat_ids.scalars():
+        if await is_chat_member(current_user.id, chat_id, db):
+            return attachment
+    raise HTTPException(status_code=404, detail="Вложение не найдено")
 
 
 async def create_seed_data_query(db: AsyncSession) -> None:
@@ -0,0 +1,68 @@
+from typing import Any
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from ws_queries import count_message_reads
+
+# chat_id -> {reader_id: наибольший прочитанный message_id} за текущее окно.
+# Чат присутствует здесь, пока для него запланирована отправка
+pending_reads: dict[int, dict[int, int]] = {}
+
+
+def record_read(chat_id: int, reader_id: int, message_id: int) -> bool:
+    """
+    Добавляет отметку прочтения в окно чата: от одного читателя остаётся
+    только наибольший message_id («прочитано до»)
+
+    :param chat_id: идентификатор чата
+    :param reader_id: идентификатор прочитавшего
+    :param message_id: идентификатор прочитанного сообщения
+    :return: True, если окно чата только что открыто и нужно запланировать отправку
+    """
+    readers = pending_reads.get(chat_id)
+    opened = readers is None
+    if opened:
+        readers = pending_reads[chat_id] = {}
+    if message_id > readers.get(reader_id, 0):
+        readers[reader_id] = message_id
+    return opened
+
+
+def take_reads(chat_id: int) -> dict[int, int]:
+    """
+    Забирает накопленные отметки чата и закрывает окно
+
+    :param chat_id: идентификатор чата
+    :return: словарь reader_id -> наибольший прочитанный message_id
+    """
+    return pending_reads.pop(chat_id, {})
+
+
+async def build_read_frames(
+    readers: dict[int, int], aggregate: bool, db: AsyncSession
+) -> list[dict[str, Any]]:
+    """
+    Кадры рассылки для отметок одного окна.
+    Обычный чат: по кадру {"type": "read_up_to", "reader_id", "message_id"} на читателя.
+    Большой чат: один кадр {"type": "read_counts", "messages": [{"message_id", "readers"}]}
+    с числом прочитавших каждое из сообщений, до которых дочитали в этом окне
+
+    :param readers: словарь reader_id -> наибольший прочитанный message_id
+    :param aggregate: отправлять счётчики вместо кадров по читателям
+    :param db: сессия базы данных (нужна только для счётчиков)
+    :return: список кадров
+    """
+    if not readers:
+        return []
+    if not aggregate:
+        return [
+            {"type": "read_up_to", "reader_id": reader_id, "message_id": message_id}
+            for reader_id, message_id in readers.items()
+        ]
+    counts = await count_message_reads(sorted(set(readers.values())), db)
+    return [{
+        "type": "read_counts",
+        "messages": [
+            {"message_id": message_id, "readers": count}
+            for message_id, count in counts.items()
+        ],
+    }]
@@ -0,0 +1,144 @@
+import cProfile
+import hmac
+import logging
+import random
+import re
+import time
+from collections.abc import AsyncIterator
+from contextlib import (AbstractAsyncContextManager, asynccontextmanager,
+                        nullcontext)
+from pathlib import Path
+
+import anyio
+from settings import (PROFILE_DIR, PROFILE_MAX_FILES, PROFILE_SAMPLE_RATE,
+                      PROFILE_TOKEN)
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+except ImportError:  # pyinstrument — необязательная зависимость, иначе cProfile
+    Profiler = None
+
+logger = logging.getLogger("uvicorn.error")
+
+# Заголовок запроса (или рукопожатия WebSocket) со значением PROFILE_TOKEN
+PROFILE_HEADER = "x-profile"
+
+_NO_PROFILE = nullcontext()
+_active = False
+
+
+def profiling_enabled() -> bool:
+    """
+    Включено ли профилирование хотя бы одним способом (токен или выборка)
+
+    :return: True, если профилирование может сработать
+    """
+    return PROFILE_TOKEN is not None or PROFILE_SAMPLE_RATE > 0
+
+
+def should_profile(header_value: str | None) -> bool:
+    """
+    Решает, профилировать ли запрос: по заголовку с токеном или по доле PROFILE_SAMPLE_RATE
+
+    :param header_value: значение заголовка X-Profile
+    :return: True, если запрос нужно профилировать
+    """
+    if PROFILE_TOKEN is not None and header_value is not None:
+        if hmac.compare_digest(header_value, PROFILE_TOKEN):
+            return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _save_profile(profiler: object, name: str, duration_ms: float) -> Path:
+    """
+    Сохраняет профиль на диск и удаляет самые старые файлы сверх PROFILE_MAX_FILES.
+    pyinstrument пишет формат speedscope, cProfile — .prof (flameprof, snakeviz)
+
+    :param profiler: остановленный профайлер
+    :param name: название обработчика
+    :param duration_ms: длительность обработки
+    :return: путь к сохранённому файлу
+    """
+    directory = Path(PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_")
+    stem = f"{time.time_ns() // 1_000_000}-{slug}-{duration_ms:.0f}ms"
+    if isinstance(profiler, cProfile.Profile):
+        path = directory / f"{stem}.prof"
+        profiler.dump_stats(path)
+    else:
+        path = directory / f"{stem}.speedscope.json"
+        path.write_text(profiler.output(SpeedscopeRenderer()), encoding="utf-8")
+
+    files = sorted(directory.iterdir(), key=lambda item: item.stat().st_mtime)
+    for old in files[: max(0, len(files) - PROFILE_MAX_FILES)]:
+        old.unlink(missing_ok=True)
+    return path
+
+
+@asynccontextmanager
+async def profile(name: str) -> AsyncIterator[None]:
+    """
+    Профилирует блок и сохраняет результат в PROFILE_DIR.
+    В процессе одновременно работает один профайлер: пока он занят, блок выполняется как есть.
+    cProfile (без pyinstrument) видит и другие задачи event loop, работавшие в это время
+
+    :param name: название обработчика (попадает в имя файла)
+    """
+    global _active
+    if _active:
+        yield
+        return
+    _active = True
+    profiler = Profiler(async_mode="enabled") if Profiler is not None else cProfile.Profile()
+    started = time.perf_counter()
+    try:
+        profiler.start() if Profiler is not None else profiler.enable()
+    except ValueError:
+        # cProfile уже занят другим инструментом (sys.monitoring)
+        _active = False
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.stop() if Profiler is not None else profiler.disable()
+        _active = False
+        duration_ms = (time.perf_counter() - started) * 1000
+        path = await anyio.to_thread.run_sync(_save_profile, profiler, name, duration_ms)
+        logger.info("Профиль %s (%.0fms): %s", name, duration_ms, path)
+
+
+def maybe_profile(name: str, header_value: str | None = None) -> AbstractAsyncContextManager:
+    """
+    Возвращает профилирующий контекст, если запрос выбран, иначе пустой.
+    При выключенном профилировании стоит одну проверку
+
+    :param name: название обработчика
+    :param header_value: значение заголовка X-Profile
+    :return: асинхронный контекстный менеджер
+    """
+    if profiling_enabled() and should_profile(header_value):
+        return profile(name)
+    return _NO_PROFILE
+
+
+class ProfilingMiddleware:
+    """
+    ASGI-мидлварь, профилирующая выбранные HTTP-запросы.
+    Подключается только при включённом профилировании
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header_value = Headers(scope=scope).get(PROFILE_HEADER)
+        async with maybe_profile(f"{scope['method']} {scope['path']}", header_value):
+            await self.app(scope, receive, send)
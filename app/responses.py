@@ -0,0 +1,34 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Сериализует данные в JSON через orjson (datetime кодируется в ISO 8601)
+
+    :param content: данные для сериализации (dict, list, строки БД)
+    :return: JSON в виде байтов
+    """
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def dumps_text(content: Any) -> str:
+    """
+    Сериализует данные в JSON-строку для отправки текстовым WebSocket-кадром
+
+    :param content: данные для сериализации
+    :return: JSON в виде строки
+    """
+    return dumps(content).decode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON-ответ без повторной валидации через response_model.
+    Эндпоинт передаёт готовые словари строк БД, которые сразу кодируются в байты
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
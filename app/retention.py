@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from database import engine, get_db
+from models import Attachment, Chat, Message, MessageRead
+from settings import (ATTACHMENT_ORPHAN_HOURS, RETENTION_BATCH_SIZE,
+                      RETENTION_DAYS, RETENTION_PAUSE_SECONDS)
+from sqlalchemy import delete, exists, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from storage import storage
+
+logger = logging.getLogger("uvicorn.error")
+
+# Как часто писать прогресс в лог, секунды
+PROGRESS_INTERVAL = 5.0
+
+
+@dataclass
+class RetentionStats:
+    """
+    Итоги прохода очистки
+    """
+
+    chats: int = 0
+    messages: int = 0
+    reads: int = 0
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def rate(self) -> float:
+        """
+        Скорость удаления (сообщения и отметки прочтения), строк в секунду
+        """
+        elapsed = time.perf_counter() - self.started
+        return (self.messages + self.reads) / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"чатов {self.chats}, удалено сообщений {self.messages}, "
+            f"отметок прочтения {self.reads} ({self.rate:.0f} строк/с)"
+        )
+
+
+async def delete_batch(
+    db: AsyncSession, chat_id: int, after_id: int, cutoff: datetime, limit: int
+) -> tuple[list[int], int, bool]:
+    """
+    Удаляет очередную пачку устаревших сообщений чата вместе с их отметками прочтения.
+    Пачка выбирается по индексу (chat_id, id) после after_id; id и время сообщений
+    растут вместе, поэтому первое свежее сообщение означает конец устаревших
+
+    :param db: сессия базы данных
+    :param chat_id: идентификатор чата
+    :param after_id: id последнего просмотренного сообщения
+    :param cutoff: сообщения старше этого момента удаляются
+    :param limit: размер пачки
+    :return: id удалённых сообщений, число удалённых отметок прочтения
+        и признак, что устаревших сообщений больше нет
+    """
+    rows = (
+        await db.execute(
+            select(Message.id, Message.timestamp < cutoff)
+            .where(Message.chat_id == chat_id, Message.id > after_id)
+            .order_by(Message.id)
+            .limit(limit)
+        )
+    ).all()
+    ids = []
+    reads = 0
+    for message_id, expired in rows:
+        if not expired:
+            break
+        ids.append(message_id)
+    if ids:
+        result = await db.execute(delete(MessageRead).where(MessageRead.message_id.in_(ids)))
+        reads = result.rowcount
+        await db.execute(delete(Message).where(Message.id.in_(ids)))
+        # Короткая транзакция на пачку: блокировки снимаются, соединение возвращается в пул
+        await db.commit()
+    return ids, reads, len(ids) < limit
+
+
+async def purge_chat(
+    db: AsyncSession,
+    chat_id: int,
+    cutoff: datetime,
+    stats: RetentionStats,
+    batch_size: int,
+    pause: float,
+) -> None:
+    """
+    Удаляет устаревшие сообщения одного чата пачками с паузами между ними
+
+    :param db: сессия базы данных
+    :param chat_id: идентификатор чата
+    :param cutoff: сообщения старше этого момента удаляются
+    :param stats: накапливаемые итоги прохода
+    :param batch_size: размер пачки
+    :param pause: пауза между пачками, секунды
+    """
+    after_id = 0
+    while True:
+        ids, reads, done = await delete_batch(db, chat_id, after_id, cutoff, batch_size)
+        stats.reads += reads
+        if ids:
+            stats.messages += len(ids)
+            after_id = ids[-1]
+        if done:
+            return
+        await asyncio.sleep(pause)
+
+
+async def purge_expired_messages(
+    default_days: int = RETENTION_DAYS,
+    batch_size: int = RETENTION_BATCH_SIZE,
+    pause: float = RETENTION_PAUSE_SECONDS,
+) -> RetentionStats:
+    """
+    Применяет политику хранения ко всем чатам: срок чата (chats.retention_days)
+    или общий default_days. Чаты перебираются по id пачками, сообщения удаляются
+    небольшими пачками в отдельных транзакциях, чтобы не мешать живым запросам
+
+    :param default_days: общий срок хранения в днях (0 — бессрочно)
+    :param batch_size: размер пачки
+    :param pause: пауза между пачками, секунды
+    :return: итоги прохода
+    """
+    stats = RetentionStats()
+    now = datetime.now(timezone.utc)
+    last_report = stats.started
+    after_chat_id = 0
+
+    async with get_db() as db:
+        while True:
+            chats = (
+                await db.execute(
+                    select(Chat.id, Chat.retention_days)
+                    .where(Chat.id > after_chat_id)
+                    .order_by(Chat.id)
+                    .limit(batch_size)
+                )
+            ).all()
+            await db.commit()
+            if not chats:
+                break
+            for chat_id, chat_days in chats:
+                days = default_days if chat_days is None else chat_days
+                if days <= 0:
+                    continue
+                messages_before = stats.messages
+                await purge_chat(db, chat_id, now - timedelta(days=days), stats, batch_size, pause)
+                if stats.messages > messages_before:
+                    stats.chats += 1
+                if time.perf_counter() - last_report >= PROGRESS_INTERVAL:
+                    last_report = time.perf_counter()
+                    logger.info("Очистка сообщений: %s", stats)
+            after_chat_id = chats[-1][0]
+
+    logger.info("Очистка сообщений завершена: %s", stats)
+    return stats
+
+
+async def purge_unsent_attachments(
+    max_age_hours: float = ATTACHMENT_ORPHAN_HOURS, batch_size: int = RETENTION_BATCH_SIZE
+) -> tuple[int, int]:
+    """
+    Удаляет вложения старше max_age_hours, на которые не ссылается ни одно сообщение:
+    загруженные, но не отправленные, и освободившиеся после очистки сообщений.
+    Файл удаляется, только когда на его содержимое не осталось записей
+    (одинаковые загрузки делят один файл) и он не обновлялся после cutoff
+
+    :param max_age_hours: возраст вложения, после которого оно удаляется
+    :param batch_size: размер пачки
+    :return: количество удалённых записей и файлов
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=max_age_hours)
+    unsent = ~exists().where(Message.attachment_id == Attachment.id)
+    deleted_rows = deleted_files = 0
+
+    async with get_db() as db:
+        while True:
+            rows = (
+                await db.execute(
+                    select(Attachment.id, Attachment.storage_key)
+                    .where(Attachment.created_at < cutoff, unsent)
+                    .order_by(Attachment.id)
+                    .limit(batch_size)
+                )
+            ).all()
+            if not rows:
+                break
+            await db.execute(delete(Attachment).where(Attachment.id.in_([row.id for row in rows])))
+            await db.commit()
+            keys = {row.storage_key for row in rows}
+            in_use = set(
+                (
+                    await db.execute(
+                        select(Attachment.storage_key)
+                        .where(Attachment.storage_key.in_(keys))
+                        .distinct()
+                    )
+                ).scalars()
+            )
+            await db.commit()
+            for key in keys - in_use:
+                deleted_files += await storage.delete(key, cutoff.timestamp())
+            deleted_rows += len(rows)
+            if len(rows) < batch_size:
+                break
+
+    logger.info("Удалено неотправленных вложений: %s, файлов: %s", deleted_rows, deleted_files)
+    return deleted_rows, deleted_files
+
+
+def main() -> None:
+    """
+    Точка входа: python app/retention.py [--days 90] [--batch-size 500] [--pause 0.05]
+    """
+    parser = argparse.ArgumentParser(description="Удаление сообщений старше срока хранения")
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS, help="общий срок, дни")
+    parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=RETENTION_PAUSE_SECONDS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    async def run() -> None:
+        await purge_expired_messages(args.days, args.batch_size, args.pause)
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+import asyncio
+import hashlib
+import logging
+import random
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager, nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from database import dialect_insert, get_db
+from metrics import Histogram
+from models import JobRun
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger("uvicorn.error")
+
+job_duration_seconds = Histogram(
+    "scheduler_job_duration_seconds",
+    "Длительность запусков фоновых задач",
+    ("job", "status"),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600),
+)
+
+# Границы полей cron: минута, час, день месяца, месяц, день недели (0 — воскресенье)
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+
+def parse_cron_field(expr: str, low: int, high: int) -> frozenset[int]:
+    """
+    Разбирает поле cron: "*", "*/15", "5", "1-5", "0-30/10", "1,15"
+
+    :param expr: текст поля
+    :param low: минимальное значение
+    :param high: максимальное значение
+    :return: множество допустимых значений
+    """
+    values = set()
+    for part in expr.split(","):
+        range_expr, _, step_expr = part.partition("/")
+        step = int(step_expr) if step_expr else 1
+        if range_expr == "*":
+            start, end = low, high
+        elif "-" in range_expr:
+            start, end = map(int, range_expr.split("-"))
+        else:
+            start = int(range_expr)
+            end = high if step_expr else start
+        if not (low <= start <= end <= high) or step < 1:
+            raise ValueError(f"Недопустимое поле cron: {expr!r}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronSchedule:
+    """
+    Расписание в формате cron из пяти полей ("30 3 * * *" — каждый день в 03:30).
+    Время — локальное время процесса, точность — минута
+    """
+
+    def __init__(self, expr: str) -> None:
+        fields = expr.split()
+        if len(fields) != len(CRON_FIELDS):
+            raise ValueError(f"Ожидается 5 полей cron: {expr!r}")
+        self.expr = expr
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            parse_cron_field(text, low, high) for text, (low, high) in zip(fields, CRON_FIELDS)
+        )
+        # Как в cron: если ограничены оба поля дня, подходит любой из них
+        self.any_day = fields[2] == "*" or fields[4] == "*"
+
+    def day_matches(self, moment: datetime) -> bool:
+        """
+        Подходит ли день по полям дня месяца и дня недели
+
+        :param moment: момент времени
+        :return: True, если день подходит
+        """
+        in_days = moment.day in self.days
+        in_weekdays = (moment.weekday() + 1) % 7 in self.weekdays
+        return in_days and in_weekdays if self.any_day else in_days or in_weekdays
+
+    def next_after(self, moment: datetime) -> datetime:
+        """
+        Ближайший момент запуска строго после moment
+
+        :param moment: момент отсчёта
+        :return: время следующего запуска
+        """
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Неподходящие месяцы, дни и часы пропускаются целиком; хватает пяти лет на 29 февраля
+        limit = candidate + timedelta(days=5 * 366)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                candidate = (candidate.replace(day=1) + timedelta(days=32)).replace(
+                    day=1, hour=0, minute=0
+                )
+            elif not self.day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Расписание {self.expr!r} никогда не срабатывает")
+
+
+@dataclass
+class Job:
+    """
+    Фоновая задача: по интервалу (секунды) или по cron-расписанию.
+    jitter — случайная добавка к ожиданию, чтобы воркеры и узлы не запускались разом;
+    single_instance — задача выполняется одним воркером на кластер: запуски не
+    перекрываются (advisory lock) и происходят не чаще раза за период (JobRun)
+    """
+
+    name: str
+    func: Callable[[], Awaitable[object]]
+    interval: float | None = None
+    cron: CronSchedule | None = None
+    jitter: float = 0.0
+    single_instance: bool = False
+    lock_key: int = field(init=False)
+    # Момент срабатывания cron, к которому относится ближайший запуск (UTC)
+    due: datetime | None = field(default=None, init=False)
+
+    def __post_init__(self) -> None:
+        digest = hashlib.sha256(self.name.encode("utf-8")).digest()
+        self.lock_key = int.from_bytes(digest[:8], "big", signed=True)
+
+    def next_delay(self) -> float:
+        """
+        Сколько ждать до следующего запуска
+
+        :return: задержка в секундах
+        """
+        if self.cron is not None:
+            now = datetime.now()
+            due = self.cron.next_after(now)
+            self.due = due.astimezone(timezone.utc)
+            delay = (due - now).total_seconds()
+        else:
+            delay = self.interval
+        return delay + random.uniform(0, self.jitter)
+
+    def period_start(self, now: datetime) -> datetime:
+        """
+        Начало текущего периода: запуск задачи после этого момента (любым воркером)
+        означает, что в этом периоде она уже выполнена
+
+        :param now: текущий момент (UTC)
+        :return: начало периода (UTC)
+        """
+        if self.cron is not None:
+            # Запуск вне расписания (без next_delay) ничем не ограничен
+            return self.due or now
+        return now - timedelta(seconds=self.interval)
+
+
+async def claim_run(job: Job) -> bool:
+    """
+    Отмечает запуск задачи в БД, если в текущем периоде её ещё не запускали.
+    Отметка — один атомарный upsert, поэтому из одновременных попыток
+    разных воркеров проходит ровно одна (и без advisory-блокировки)
+
+    :param job: задача
+    :return: True, если этот воркер должен выполнить задачу
+    """
+    now = datetime.now(timezone.utc)
+    async with get_db() as db:
+        claimed = await db.execute(
+            dialect_insert(JobRun)
+            .values(name=job.name, started_at=now)
+            .on_conflict_do_update(
+                index_elements=[JobRun.name],
+                set_={"started_at": now},
+                where=JobRun.started_at <= job.period_start(now),
+            )
+            .returning(JobRun.name)
+        )
+        row = claimed.first()
+        await db.commit()
+    return row is not None
+
+
+@asynccontextmanager
+async def advisory_lock(engine: AsyncEngine, key: int) -> AsyncIterator[bool]:
+    """
+    Неблокирующая сессионная advisory-блокировка Postgres на время задачи.
+    На других СУБД (SQLite в разработке) блокировка не нужна и считается взятой
+
+    :param engine: асинхронный движок SQLAlchemy
+    :param key: ключ блокировки
+    :return: True, если блокировка получена
+    """
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+    async with engine.connect() as conn:
+        acquired = (await conn.execute(select(func.pg_try_advisory_lock(key)))).scalar()
+        # Блокировка сессионная: транзакцию можно закрыть, не держа её открытой всю задачу
+        await conn.commit()
+        try:
+            yield bool(acquired)
+        finally:
+            if acquired:
+                try:
+                    await conn.execute(select(func.pg_advisory_unlock(key)))
+                    await conn.commit()
+                except BaseException:
+                    # Соединение с невыясненной блокировкой нельзя возвращать в пул
+                    await conn.invalidate()
+                    raise
+
+
+class Scheduler:
+    """
+    Лёгкий планировщик фоновых задач внутри процесса приложения:
+    у каждой задачи свой цикл asyncio, запуски одной задачи не перекрываются
+    """
+
+    def __init__(self, engine: AsyncEngine) -> None:
+        self.engine = engine
+        self.jobs: list[Job] = []
+        self._tasks: list[asyncio.Task] = []
+
+    def add_interval(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[object]],
+        seconds: float,
+        jitter: float = 0.0,
+        single_instance: bool = False,
+    ) -> Job:
+        """
+        Добавляет задачу, выполняемую каждые seconds секунд
+
+        :param name: имя задачи (метка в метриках и ключ блокировки)
+        :param func: асинхронная функция без аргументов
+        :param seconds: интервал между запусками
+        :param jitter: случайная добавка к интервалу, секунды
+        :param single_instance: выполнять одним воркером на кластер
+        :return: задача
+        """
+        job = Job(name, func, interval=seconds, jitter=jitter, single_instance=single_instance)
+        self.jobs.append(job)
+        return job
+
+    def add_cron(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[object]],
+        expr: str,
+        jitter: float = 0.0,
+        single_instance: bool = False,
+    ) -> Job:
+        """
+        Добавляет задачу по cron-расписанию
+
+        :param name: имя задачи (метка в метриках и ключ блокировки)
+        :param func: асинхронная функция без аргументов
+        :param expr: выражение cron из пяти полей
+        :param jitter: случайная задержка запуска, секунды
+        :param single_instance: выполнять одним воркером на кластер
+        :return: задача
+        """
+        job = Job(
+            name, func, cron=CronSchedule(expr), jitter=jitter, single_instance=single_instance
+        )
+        self.jobs.append(job)
+        return job
+
+    async def run_job(self, job: Job) -> None:
+        """
+        Выполняет задачу один раз: с блокировкой, замером длительности и логом ошибок.
+        Ошибки блокировки и отметки запуска (например, недоступна БД) тоже только
+        логируются: цикл задачи продолжается и повторит попытку в следующем периоде
+
+        :param job: задача
+        """
+        try:
+            async with (
+                advisory_lock(self.engine, job.lock_key)
+                if job.single_instance
+                else nullcontext(True)
+            ) as acquired:
+                if not acquired:
+                    logger.debug("Задача %s выполняется другим воркером", job.name)
+                    return
+                if job.single_instance and not await claim_run(job):
+                    logger.debug("Задача %s уже выполнена в этом периоде", job.name)
+                    return
+                await self._execute(job)
+        except Exception:
+            logger.exception("Не удалось запустить фоновую задачу %s", job.name)
+
+    async def _execute(self, job: Job) -> None:
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            await job.func()
+        except Exception:
+            status = "error"
+            logger.exception("Ошибка фоновой задачи %s", job.name)
+        finally:
+            job_duration_seconds.observe(time.perf_counter() - started, job.name, status)
+
+    async def _loop(self, job: Job) -> None:
+        while True:
+            await asyncio.sleep(job.next_delay())
+            await self.run_job(job)
+
+    def start(self) -> None:
+        """
+        Запускает циклы всех задач (вызывается в lifespan при старте)
+        """
+        self._tasks = [
+            asyncio.create_task(self._loop(job), name=f"job:{job.name}") for job in self.jobs
+        ]
+
+    async def stop(self) -> None:
+        """
+        Останавливает задачи (в lifespan при остановке); выполняемая задача отменяется,
+        её транзакция откатывается, а advisory-блокировка снимается с соединением
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
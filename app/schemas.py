@@ -2,7 +2,7 @@ from datetime import datetime
 from enum import Enum
 from typing import Optional
 
-from pydantic import BaseModel, ConfigDict, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 
 
 class ChatType(str, Enum):
@@ -28,11 +28,24 @@ class UserRead(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class UserUpdate(BaseModel):
+    """Изменяемые данные пользователя."""
+
+    name: str = Field(min_length=1, max_length=100)
+
+
 class ChatCreate(BaseModel):
     """Данные для создания чата (личного или группового)."""
 
     name: str
     type: ChatType
+    member_ids: list[int] = []
+
+
+class ChatBatchCreate(BaseModel):
+    """Пачка чатов для массового создания."""
+
+    chats: list[ChatCreate] = Field(min_length=1, max_length=1000)
 
 
 class ChatRead(BaseModel):
@@ -57,16 +70,29 @@ class MessageBase(BaseModel):
     text: str
 
 
+class AttachmentRead(BaseModel):
+    """Метаданные вложения, которые передаются вместе с сообщением."""
+
+    id: int
+    filename: str
+    content_type: str
+    size: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+
 class MessageWithSender(BaseModel):
     """Сообщение вместе с информацией об отправителе."""
 
     id: int
     chat_id: int
+    seq: int
     sender_id: int
     sender_name: str
     text: str
     timestamp: datetime
     is_read: bool
+    attachment: Optional[AttachmentRead] = None
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -0,0 +1,127 @@
+import logging
+import multiprocessing
+import signal
+import socket
+import sys
+import time
+from multiprocessing.process import BaseProcess
+from types import FrameType
+
+from settings import (SERVER_BACKLOG, SERVER_HOST, SERVER_HTTP,
+                      SERVER_KEEP_ALIVE, SERVER_LOOP, SERVER_PORT,
+                      SERVER_WORKERS, WS_DRAIN_SECONDS, WS_PER_MESSAGE_DEFLATE)
+from uvicorn import Config, Server
+from ws_protocol import DeflateWebSocketProtocol
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class DrainingServer(Server):
+    """
+    Сервер uvicorn, который при остановке (SIGTERM) сначала перестаёт принимать
+    соединения и постепенно закрывает WebSocket-соединения кодом 1012
+    («переподключитесь к другому узлу»), и только потом выполняет штатную остановку.
+    Без этого uvicorn обрывает все сокеты одновременно
+    """
+
+    async def shutdown(self, sockets: list | None = None) -> None:
+        # Импорт здесь: модуль приложения загружается uvicorn уже в процессе воркера
+        from ws_endpoints import drain_connections
+
+        for server in self.servers:
+            server.close()
+        await drain_connections(WS_DRAIN_SECONDS)
+        await super().shutdown(sockets)
+
+
+def build_config() -> Config:
+    """
+    Собирает конфигурацию uvicorn для продакшен-запуска из настроек
+
+    :return: объект конфигурации uvicorn
+    """
+    return Config(
+        "main:app",
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        loop=SERVER_LOOP,
+        http=SERVER_HTTP,
+        ws=DeflateWebSocketProtocol,
+        ws_per_message_deflate=WS_PER_MESSAGE_DEFLATE,
+        backlog=SERVER_BACKLOG,
+        timeout_keep_alive=SERVER_KEEP_ALIVE,
+        timeout_graceful_shutdown=int(WS_DRAIN_SECONDS) + 10,
+        workers=SERVER_WORKERS,
+        proxy_headers=True,
+    )
+
+
+def run_worker(config: Config, sockets: list[socket.socket]) -> None:
+    """
+    Точка входа процесса воркера: настраивает логирование и запускает сервер
+    на переданном общем сокете
+
+    :param config: конфигурация uvicorn
+    :param sockets: слушающие сокеты, открытые родительским процессом
+    """
+    config.configure_logging()
+    DrainingServer(config=config).run(sockets=sockets)
+
+
+def run_workers(config: Config) -> None:
+    """
+    Запускает несколько воркеров на общем сокете и перезапускает упавшие.
+    SIGTERM/SIGINT пересылается воркерам, каждый из них выполняет плавную остановку
+
+    :param config: конфигурация uvicorn
+    """
+    sock = config.bind_socket()
+    stopping = False
+    # spawn, как у uvicorn: воркер не наследует состояние родителя (потоки, event loop)
+    context = multiprocessing.get_context("spawn")
+
+    def spawn() -> BaseProcess:
+        process = context.Process(target=run_worker, args=(config, [sock]))
+        process.start()
+        return process
+
+    def handle_exit(sig: int, frame: FrameType | None) -> None:
+        nonlocal stopping
+        stopping = True
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    processes = [spawn() for _ in range(config.workers)]
+    signal.signal(signal.SIGTERM, handle_exit)
+    signal.signal(signal.SIGINT, handle_exit)
+    logger.info("Запущено воркеров: %d", len(processes))
+
+    while not stopping:
+        for index, process in enumerate(processes):
+            if not process.is_alive() and not stopping:
+                logger.warning("Воркер %s завершился, перезапуск", process.pid)
+                processes[index] = spawn()
+        time.sleep(0.5)
+
+    for process in processes:
+        process.join()
+    sock.close()
+
+
+def main() -> None:
+    """
+    Точка входа продакшен-сервера: python app/server.py
+    """
+    config = build_config()
+    if config.workers > 1:
+        run_workers(config)
+    else:
+        server = DrainingServer(config=config)
+        server.run()
+        if not server.started:
+            sys.exit(3)
+
+
+if __name__ == "__main__":
+    main()
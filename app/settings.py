@@ -13,7 +13,119 @@ POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
 POSTGRES_HOST = os.getenv("POSTGRES_HOST")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT")
 
-DATABASE_URL = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+# DATABASE_URL задаётся целиком, например sqlite+aiosqlite:///:memory: для тестов без Postgres
+DATABASE_URL = (
+    os.getenv("DATABASE_URL")
+    or f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+)
+# Схема Postgres (search_path), например отдельная схема на воркер pytest-xdist
+DATABASE_SCHEMA = os.getenv("DATABASE_SCHEMA") or None
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
+# Стоимость bcrypt (2^rounds итераций); в тестах снижается до минимума
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Сжатие WebSocket (permessage-deflate) и HTTP-ответов
+WS_PER_MESSAGE_DEFLATE = os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() == "true"
+WS_DEFLATE_WINDOW_BITS = int(os.getenv("WS_DEFLATE_WINDOW_BITS", "12"))
+WS_DEFLATE_LEVEL = int(os.getenv("WS_DEFLATE_LEVEL", "6"))
+WS_DEFLATE_MEM_LEVEL = int(os.getenv("WS_DEFLATE_MEM_LEVEL", "5"))
+HTTP_COMPRESSION_MIN_SIZE = int(os.getenv("HTTP_COMPRESSION_MIN_SIZE", "1024"))
+HTTP_GZIP_LEVEL = int(os.getenv("HTTP_GZIP_LEVEL", "6"))
+HTTP_BROTLI_QUALITY = int(os.getenv("HTTP_BROTLI_QUALITY", "5"))
+
+# Старт воркера: create_all — создать таблицы, check — сверить ревизию Alembic, skip — ничего
+SCHEMA_MODE = os.getenv("SCHEMA_MODE", "create_all")
+POOL_WARMUP = int(os.getenv("POOL_WARMUP", "0"))
+STARTUP_TARGET_MS = float(os.getenv("STARTUP_TARGET_MS", "2000"))
+
+# Продакшен-сервер (app/server.py)
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", str(os.cpu_count() or 1)))
+SERVER_LOOP = os.getenv("SERVER_LOOP", "uvloop")
+SERVER_HTTP = os.getenv("SERVER_HTTP", "httptools")
+SERVER_BACKLOG = int(os.getenv("SERVER_BACKLOG", "2048"))
+SERVER_KEEP_ALIVE = int(os.getenv("SERVER_KEEP_ALIVE", "5"))
+WS_DRAIN_SECONDS = float(os.getenv("WS_DRAIN_SECONDS", "20"))
+
+# Доставка пропущенных сообщений при подключении
+BACKLOG_BATCH_SIZE = int(os.getenv("BACKLOG_BATCH_SIZE", "100"))
+BACKLOG_MAX_MESSAGES = int(os.getenv("BACKLOG_MAX_MESSAGES", "1000"))
+
+# Идемпотентность отправки сообщений по (sender_id, client_id)
+IDEMPOTENCY_WINDOW_SECONDS = int(os.getenv("IDEMPOTENCY_WINDOW_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "100000"))
+
+# Кэш членства в чатах для авторизации WebSocket
+MEMBERSHIP_CACHE_SIZE = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "100000"))
+MEMBERSHIP_CACHE_TTL = float(os.getenv("MEMBERSHIP_CACHE_TTL", "300"))
+
+# Реплика для чтения истории и списка чатов (если не задана — читаем с основной БД)
+REPLICA_DATABASE_URL = os.getenv("REPLICA_DATABASE_URL") or None
+REPLICA_LAG_SECONDS = float(os.getenv("REPLICA_LAG_SECONDS", "5"))
+RECENT_WRITES_CACHE_SIZE = int(os.getenv("RECENT_WRITES_CACHE_SIZE", "100000"))
+
+# Вложения: каталог хранилища, лимит размера и отдача через nginx (X-Accel-Redirect)
+ATTACHMENTS_DIR = os.getenv("ATTACHMENTS_DIR", "./data/attachments")
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(25 * 1024 * 1024)))
+ATTACHMENTS_ACCEL_PREFIX = os.getenv("ATTACHMENTS_ACCEL_PREFIX") or None
+# Загруженные, но не отправленные вложения удаляются через ATTACHMENT_ORPHAN_HOURS часов
+ATTACHMENT_ORPHAN_HOURS = float(os.getenv("ATTACHMENT_ORPHAN_HOURS", "24"))
+
+# Статика: файлы не больше порога держатся в памяти, max-age для файлов с хешем в имени
+STATIC_CACHE_MAX_BYTES = int(os.getenv("STATIC_CACHE_MAX_BYTES", "65536"))
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "31536000"))
+
+# Профилирование запросов: по заголовку X-Profile с токеном и/или по доле запросов
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN") or None
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./data/profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+# GET /metrics отвечает только с заголовком Authorization: Bearer <METRICS_TOKEN>;
+# без токена эндпоинт выключен (404)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN") or None
+
+# Лог медленных SQL-запросов (0 — выключен)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+
+# Трассировка жизненного цикла сообщений: none / console / file / otel
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+TRACE_FILE = os.getenv("TRACE_FILE", "./data/traces.jsonl")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+
+# Возобновление WebSocket-сессий без повторной авторизации и загрузки истории
+WS_RESUME_TTL = float(os.getenv("WS_RESUME_TTL", "120"))
+WS_SESSION_CACHE_SIZE = int(os.getenv("WS_SESSION_CACHE_SIZE", "100000"))
+WS_REPLAY_BUFFER = int(os.getenv("WS_REPLAY_BUFFER", "256"))
+
+# Хранение сообщений: срок в днях (0 — бессрочно), у чата может быть свой (chats.retention_days)
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "0"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+RETENTION_PAUSE_SECONDS = float(os.getenv("RETENTION_PAUSE_SECONDS", "0.05"))
+
+# Кэш имён пользователей для истории: TTL ограничивает устаревание после
+# переименования на другом воркере
+USER_NAME_CACHE_SIZE = int(os.getenv("USER_NAME_CACHE_SIZE", "100000"))
+USER_NAME_CACHE_TTL = float(os.getenv("USER_NAME_CACHE_TTL", "300"))
+
+# Фоновые задачи в процессе приложения (планировщик запускается в lifespan)
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+SCHEDULER_JITTER_SECONDS = float(os.getenv("SCHEDULER_JITTER_SECONDS", "30"))
+RETENTION_CRON = os.getenv("RETENTION_CRON", "30 3 * * *")
+IDEMPOTENCY_PURGE_INTERVAL = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", "3600"))
+WS_REAP_INTERVAL = float(os.getenv("WS_REAP_INTERVAL", "60"))
+ATTACHMENT_PURGE_INTERVAL = float(os.getenv("ATTACHMENT_PURGE_INTERVAL", "3600"))
+
+# Рассылка отметок прочтения: события копятся по (читатель, чат) в течение окна
+# и уходят одним кадром «прочитано до»; в больших чатах — счётчиками прочтений
+READ_RECEIPT_WINDOW = float(os.getenv("READ_RECEIPT_WINDOW", "0.25"))
+READ_RECEIPT_GROUP_THRESHOLD = int(os.getenv("READ_RECEIPT_GROUP_THRESHOLD", "50"))
+
+# Шардирование чатов по узлам (консистентное хеширование chat_id).
+# SHARD_NODES: "node1=ws://10.0.0.1:8000,node2=ws://10.0.0.2:8000"; пусто — выключено
+SHARD_NODES = os.getenv("SHARD_NODES", "")
+SHARD_NODE_ID = os.getenv("SHARD_NODE_ID", "")
+SHARD_VNODES = int(os.getenv("SHARD_VNODES", "160"))
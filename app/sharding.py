@@ -0,0 +1,116 @@
+import bisect
+import hashlib
+
+from settings import SHARD_NODE_ID, SHARD_NODES, SHARD_VNODES
+
+
+def hash_key(key: str) -> int:
+    """
+    Положение ключа на кольце: первые 8 байт sha256 (одинаково во всех процессах,
+    в отличие от встроенного hash со случайной солью)
+
+    :param key: ключ
+    :return: точка на кольце
+    """
+    return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "big")
+
+
+def parse_nodes(spec: str) -> dict[str, str]:
+    """
+    Разбирает список узлов "node1=ws://host1:8000,node2=ws://host2:8000"
+
+    :param spec: значение SHARD_NODES
+    :return: словарь id узла -> базовый WebSocket-адрес
+    """
+    nodes = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        node_id, sep, url = item.partition("=")
+        if not sep or not node_id.strip() or not url.strip():
+            raise ValueError(f"Ожидается id=url в SHARD_NODES: {item!r}")
+        nodes[node_id.strip()] = url.strip().rstrip("/")
+    return nodes
+
+
+class HashRing:
+    """
+    Кольцо консистентного хеширования: у каждого узла vnodes точек, чат принадлежит
+    узлу первой точки по часовой стрелке от hash(chat_id). При добавлении или
+    удалении узла переезжает только доля чатов этого узла (~1/N), а не все
+    """
+
+    def __init__(self, nodes: dict[str, str], vnodes: int = SHARD_VNODES) -> None:
+        if not nodes:
+            raise ValueError("Кольцо без узлов")
+        self.nodes = nodes
+        points = sorted(
+            (hash_key(f"{node_id}#{index}"), node_id)
+            for node_id in nodes
+            for index in range(vnodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [node_id for _, node_id in points]
+
+    def node_for(self, chat_id: int) -> str:
+        """
+        Узел, которому принадлежит чат
+
+        :param chat_id: идентификатор чата
+        :return: id узла
+        """
+        index = bisect.bisect(self._hashes, hash_key(f"chat:{chat_id}"))
+        return self._owners[index % len(self._owners)]
+
+    def url_for(self, chat_id: int) -> str:
+        """
+        Адрес WebSocket-подключения к чату на узле-владельце
+
+        :param chat_id: идентификатор чата
+        :return: URL вида ws://host:port/ws/chat/{chat_id}
+        """
+        return f"{self.nodes[self.node_for(chat_id)]}/ws/chat/{chat_id}"
+
+
+def build_ring(spec: str, node_id: str) -> HashRing | None:
+    """
+    Кольцо из настроек; без SHARD_NODES шардирование выключено
+
+    :param spec: значение SHARD_NODES
+    :param node_id: id текущего узла (должен входить в SHARD_NODES)
+    :return: кольцо или None
+    """
+    nodes = parse_nodes(spec)
+    if not nodes:
+        return None
+    if node_id not in nodes:
+        raise ValueError(f"SHARD_NODE_ID={node_id!r} не входит в SHARD_NODES")
+    return HashRing(nodes)
+
+
+ring = build_ring(SHARD_NODES, SHARD_NODE_ID)
+
+
+def chat_route(chat_id: int) -> tuple[str | None, str | None]:
+    """
+    Узел-владелец чата и адрес подключения к нему
+
+    :param chat_id: идентификатор чата
+    :return: id узла и URL или (None, None), если шардирование выключено
+    """
+    if ring is None:
+        return None, None
+    return ring.node_for(chat_id), ring.url_for(chat_id)
+
+
+def chat_owner_url(chat_id: int) -> str | None:
+    """
+    Адрес узла-владельца, если чат обслуживает другой узел
+
+    :param chat_id: идентификатор чата
+    :return: URL для переподключения или None, если чат принадлежит этому узлу
+        (или шардирование выключено)
+    """
+    node_id, url = chat_route(chat_id)
+    return None if node_id in (None, SHARD_NODE_ID) else url
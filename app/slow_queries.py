@@ -0,0 +1,79 @@
+import json
+import logging
+import time
+from collections.abc import Mapping, Sequence
+from contextvars import ContextVar
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+logger = logging.getLogger("uvicorn.error")
+
+# Обработчик, выполняющий запрос: "GET /history/5", "ws new_message", ...
+current_handler: ContextVar[str | None] = ContextVar("current_handler", default=None)
+
+
+def parameters_shape(parameters: Any, executemany: bool) -> str:
+    """
+    Описывает форму параметров запроса без значений (в лог не попадают данные пользователей)
+
+    :param parameters: параметры курсора
+    :param executemany: выполняется ли запрос пачкой
+    :return: например "3x{email,name}" или "(4)"
+    """
+    if executemany and isinstance(parameters, Sequence) and parameters:
+        return f"{len(parameters)}x{parameters_shape(parameters[0], False)}"
+    if isinstance(parameters, Mapping):
+        return "{" + ",".join(sorted(map(str, parameters))) + "}"
+    if isinstance(parameters, Sequence):
+        return f"({len(parameters)})"
+    return type(parameters).__name__
+
+
+def install_slow_query_log(engine: AsyncEngine, threshold_ms: float) -> None:
+    """
+    Подключает к движку лог запросов дольше порога: текст запроса, форма параметров,
+    длительность и обработчик. Хуки вешаются только при включённом логе
+
+    :param engine: асинхронный движок SQLAlchemy
+    :param threshold_ms: порог в миллисекундах
+    """
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany) -> None:
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _log_slow_query(conn, cursor, statement, parameters, context, executemany) -> None:
+        duration_ms = (time.perf_counter() - context._query_started) * 1000
+        if duration_ms < threshold_ms:
+            return
+        logger.warning(
+            "Медленный запрос: %s",
+            json.dumps(
+                {
+                    "duration_ms": round(duration_ms, 2),
+                    "handler": current_handler.get(),
+                    "statement": " ".join(statement.split()),
+                    "parameters": parameters_shape(parameters, executemany),
+                },
+                ensure_ascii=False,
+            ),
+        )
+
+
+class HandlerContextMiddleware:
+    """
+    ASGI-мидлварь, запоминающая текущий обработчик для лога медленных запросов
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] in ("http", "websocket"):
+            current_handler.set(f"{scope.get('method', 'WS')} {scope['path']}")
+        await self.app(scope, receive, send)
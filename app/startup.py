@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+
+from settings import ROOT_PATH
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger("uvicorn.error")
+
+# Допустимые значения SCHEMA_MODE
+SCHEMA_MODES = ("create_all", "check", "skip")
+
+
+class StartupReport:
+    """Замеры этапов холодного старта воркера (импорты, схема, прогрев пула)"""
+
+    def __init__(self) -> None:
+        self.phases: dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Замеряет длительность этапа старта
+
+        :param name: название этапа
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = (time.perf_counter() - started) * 1000
+
+    def log(self, target_ms: float) -> None:
+        """
+        Пишет разбивку старта в лог и предупреждает о превышении целевого времени
+
+        :param target_ms: целевое время холодного старта в миллисекундах
+        """
+        total = sum(self.phases.values())
+        breakdown = ", ".join(f"{name}={ms:.0f}ms" for name, ms in self.phases.items())
+        if total > target_ms:
+            logger.warning(
+                "Медленный старт воркера: %.0fms > %.0fms (%s)", total, target_ms, breakdown
+            )
+        else:
+            logger.info("Старт воркера: %.0fms (%s)", total, breakdown)
+
+
+def get_head_revisions() -> set[str]:
+    """
+    Возвращает head-ревизии Alembic из каталога миграций
+
+    :return: множество идентификаторов head-ревизий
+    """
+    # Alembic импортируется лениво: в режимах create_all/skip он не нужен при старте
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+
+    config = Config((ROOT_PATH / "alembic.ini").as_posix())
+    config.set_main_option("script_location", (ROOT_PATH / "migrations").as_posix())
+    return set(ScriptDirectory.from_config(config).get_heads())
+
+
+async def check_schema_revision(engine: AsyncEngine, tables: Iterable[str] = ()) -> None:
+    """
+    Проверяет, что БД мигрирована до head-ревизии Alembic и в ней есть таблицы моделей.
+    Вместо create_all читается одна строка alembic_version и список таблиц
+
+    :param engine: асинхронный движок SQLAlchemy
+    :param tables: таблицы, которые должны существовать (Base.metadata.tables)
+    :raises RuntimeError: если ревизия БД не совпадает с head или таблиц не хватает
+    """
+    from alembic.runtime.migration import MigrationContext
+    from sqlalchemy import inspect
+
+    async with engine.connect() as conn:
+        current, existing = await conn.run_sync(
+            lambda sync_conn: (
+                set(MigrationContext.configure(sync_conn).get_current_heads()),
+                set(inspect(sync_conn).get_table_names()),
+            )
+        )
+    expected = get_head_revisions()
+    if current != expected:
+        raise RuntimeError(
+            f"Ревизия БД {sorted(current)} не совпадает с head {sorted(expected)}, "
+            "выполните `alembic upgrade head`"
+        )
+    missing = set(tables) - existing
+    if missing:
+        raise RuntimeError(f"В БД нет таблиц {sorted(missing)}: миграции расходятся с моделями")
+
+
+async def warm_pool(engine: AsyncEngine, size: int) -> None:
+    """
+    Открывает заранее `size` соединений пула, чтобы первые запросы
+    после старта не платили за установку соединения
+
+    :param engine: асинхронный движок SQLAlchemy
+    :param size: количество соединений для прогрева
+    """
+
+    async def ping() -> None:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(ping() for _ in range(size)))
@@ -0,0 +1,113 @@
+import hashlib
+import mimetypes
+import os
+import re
+from dataclasses import dataclass, field
+
+import anyio
+from http_compression import accepted_encodings
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+from utils import etag_matches
+
+# Варианты, которые генерирует build_static.py, в порядке предпочтения
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+# app.3f2a9c1d.js, app-3f2a9c1d.css: содержимое по такому имени никогда не меняется
+FINGERPRINT_RE = re.compile(r"[.-][0-9a-f]{8,}\.[^./]+$")
+
+
+@dataclass
+class _Variant:
+    """Представление файла: исходное или заранее сжатое"""
+
+    path: str
+    etag: str
+    body: bytes | None = None  # содержимое маленьких файлов держится в памяти
+
+
+@dataclass
+class _Asset:
+    """Закэшированные сведения о статическом файле"""
+
+    mtime_ns: int
+    size: int
+    media_type: str
+    variants: dict[str | None, _Variant] = field(default_factory=dict)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles, отдающий заранее сжатые варианты (file.br, file.gz) по Accept-Encoding.
+    Сжатие во время запроса не выполняется: ETag строится по sha256 содержимого
+    (свой для каждого варианта), файлы с хешем в имени кэшируются клиентом навсегда,
+    остальные перепроверяются по ETag, а маленькие файлы отдаются из памяти
+    """
+
+    def __init__(self, *args, cache_max_bytes: int = 65536, max_age: int = 31536000, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_max_bytes = cache_max_bytes
+        self.max_age = max_age
+        self._assets: dict[str, _Asset] = {}
+
+    def cache_control(self, path: str) -> str:
+        """
+        Значение Cache-Control для файла
+
+        :param path: путь к файлу
+        :return: immutable для файлов с хешем в имени, иначе перепроверка по ETag
+        """
+        if FINGERPRINT_RE.search(path):
+            return f"public, max-age={self.max_age}, immutable"
+        return "no-cache"
+
+    def _load_variant(self, path: str, suffix: str) -> _Variant:
+        with open(path, "rb") as file:
+            data = file.read()
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        body = data if len(data) <= self.cache_max_bytes else None
+        return _Variant(path=path, etag=f'"{digest}{suffix}"', body=body)
+
+    def _load_asset(self, full_path: str, stat_result: os.stat_result) -> _Asset:
+        media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+        asset = _Asset(stat_result.st_mtime_ns, stat_result.st_size, media_type)
+        asset.variants[None] = self._load_variant(full_path, "")
+        for encoding, extension in PRECOMPRESSED:
+            # Вариант, собранный до последнего изменения файла, устарел
+            compressed = full_path + extension
+            if os.path.isfile(compressed) and os.stat(compressed).st_mtime_ns >= asset.mtime_ns:
+                asset.variants[encoding] = self._load_variant(compressed, f"-{encoding}")
+        return asset
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await super().get_response(path, scope)
+        if not isinstance(response, FileResponse) or response.status_code != 200:
+            return response
+
+        stat_result = response.stat_result
+        asset = self._assets.get(response.path)
+        if asset is None or (asset.mtime_ns, asset.size) != (
+            stat_result.st_mtime_ns,
+            stat_result.st_size,
+        ):
+            asset = await anyio.to_thread.run_sync(self._load_asset, response.path, stat_result)
+            self._assets[response.path] = asset
+
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        encoding = next((name for name in asset.variants if name in accepted), None)
+        variant = asset.variants[encoding]
+
+        headers = {
+            "ETag": variant.etag,
+            "Cache-Control": self.cache_control(path),
+            "Vary": "Accept-Encoding",
+        }
+        if etag_matches(request_headers.get("if-none-match"), variant.etag):
+            return Response(status_code=304, headers=headers)
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        if variant.body is not None:
+            return Response(variant.body, media_type=asset.media_type, headers=headers)
+        return FileResponse(variant.path, media_type=asset.media_type, headers=headers)
@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+import anyio
+from settings import ATTACHMENTS_DIR
+
+
+class AttachmentTooLarge(Exception):
+    """Поток вложения превысил допустимый размер"""
+
+
+class LocalStorage:
+    """
+    Контентно-адресуемое хранилище файлов на диске.
+    Файл лежит по ключу ab/cd/<sha256>: одинаковое содержимое хранится один раз,
+    а тот же ключ подходит как имя объекта в S3-совместимом хранилище
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = Path(root)
+
+    @staticmethod
+    def key_for(sha256: str) -> str:
+        """
+        Ключ объекта по хешу содержимого
+
+        :param sha256: hex-хеш содержимого
+        :return: относительный путь ab/cd/<sha256>
+        """
+        return f"{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+    def path(self, key: str) -> Path:
+        """
+        Путь к файлу на диске по ключу
+
+        :param key: ключ объекта
+        :return: абсолютный путь
+        """
+        return self.root / key
+
+    async def save_stream(
+        self, chunks: AsyncIterator[bytes], max_bytes: int
+    ) -> tuple[str, str, int]:
+        """
+        Пишет поток во временный файл, по ходу считая размер и sha256,
+        затем переносит его по ключу хеша (если такого содержимого ещё нет).
+        В памяти держится только текущий кусок потока
+
+        :param chunks: асинхронный поток байтов
+        :param max_bytes: максимальный размер файла
+        :return: ключ объекта, sha256 и размер в байтах
+        """
+        tmp_dir = self.root / "tmp"
+        await asyncio.to_thread(tmp_dir.mkdir, parents=True, exist_ok=True)
+        tmp_path = tmp_dir / uuid.uuid4().hex
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with await anyio.open_file(tmp_path, "wb") as file:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise AttachmentTooLarge()
+                    digest.update(chunk)
+                    await file.write(chunk)
+            sha256 = digest.hexdigest()
+            key = self.key_for(sha256)
+            await asyncio.to_thread(self._store, tmp_path, self.path(key))
+        except BaseException:
+            await asyncio.to_thread(tmp_path.unlink, missing_ok=True)
+            raise
+        return key, sha256, size
+
+    @staticmethod
+    def _store(tmp_path: Path, target: Path) -> None:
+        """
+        Переносит временный файл по ключу (выполняется в потоке: операции с диском
+        блокирующие). Если такое содержимое уже есть, обновляет его mtime:
+        очистка не удалит файл, на который вот-вот сошлётся новая запись
+
+        :param tmp_path: временный файл
+        :param target: путь по ключу хеша
+        """
+        if target.exists():
+            os.utime(target)
+            tmp_path.unlink()
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, target)
+
+    async def delete(self, key: str, older_than: float) -> bool:
+        """
+        Удаляет объект, если он не менялся с момента older_than
+
+        :param key: ключ объекта
+        :param older_than: unix-время; более свежие файлы не удаляются
+        :return: True, если файл удалён
+        """
+
+        def remove() -> bool:
+            path = self.path(key)
+            try:
+                if path.stat().st_mtime >= older_than:
+                    return False
+                path.unlink()
+            except FileNotFoundError:
+                return False
+            return True
+
+        return await asyncio.to_thread(remove)
+
+
+storage = LocalStorage(ATTACHMENTS_DIR)
@@ -0,0 +1,220 @@
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+
+from metrics import Histogram
+from settings import TRACE_EXPORTER, TRACE_FILE, TRACE_SAMPLE_RATE
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # opentelemetry — необязательная зависимость
+    otel_trace = None
+
+logger = logging.getLogger("uvicorn.error")
+
+# Этапы обработки new_message как интервалы между отметками времени
+STAGES = (
+    ("parse", "received", "parsed"),
+    ("persist", "parsed", "persisted"),
+    ("commit", "persisted", "committed"),
+    ("encode", "committed", "fanout_started"),
+    ("fanout", "fanout_started", "fanout_finished"),
+)
+
+stage_seconds = Histogram(
+    "message_stage_seconds", "Длительность этапов обработки new_message", ("stage",)
+)
+total_seconds = Histogram(
+    "message_total_seconds", "Время от получения new_message до конца рассылки"
+)
+
+
+class MessageTrace:
+    """
+    Отметки времени (unix, нс) прохождения одного сообщения через этапы обработки
+    """
+
+    __slots__ = ("marks", "attributes")
+
+    def __init__(self, received_ns: int) -> None:
+        self.marks: dict[str, int] = {"received": received_ns}
+        self.attributes: dict[str, int | str] = {}
+
+    def mark(self, stage: str) -> None:
+        """
+        Отмечает завершение этапа
+
+        :param stage: название отметки (parsed, persisted, committed, ...)
+        """
+        self.marks[stage] = time.time_ns()
+
+    def spans(self) -> list[tuple[str, int, int]]:
+        """
+        Интервалы пройденных этапов
+
+        :return: список (этап, начало, конец) в наносекундах
+        """
+        return [
+            (name, self.marks[start], self.marks[end])
+            for name, start, end in STAGES
+            if start in self.marks and end in self.marks
+        ]
+
+    def finish(self) -> None:
+        """
+        Записывает длительности этапов в гистограммы и передаёт трассу экспортёру
+        """
+        spans = self.spans()
+        for name, start, end in spans:
+            stage_seconds.observe((end - start) / 1e9, name)
+        last = max(self.marks.values())
+        total_seconds.observe((last - self.marks["received"]) / 1e9)
+        if exporter is not None and random.random() < TRACE_SAMPLE_RATE:
+            exporter.export(self, spans, last)
+
+
+class JSONSpanExporter:
+    """
+    Пишет трассы в формате, близком к OTLP JSON: корневой спан сообщения
+    и дочерние спаны этапов, по строке на спан (файл JSON Lines или лог).
+    Запись в файл идёт в отдельном потоке через очередь, чтобы диск не
+    блокировал event loop на каждом сообщении
+    """
+
+    def __init__(self, path: str | None = None) -> None:
+        self.path = path
+        self._queue: queue.SimpleQueue[str | None] = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+
+    def _write(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False)
+        if self.path is None:
+            logger.info("span %s", line)
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._write_lines, name="trace-writer", daemon=True
+            )
+            self._thread.start()
+        self._queue.put(line)
+
+    def _write_lines(self) -> None:
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as file:
+            while (line := self._queue.get()) is not None:
+                file.write(line + "\n")
+                if self._queue.empty():
+                    file.flush()
+
+    def close(self) -> None:
+        """
+        Дописывает очередь в файл и останавливает поток записи
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def export(self, trace: MessageTrace, spans: list[tuple[str, int, int]], end_ns: int) -> None:
+        """
+        Экспортирует трассу сообщения
+
+        :param trace: трасса сообщения
+        :param spans: интервалы этапов
+        :param end_ns: время окончания обработки
+        """
+        trace_id = os.urandom(16).hex()
+        root_id = os.urandom(8).hex()
+        self._write({
+            "trace_id": trace_id,
+            "span_id": root_id,
+            "name": "ws new_message",
+            "start_time_unix_nano": trace.marks["received"],
+            "end_time_unix_nano": end_ns,
+            "attributes": trace.attributes,
+        })
+        for name, start, end in spans:
+            self._write({
+                "trace_id": trace_id,
+                "span_id": os.urandom(8).hex(),
+                "parent_span_id": root_id,
+                "name": name,
+                "start_time_unix_nano": start,
+                "end_time_unix_nano": end,
+            })
+
+
+class OpenTelemetryExporter:
+    """
+    Передаёт трассы в OpenTelemetry: провайдер и экспорт настраиваются SDK
+    (например, через переменные OTEL_* и opentelemetry-instrument)
+    """
+
+    def __init__(self) -> None:
+        self.tracer = otel_trace.get_tracer("messenger")
+
+    def export(self, trace: MessageTrace, spans: list[tuple[str, int, int]], end_ns: int) -> None:
+        """
+        Экспортирует трассу сообщения
+
+        :param trace: трасса сообщения
+        :param spans: интервалы этапов
+        :param end_ns: время окончания обработки
+        """
+        root = self.tracer.start_span(
+            "ws new_message", start_time=trace.marks["received"], attributes=trace.attributes
+        )
+        context = otel_trace.set_span_in_context(root)
+        for name, start, end in spans:
+            self.tracer.start_span(name, context=context, start_time=start).end(end_time=end)
+        root.end(end_time=end_ns)
+
+
+def build_exporter(kind: str) -> JSONSpanExporter | OpenTelemetryExporter | None:
+    """
+    Создаёт экспортёр трасс по настройке TRACE_EXPORTER
+
+    :param kind: none / console / file / otel
+    :return: экспортёр или None (только гистограммы)
+    """
+    if kind == "console":
+        return JSONSpanExporter()
+    if kind == "file":
+        return JSONSpanExporter(TRACE_FILE)
+    if kind == "otel":
+        if otel_trace is None:
+            logger.warning("TRACE_EXPORTER=otel, но opentelemetry не установлен: трассы выключены")
+            return None
+        return OpenTelemetryExporter()
+    return None
+
+
+exporter = build_exporter(TRACE_EXPORTER)
+
+
+def close_exporter() -> None:
+    """
+    Дописывает накопленные трассы (вызывается в lifespan при остановке)
+    """
+    if isinstance(exporter, JSONSpanExporter):
+        exporter.close()
+
+# Трасса сообщения, которое сейчас обрабатывается в этой задаче
+current_trace: ContextVar[MessageTrace | None] = ContextVar("current_trace", default=None)
+
+
+def mark_stage(stage: str) -> None:
+    """
+    Отмечает этап у текущей трассы, если сообщение трассируется
+
+    :param stage: название отметки
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        trace.mark(stage)
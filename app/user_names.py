@@ -0,0 +1,47 @@
+from collections.abc import Iterable
+
+from cache import LRUCache
+from models import User
+from settings import USER_NAME_CACHE_SIZE, USER_NAME_CACHE_TTL
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# user_id -> отображаемое имя. Переименование на этом воркере обновляет кэш сразу,
+# на других — не позже чем через USER_NAME_CACHE_TTL
+user_names = LRUCache(maxsize=USER_NAME_CACHE_SIZE, ttl=USER_NAME_CACHE_TTL)
+
+
+async def get_user_names(user_ids: Iterable[int], db: AsyncSession) -> dict[int, str]:
+    """
+    Имена пользователей по id: из кэша, недостающие — одним запросом по первичному ключу
+
+    :param user_ids: идентификаторы пользователей (могут повторяться)
+    :param db: сессия базы данных
+    :return: словарь user_id -> имя
+    """
+    names = {}
+    missing = set()
+    for user_id in user_ids:
+        if user_id in names or user_id in missing:
+            continue
+        name = user_names.get(user_id)
+        if name is None:
+            missing.add(user_id)
+        else:
+            names[user_id] = name
+    if missing:
+        result = await db.execute(select(User.id, User.name).where(User.id.in_(missing)))
+        for user_id, name in result:
+            user_names.set(user_id, name)
+            names[user_id] = name
+    return names
+
+
+def remember_user_name(user_id: int, name: str) -> None:
+    """
+    Обновляет имя пользователя в кэше (после переименования или загрузки пользователя)
+
+    :param user_id: идентификатор пользователя
+    :param name: отображаемое имя
+    """
+    user_names.set(user_id, name)
@@ -1,3 +1,4 @@
+import hashlib
 import re
 import uuid
 
@@ -24,3 +25,32 @@ def validate_password(password: str) -> None:
         )
     if not re.search(r"\d", password):
         raise HTTPException(status_code=422, detail="Пароль должен содержать хотя бы одну цифру")
+
+
+def make_etag(*parts: object) -> str:
+    """
+    Строит слабый ETag по версии ресурса и параметрам запроса.
+    ETag слабый, так как тело может отдаваться в разных кодировках сжатия
+
+    :param parts: составляющие версии (идентификаторы, счётчики, параметры)
+    :return: значение заголовка ETag
+    """
+    digest = hashlib.sha1(":".join(map(str, parts)).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Проверяет, совпадает ли заголовок If-None-Match с текущим ETag
+    (слабое сравнение, как требует RFC 9110 для If-None-Match)
+
+    :param if_none_match: значение заголовка If-None-Match
+    :param etag: текущий ETag ресурса
+    :return: True, если клиент уже имеет актуальную версию
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    current = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == current for tag in if_none_match.split(","))
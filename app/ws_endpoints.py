@@ -1,79 +1,330 @@
-import json
+import asyncio
+import time
 from typing import Dict
 
+import orjson
 from auth import get_current_user_ws
-from database import get_db_session
+from database import get_db, get_db_session, get_read_db
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from membership import is_chat_member
+from models import User
+from read_receipts import build_read_frames, record_read, take_reads
+from request_profiling import PROFILE_HEADER, maybe_profile
+from responses import dumps_text
+from settings import (BACKLOG_BATCH_SIZE, BACKLOG_MAX_MESSAGES,
+                      READ_RECEIPT_GROUP_THRESHOLD, READ_RECEIPT_WINDOW,
+                      WS_RESUME_TTL)
+from sharding import chat_owner_url
+from slow_queries import current_handler
 from sqlalchemy.ext.asyncio import AsyncSession
-from ws_queries import (fetch_last_messages, mark_message_as_read,
+from starlette.websockets import WebSocketState
+from tracing import MessageTrace, current_trace, mark_stage
+from ws_queries import (ack_delivery, fetch_backlog, fetch_last_messages,
+                        get_chat_last_seq, get_delivery_cursor,
+                        get_uploaded_attachment, mark_message_as_read,
                         save_new_message)
+from ws_sessions import (WSSession, advance_session, issue_session,
+                         release_session, remember_message, replay_since,
+                         resume_session)
 
 ws_router = APIRouter()
 active_connections: Dict[int, set[WebSocket]] = {}
 
+# Отложенные рассылки отметок прочтения (ссылки держатся до завершения задач)
+read_flush_tasks: set[asyncio.Task] = set()
+
+# Код закрытия 1012 (Service Restart): клиент должен переподключиться к другому узлу
+DRAIN_CLOSE_CODE = 1012
+# Чат обслуживает другой узел: адрес приходит кадром {"type": "redirect", "url": ...}
+REDIRECT_CLOSE_CODE = 4300
+
+
+async def drain_connections(deadline: float) -> None:
+    """
+    Закрывает все активные WebSocket-соединения, равномерно распределяя
+    закрытия по интервалу deadline, чтобы переподключения не пришли в БД разом
+
+    :param deadline: время в секундах, за которое нужно закрыть все соединения
+    :return: None
+    """
+    sockets = [conn for conns in active_connections.values() for conn in conns]
+    if not sockets:
+        return
+    interval = deadline / len(sockets)
+    for conn in sockets:
+        try:
+            await conn.close(code=DRAIN_CLOSE_CODE, reason="reconnect")
+        except RuntimeError:
+            # Соединение уже закрыто клиентом
+            pass
+        await asyncio.sleep(interval)
+
+
+def reap_dead_connections() -> int:
+    """
+    Убирает из active_connections закрытые соединения, которые не были удалены
+    обработчиком (например, после ошибки во время рассылки), и пустые чаты
+
+    :return: количество убранных соединений
+    """
+    reaped = 0
+    for chat_id, conns in list(active_connections.items()):
+        dead = {
+            conn
+            for conn in conns
+            if conn.client_state != WebSocketState.CONNECTED
+            or conn.application_state != WebSocketState.CONNECTED
+        }
+        if not dead and conns:
+            continue
+        for conn in dead:
+            release_session(conn)
+        reaped += len(dead)
+        # Множество заменяется, а не меняется на месте: по нему может идти рассылка
+        alive = conns - dead
+        if alive:
+            active_connections[chat_id] = alive
+        else:
+            active_connections.pop(chat_id, None)
+    return reaped
+
+
+async def flush_read_receipts(chat_id: int, delay: float = READ_RECEIPT_WINDOW) -> None:
+    """
+    По окончании окна рассылает накопленные отметки прочтения чата: кадр
+    «прочитано до» на читателя или, если в чате много соединений, счётчики прочтений
+
+    :param chat_id: идентификатор чата
+    :param delay: длительность окна, секунды
+    :return: None
+    """
+    await asyncio.sleep(delay)
+    # Окно закрывается до первого await: новые отметки попадут в следующее
+    readers = take_reads(chat_id)
+    conns = list(active_connections.get(chat_id, ()))
+    if not conns:
+        return
+    async with get_db() as db:
+        frames = await build_read_frames(readers, len(conns) >= READ_RECEIPT_GROUP_THRESHOLD, db)
+    for frame in frames:
+        payload = dumps_text(frame)
+        for conn in conns:
+            try:
+                await conn.send_text(payload)
+            except (WebSocketDisconnect, RuntimeError):
+                # Соединение закрылось во время рассылки; из реестра его уберёт обработчик
+                # или reap_dead_connections
+                pass
+
+
+def schedule_read_receipt(chat_id: int, reader_id: int, message_id: int) -> None:
+    """
+    Добавляет отметку прочтения в окно чата и при открытии окна планирует рассылку
+
+    :param chat_id: идентификатор чата
+    :param reader_id: идентификатор прочитавшего
+    :param message_id: идентификатор прочитанного сообщения
+    """
+    if record_read(chat_id, reader_id, message_id):
+        task = asyncio.create_task(flush_read_receipts(chat_id), name=f"read_receipts:{chat_id}")
+        read_flush_tasks.add(task)
+        task.add_done_callback(read_flush_tasks.discard)
+
+
+async def send_backlog(
+    websocket: WebSocket,
+    user_id: int,
+    chat_id: int,
+    db: AsyncSession,
+    after_seq: int | None = None,
+) -> int:
+    """
+    Отправляет по порядку пачками сообщения, которые пользователь ещё не подтвердил.
+    Клиент подтверждает получение событием {"type": "ack", "seq": N}
+
+    :param websocket: объект WebSocket-соединения
+    :param user_id: идентификатор пользователя
+    :param chat_id: идентификатор чата
+    :param db: сессия базы данных
+    :param after_seq: позиция, с которой досылать (по умолчанию — позиция доставки в БД)
+    :return: номер последнего отправленного (или уже доставленного) сообщения
+    """
+    if after_seq is None:
+        after_seq = await get_delivery_cursor(user_id, chat_id, db)
+    sent = 0
+    while sent < BACKLOG_MAX_MESSAGES:
+        batch = await fetch_backlog(chat_id, after_seq, BACKLOG_BATCH_SIZE, db)
+        if not batch:
+            break
+        await websocket.send_text(dumps_text({"type": "backlog", "messages": batch}))
+        sent += len(batch)
+        after_seq = batch[-1]["seq"]
+        if len(batch) < BACKLOG_BATCH_SIZE:
+            break
+    return after_seq
+
+
+async def send_session(websocket: WebSocket, session: WSSession) -> None:
+    """
+    Выдаёт соединению resume-токен и отправляет его клиенту кадром
+    {"type": "session", "resume_token": ..., "expires_in": ...}
+
+    :param websocket: объект WebSocket-соединения
+    :param session: состояние сессии
+    """
+    resume_token = issue_session(websocket, session)
+    await websocket.send_text(
+        dumps_text({"type": "session", "resume_token": resume_token, "expires_in": WS_RESUME_TTL})
+    )
+
+
+async def handle_event(
+    websocket: WebSocket, user: User, chat_id: int, data: dict, db: AsyncSession
+) -> bool:
+    """
+    Обрабатывает одно событие клиента: прочтение, подтверждение доставки или новое сообщение
+
+    :param websocket: объект WebSocket-соединения
+    :param user: текущий пользователь
+    :param chat_id: идентификатор чата
+    :param data: событие клиента
+    :param db: сессия базы данных
+    :return: False, если соединение закрыто и обработку нужно прекратить
+    """
+    event_type = data.get("type")
+
+    if event_type == "message_read":
+        message_id = data.get("message_id")
+        if isinstance(message_id, int):
+            if await mark_message_as_read(user.id, message_id, chat_id, db):
+                schedule_read_receipt(chat_id, user.id, message_id)
+
+    elif event_type == "ack":
+        seq = data.get("seq")
+        if isinstance(seq, int):
+            await ack_delivery(user.id, chat_id, seq, db)
+
+    elif event_type == "new_message":
+        text = data.get("text") or ""
+        client_id = data.get("client_id")
+        attachment_id = data.get("attachment_id")
+        attachment = None
+        if isinstance(attachment_id, int):
+            attachment = await get_uploaded_attachment(attachment_id, user.id, db)
+            if attachment is None:
+                return True
+        if not isinstance(client_id, str):
+            client_id = None
+        if not (text or attachment):
+            return True
+        # Проверка по кэшу: пользователь мог выйти из группы после подключения
+        if not await is_chat_member(user.id, chat_id, db):
+            active_connections.get(chat_id, set()).discard(websocket)
+            await websocket.close(code=1008)
+            return False
+
+        message = await save_new_message(chat_id, user, text, client_id, db, attachment)
+        if message:
+            message_data = message.model_dump()
+            payload = dumps_text({"type": "new_message", "message": message_data})
+            remember_message(chat_id, message_data)
+            mark_stage("fanout_started")
+            for conn in active_connections.get(chat_id, set()):
+                await conn.send_text(payload)
+                advance_session(conn, message.seq)
+            mark_stage("fanout_finished")
+
+    return True
+
 
 @ws_router.websocket("/ws/chat/{chat_id}")
-async def websocket_endpoint(websocket: WebSocket, chat_id: int, token: str) -> None:
+async def websocket_endpoint(
+    websocket: WebSocket, chat_id: int, token: str | None = None, resume: str | None = None
+) -> None:
     """
     Обработчик WebSocket-соединения для чата.
     Осуществляет:
-    - аутентификацию пользователя;
-    - отправку последних сообщений;
+    - перенаправление на узел-владелец чата при шардировании;
+    - аутентификацию пользователя и проверку членства в чате;
+    - отправку последних сообщений и resume-токена;
+    - доставку пачками сообщений, пропущенных с прошлого подтверждения (backlog);
+    - возобновление сессии по resume-токену без проверки JWT и загрузки истории;
     - приём новых сообщений и их рассылку;
-    - отметку сообщений как прочитанных.
+    - отметку сообщений как прочитанных и рассылку отметок пачками по окну.
 
     :param websocket: объект WebSocket-соединения
     :param chat_id: идентификатор чата
     :param token: JWT токен пользователя
+    :param resume: resume-токен прошлой сессии (вместо JWT)
     :return: None
     """
+    owner_url = chat_owner_url(chat_id)
+    if owner_url is not None:
+        # Закрытие до accept клиент видит как ошибку рукопожатия без причины
+        await websocket.accept()
+        await websocket.send_text(dumps_text({"type": "redirect", "url": owner_url}))
+        await websocket.close(code=REDIRECT_CLOSE_CODE)
+        return
+
+    # Сессия не обращается к БД до первого запроса
     db_gen = get_db_session()
     db: AsyncSession = await anext(db_gen)
     try:
-        user = await get_current_user_ws(token, db)
-        if user is None:
+        session = resume_session(resume, chat_id) if resume else None
+        if session is not None:
+            user = User(id=session.user_id, name=session.user_name)
+        else:
+            user = await get_current_user_ws(token, db) if token else None
+        # Для возобновлённой сессии членство проверяется по кэшу
+        if user is None or not await is_chat_member(user.id, chat_id, db):
             await websocket.close(code=1008)
             return
 
         await websocket.accept()
         active_connections.setdefault(chat_id, set()).add(websocket)
 
-        messages = await fetch_last_messages(chat_id, db)
-        await websocket.send_text(json.dumps([msg.model_dump() for msg in messages], default=str))
+        if session is not None:
+            chat_last_seq = await get_chat_last_seq(chat_id, db)
+            await send_session(websocket, session)
+            missed = replay_since(chat_id, session.last_seq, chat_last_seq)
+            if missed is None:
+                # Буфер воркера не покрывает пропуск: досылаем из БД
+                last_seq = await send_backlog(websocket, user.id, chat_id, db, session.last_seq)
+            elif missed:
+                await websocket.send_text(dumps_text({"type": "backlog", "messages": missed}))
+                last_seq = missed[-1]["seq"]
+            else:
+                last_seq = session.last_seq
+        else:
+            async with get_read_db(("message", user.id, chat_id), primary=db) as read_db:
+                messages = await fetch_last_messages(chat_id, read_db)
+            await websocket.send_text(dumps_text(messages))
+            history_seq = max((message["seq"] for message in messages), default=0)
+            await send_session(websocket, WSSession(user.id, user.name, chat_id, history_seq))
+            last_seq = await send_backlog(websocket, user.id, chat_id, db)
+        advance_session(websocket, last_seq)
 
+        profile_header = websocket.headers.get(PROFILE_HEADER)
         while True:
-            data = await websocket.receive_json()
-            event_type = data.get("type")
-
-            if event_type == "message_read":
-                message_id = data.get("message_id")
-                if message_id:
-                    await mark_message_as_read(user.id, message_id, db)
-                    for conn in active_connections.get(chat_id, set()):
-                        await conn.send_text(
-                            json.dumps({
-                                "type": "message_read",
-                                "message_id": message_id,
-                                "reader_id": user.id,
-                            })
-                        )
-
-            elif event_type == "new_message":
-                text = data.get("text")
-                client_id = data.get("client_id")
-                if not text or not client_id:
-                    continue
-
-                message = await save_new_message(chat_id, user, text, client_id, db)
-                if message:
-                    response_data = {
-                        "type": "new_message",
-                        "message": message.model_dump(),
-                    }
-                    for conn in active_connections.get(chat_id, set()):
-                        await conn.send_text(json.dumps(response_data, default=str))
+            raw = await websocket.receive_text()
+            received_ns = time.time_ns()
+            data = orjson.loads(raw)
+            name = f"ws {data.get('type')}"
+            current_handler.set(name)
+            trace = None
+            if data.get("type") == "new_message":
+                trace = MessageTrace(received_ns)
+                trace.mark("parsed")
+                trace.attributes.update(chat_id=chat_id, sender_id=user.id)
+            current_trace.set(trace)
+            async with maybe_profile(name, profile_header):
+                if not await handle_event(websocket, user, chat_id, data, db):
+                    return
+            if trace is not None:
+                trace.finish()
 
     except WebSocketDisconnect:
         active_connections.get(chat_id, set()).discard(websocket)
     finally:
+        release_session(websocket)
         await db_gen.aclose()
@@ -0,0 +1,34 @@
+from typing import Any
+
+from settings import (WS_DEFLATE_LEVEL, WS_DEFLATE_MEM_LEVEL,
+                      WS_DEFLATE_WINDOW_BITS)
+from uvicorn.protocols.websockets.websockets_impl import WebSocketProtocol
+from websockets.extensions.permessage_deflate import \
+    ServerPerMessageDeflateFactory
+
+
+def build_deflate_factory() -> ServerPerMessageDeflateFactory:
+    """
+    Создаёт фабрику расширения permessage-deflate с параметрами из настроек.
+    Размер окна ограничивает память на соединение, уровень — CPU на сообщение
+
+    :return: фабрика расширения permessage-deflate
+    """
+    return ServerPerMessageDeflateFactory(
+        server_max_window_bits=WS_DEFLATE_WINDOW_BITS,
+        client_max_window_bits=WS_DEFLATE_WINDOW_BITS,
+        compress_settings={"level": WS_DEFLATE_LEVEL, "memLevel": WS_DEFLATE_MEM_LEVEL},
+    )
+
+
+class DeflateWebSocketProtocol(WebSocketProtocol):
+    """
+    WebSocket-протокол uvicorn с настраиваемым permessage-deflate.
+    Штатный протокол включает расширение только с параметрами по умолчанию
+    (окно 32 КБ на каждое соединение), здесь они берутся из настроек
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        if self.config.ws_per_message_deflate:
+            self.available_extensions = [build_deflate_factory()]
@@ -1,100 +1,329 @@
-import json
+from datetime import datetime, timedelta, timezone
 from typing import Any
 
-from models import Message, MessageRead, User
-from schemas import MessageWithSender
-from sqlalchemy import join, select
-from sqlalchemy.dialects.postgresql import insert
+from cache import LRUCache
+from database import dialect_insert, mark_write
+from models import (Attachment, Chat, DeliveryCursor, IdempotencyKey, Message,
+                    MessageRead, User)
+from schemas import AttachmentRead, MessageWithSender
+from settings import IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_WINDOW_SECONDS
+from sqlalchemy import Result, Select, case, delete, func, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from tracing import mark_stage
+from user_names import get_user_names, user_names
 
+# Недавно принятые (sender_id, client_id): повторная отправка отсекается без обращения к БД.
+# Кэш только ускоряет проверку, корректность между воркерами и рестартами
+# обеспечивает первичный ключ idempotency_keys
+recent_client_ids = LRUCache(maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_WINDOW_SECONDS)
 
-async def fetch_last_messages(chat_id: int, db: AsyncSession) -> list[MessageWithSender]:
+# Метаданные вложения, которые отдаются вместе с сообщением (без содержимого файла)
+ATTACHMENT_COLUMNS = (Attachment.id, Attachment.filename, Attachment.content_type, Attachment.size)
+
+
+def messages_select() -> Select:
+    """
+    Строит запрос сообщений только по таблице messages (без join с users и attachments):
+    имя отправителя и метаданные вложения добавляет message_rows.
+    """
+    return select(
+        Message.id,
+        Message.chat_id,
+        Message.seq,
+        Message.sender_id,
+        Message.text,
+        Message.timestamp,
+        Message.is_read,
+        Message.attachment_id,
+    ).order_by(Message.seq.asc())
+
+
+async def message_rows(result: Result, db: AsyncSession) -> list[dict[str, Any]]:
+    """
+    Превращает строки messages_select в словари MessageWithSender: имена отправителей
+    берутся из кэша (промахи — одним запросом), вложения — одним запросом по id,
+    если они есть на странице.
+
+    :param result: результат выполнения запроса
+    :param db: сессия базы данных
+    :return: список сообщений
+    """
+    rows = [dict(row) for row in result.mappings()]
+    names = await get_user_names((row["sender_id"] for row in rows), db)
+    attachment_ids = {row["attachment_id"] for row in rows if row["attachment_id"] is not None}
+    attachments = {}
+    if attachment_ids:
+        attachments = {
+            row["id"]: dict(row)
+            for row in (
+                await db.execute(
+                    select(*ATTACHMENT_COLUMNS).where(Attachment.id.in_(attachment_ids))
+                )
+            ).mappings()
+        }
+    for row in rows:
+        row["sender_name"] = names[row["sender_id"]]
+        row["attachment"] = attachments.get(row.pop("attachment_id"))
+    return rows
+
+
+async def fetch_last_messages(chat_id: int, db: AsyncSession) -> list[dict[str, Any]]:
     """
     Получить последние 50 сообщений в чате по его ID.
+    Строки возвращаются словарями в формате MessageWithSender без валидации
 
     :param chat_id: идентификатор чата
     :param db: сессия базы данных
-    :return: список сообщений с данными отправителя
+    :return: список сообщений с данными отправителя в порядке seq
     """
-    result = await db.execute(
-        select(
-            Message.id,
-            Message.chat_id,
-            Message.sender_id,
-            User.name.label("sender_name"),
-            Message.text,
-            Message.timestamp,
-            Message.is_read,
-        )
-        .select_from(join(Message, User, Message.sender_id == User.id))
+    # Последние 50 — с конца по убыванию seq, затем страница разворачивается
+    stmt = (
+        messages_select()
         .where(Message.chat_id == chat_id)
-        .order_by(Message.timestamp.asc())
+        .order_by(None)
+        .order_by(Message.seq.desc())
         .limit(50)
     )
-    return [
-        MessageWithSender(
-            id=row.id,
-            chat_id=row.chat_id,
-            sender_id=row.sender_id,
-            sender_name=row.sender_name,
-            text=row.text,
-            timestamp=row.timestamp,
-            is_read=row.is_read,
+    rows = await message_rows(await db.execute(stmt), db)
+    rows.reverse()
+    return rows
+
+
+async def fetch_backlog(
+    chat_id: int, after_seq: int, limit: int, db: AsyncSession
+) -> list[dict[str, Any]]:
+    """
+    Получить очередную пачку недоставленных сообщений (seq > after_seq).
+
+    :param chat_id: идентификатор чата
+    :param after_seq: последний доставленный порядковый номер
+    :param limit: размер пачки
+    :param db: сессия базы данных
+    :return: список сообщений в порядке seq
+    """
+    result = await db.execute(
+        messages_select()
+        .where(Message.chat_id == chat_id, Message.seq > after_seq)
+        .limit(limit)
+    )
+    return await message_rows(result, db)
+
+
+async def get_delivery_cursor(user_id: int, chat_id: int, db: AsyncSession) -> int:
+    """
+    Получить позицию доставки пользователя в чате.
+    При первом подключении позиция создаётся на последнем сообщении чата:
+    история загружается обычным способом, а в очередь попадает всё новое.
+
+    :param user_id: идентификатор пользователя
+    :param chat_id: идентификатор чата
+    :param db: сессия базы данных
+    :return: последний подтверждённый порядковый номер
+    """
+    delivered_seq = (
+        await db.execute(
+            select(DeliveryCursor.delivered_seq).where(
+                DeliveryCursor.user_id == user_id, DeliveryCursor.chat_id == chat_id
+            )
         )
-        for row in result
-    ]
+    ).scalar_one_or_none()
+    if delivered_seq is not None:
+        return delivered_seq
+
+    last_seq = await get_chat_last_seq(chat_id, db)
+    await db.execute(
+        dialect_insert(DeliveryCursor)
+        .values(user_id=user_id, chat_id=chat_id, delivered_seq=last_seq)
+        .on_conflict_do_nothing()
+    )
+    await db.commit()
+    return last_seq
+
+
+async def get_chat_last_seq(chat_id: int, db: AsyncSession) -> int:
+    """
+    Последний выданный порядковый номер сообщения в чате (чтение по первичному ключу)
+
+    :param chat_id: идентификатор чата
+    :param db: сессия базы данных
+    :return: Chat.last_seq или 0, если чата нет
+    """
+    return (
+        await db.execute(select(Chat.last_seq).where(Chat.id == chat_id))
+    ).scalar_one_or_none() or 0
+
+
+async def ack_delivery(user_id: int, chat_id: int, seq: int, db: AsyncSession) -> None:
+    """
+    Подтвердить доставку сообщений до seq включительно (позиция только растёт).
+    Позиция не выходит за последний номер чата: иначе подтверждение «из будущего»
+    скрыло бы от пользователя все следующие сообщения.
+
+    :param user_id: идентификатор пользователя
+    :param chat_id: идентификатор чата
+    :param seq: последний полученный клиентом порядковый номер
+    :param db: сессия базы данных
+    """
+    if seq < 0:
+        return
+    last_seq = func.coalesce(
+        select(Chat.last_seq).where(Chat.id == chat_id).scalar_subquery(), 0
+    )
+    stmt = dialect_insert(DeliveryCursor).values(
+        user_id=user_id,
+        chat_id=chat_id,
+        delivered_seq=case((last_seq < seq, last_seq), else_=seq),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DeliveryCursor.user_id, DeliveryCursor.chat_id],
+        set_={"delivered_seq": stmt.excluded.delivered_seq},
+        where=DeliveryCursor.delivered_seq < stmt.excluded.delivered_seq,
+    )
+    await db.execute(stmt)
+    await db.commit()
+
+
+async def get_uploaded_attachment(
+    attachment_id: int, user_id: int, db: AsyncSession
+) -> Attachment | None:
+    """
+    Получить вложение для отправки: прикрепить можно только свою загрузку.
+
+    :param attachment_id: идентификатор вложения
+    :param user_id: идентификатор отправителя
+    :param db: сессия базы данных
+    :return: вложение или None
+    """
+    attachment = await db.get(Attachment, attachment_id)
+    if attachment is None or attachment.uploader_id != user_id:
+        return None
+    return attachment
 
 
 async def save_new_message(
-    chat_id: int, user: User, text: str, client_id: str, db: AsyncSession
+    chat_id: int,
+    user: User,
+    text: str,
+    client_id: str | None,
+    db: AsyncSession,
+    attachment: Attachment | None = None,
 ) -> MessageWithSender | None:
     """
     Сохранить новое сообщение в базу, если оно ещё не было отправлено (по client_id).
+    Идемпотентность ограничена отправителем: ключ (sender_id, client_id) вставляется
+    в той же транзакции, что и сообщение, и заменяет предварительный SELECT.
+    Сообщение без client_id (старые клиенты) сохраняется без проверки на повтор.
 
     :param chat_id: идентификатор чата
     :param user: объект текущего пользователя
     :param text: текст сообщения
-    :param client_id: уникальный идентификатор сообщения от клиента
+    :param client_id: уникальный идентификатор сообщения от клиента (необязательно)
     :param db: сессия базы данных
+    :param attachment: загруженное вложение (необязательно)
     :return: сообщение с данными отправителя или None, если дубликат
     """
-    existing = await db.execute(select(Message).where(Message.client_id == client_id))
-    if existing.scalar_one_or_none():
-        return None
+    key = (user.id, client_id)
+    if client_id:
+        if key in recent_client_ids:
+            return None
+
+        inserted = await db.execute(
+            dialect_insert(IdempotencyKey)
+            .values(sender_id=user.id, client_id=client_id)
+            .on_conflict_do_nothing()
+            .returning(IdempotencyKey.sender_id)
+        )
+        if inserted.first() is None:
+            # Ключ уже есть в БД: повтор, принятый другим воркером или до рестарта
+            await db.commit()
+            recent_client_ids.set(key, True)
+            return None
 
     new_msg = Message(
         chat_id=chat_id,
         sender_id=user.id,
         text=text,
         client_id=client_id,
+        attachment_id=attachment.id if attachment else None,
     )
     db.add(new_msg)
+    await db.flush()
+    mark_stage("persisted")
     await db.commit()
-    await db.refresh(new_msg)
+    mark_stage("committed")
+    if client_id:
+        recent_client_ids.set(key, True)
+    mark_write(("message", user.id, chat_id))
 
     return MessageWithSender(
         id=new_msg.id,
         chat_id=new_msg.chat_id,
+        seq=new_msg.seq,
         sender_id=new_msg.sender_id,
-        sender_name=user.name,
+        # Имя из кэша: соединение могло открыться до переименования пользователя
+        sender_name=user_names.get(user.id, user.name),
         text=new_msg.text,
         timestamp=new_msg.timestamp,
         is_read=new_msg.is_read,
+        attachment=AttachmentRead.model_validate(attachment) if attachment else None,
     )
 
 
-async def mark_message_as_read(user_id: int, message_id: int, db: AsyncSession) -> bool:
+async def mark_message_as_read(
+    user_id: int, message_id: int, chat_id: int, db: AsyncSession
+) -> bool:
     """
     Отметить сообщение как прочитанное для конкретного пользователя.
+    Отметка принимается только для сообщения этого чата: иначе участник одного
+    чата мог бы рассылать в него отметки о чужих или несуществующих сообщениях.
 
     :param user_id: идентификатор пользователя
     :param message_id: идентификатор сообщения
+    :param chat_id: чат, в котором пользователь прочитал сообщение
     :param db: сессия базы данных
-    :return: True при успешной записи
+    :return: True при успешной записи, False — если сообщения нет в этом чате
     """
+    in_chat = await db.scalar(
+        select(Message.id).where(Message.id == message_id, Message.chat_id == chat_id)
+    )
+    if in_chat is None:
+        return False
     stmt = (
-        insert(MessageRead).values(user_id=user_id, message_id=message_id).on_conflict_do_nothing()
+        dialect_insert(MessageRead)
+        .values(user_id=user_id, message_id=message_id)
+        .on_conflict_do_nothing()
     )
     await db.execute(stmt)
     await db.commit()
     return True
+
+
+async def count_message_reads(message_ids: list[int], db: AsyncSession) -> dict[int, int]:
+    """
+    Число прочитавших для каждого из сообщений одним запросом.
+
+    :param message_ids: идентификаторы сообщений
+    :param db: сессия базы данных
+    :return: словарь message_id -> число отметок прочтения
+    """
+    rows = await db.execute(
+        select(MessageRead.message_id, func.count())
+        .where(MessageRead.message_id.in_(message_ids))
+        .group_by(MessageRead.message_id)
+    )
+    counts = dict.fromkeys(message_ids, 0)
+    counts.update(rows.all())
+    return counts
+
+
+async def purge_idempotency_keys(db: AsyncSession) -> int:
+    """
+    Удалить ключи идемпотентности старше окна хранения.
+
+    :param db: сессия базы данных
+    :return: количество удалённых ключей
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=IDEMPOTENCY_WINDOW_SECONDS)
+    result = await db.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff))
+    await db.commit()
+    return result.rowcount
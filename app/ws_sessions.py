@@ -0,0 +1,123 @@
+import secrets
+from collections import deque
+from dataclasses import dataclass
+from typing import Any
+
+from cache import LRUCache
+from fastapi import WebSocket
+from settings import WS_REPLAY_BUFFER, WS_RESUME_TTL, WS_SESSION_CACHE_SIZE
+
+
+@dataclass
+class WSSession:
+    """
+    Состояние WebSocket-сессии, достаточное для возобновления без БД:
+    кто подключён, к какому чату и до какого seq клиент получил сообщения
+    """
+
+    user_id: int
+    user_name: str
+    chat_id: int
+    last_seq: int
+
+
+# resume-токен -> сессия. Токены одноразовые и живут WS_RESUME_TTL секунд
+# с момента выдачи или отключения; хранятся в памяти воркера
+sessions = LRUCache(maxsize=WS_SESSION_CACHE_SIZE, ttl=WS_RESUME_TTL)
+# Сессия открытого соединения: позиция обновляется при каждой отправке сообщения
+connection_sessions: dict[WebSocket, tuple[str, WSSession]] = {}
+# chat_id -> последние разосланные сообщения для досылки при возобновлении
+recent_messages: dict[int, deque[dict[str, Any]]] = {}
+
+
+def issue_session(websocket: WebSocket, session: WSSession) -> str:
+    """
+    Выдаёт новый resume-токен для соединения
+
+    :param websocket: объект WebSocket-соединения
+    :param session: состояние сессии
+    :return: resume-токен
+    """
+    token = secrets.token_urlsafe(24)
+    sessions.set(token, session)
+    connection_sessions[websocket] = (token, session)
+    return token
+
+
+def resume_session(token: str, chat_id: int) -> WSSession | None:
+    """
+    Забирает сессию по resume-токену (токен после этого недействителен)
+
+    :param token: resume-токен
+    :param chat_id: чат, к которому переподключается клиент
+    :return: сессия или None, если токен неизвестен, истёк или выдан для другого чата
+    """
+    session = sessions.get(token)
+    if session is None or session.chat_id != chat_id:
+        return None
+    sessions.discard(token)
+    return session
+
+
+def release_session(websocket: WebSocket) -> None:
+    """
+    Отвязывает сессию от закрытого соединения; срок жизни токена отсчитывается заново
+
+    :param websocket: объект WebSocket-соединения
+    """
+    item = connection_sessions.pop(websocket, None)
+    if item is not None:
+        token, session = item
+        if token in sessions:
+            sessions.set(token, session)
+
+
+def advance_session(websocket: WebSocket, seq: int) -> None:
+    """
+    Запоминает, что соединению доставлено сообщение с номером seq
+
+    :param websocket: объект WebSocket-соединения
+    :param seq: номер сообщения в чате
+    """
+    item = connection_sessions.get(websocket)
+    if item is not None and seq > item[1].last_seq:
+        item[1].last_seq = seq
+
+
+def remember_message(chat_id: int, message: dict[str, Any]) -> None:
+    """
+    Добавляет разосланное сообщение в кольцевой буфер чата
+
+    :param chat_id: идентификатор чата
+    :param message: сообщение в формате MessageWithSender
+    """
+    buffer = recent_messages.get(chat_id)
+    if buffer is None:
+        buffer = recent_messages[chat_id] = deque(maxlen=WS_REPLAY_BUFFER)
+    buffer.append(message)
+
+
+def replay_since(
+    chat_id: int, last_seq: int, chat_last_seq: int
+) -> list[dict[str, Any]] | None:
+    """
+    Сообщения чата после last_seq из кольцевого буфера
+
+    :param chat_id: идентификатор чата
+    :param last_seq: последний доставленный клиенту номер
+    :param chat_last_seq: последний номер сообщения чата в БД (Chat.last_seq)
+    :return: список сообщений или None, если буфер не покрывает пропуск (нужна БД)
+    """
+    buffer = recent_messages.get(chat_id, ())
+    # Параллельные отправки могут разослаться не по порядку seq
+    missed = sorted(
+        (message for message in buffer if message["seq"] > last_seq),
+        key=lambda message: message["seq"],
+    )
+    # В буфере только сообщения этого воркера: досылать из него можно, лишь если
+    # он содержит весь диапазон до последнего номера чата без дыр (сообщения
+    # других воркеров или ещё не разосланные сюда остаются только в БД)
+    expected = range(last_seq + 1, chat_last_seq + 1)
+    if [message["seq"] for message in missed] != list(expected):
+        return None
+    return missed
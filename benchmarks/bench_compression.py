@@ -0,0 +1,100 @@
+"""
+Оценка объёма и стоимости сжатия стартовой истории чата.
+
+Моделирует «шторм переподключений»: каждое подключение создаёт новый контекст
+permessage-deflate и сжимает первый кадр с последними 50 сообщениями, как это
+делает websocket_endpoint. Для /history сравниваются gzip и brotli.
+
+Запуск: python benchmarks/bench_compression.py [--connects 2000] [--text-size 2000]
+"""
+
+import argparse
+import gzip
+import json
+import random
+import string
+import time
+import zlib
+from datetime import datetime, timezone
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+
+def build_history(count: int, text_size: int) -> bytes:
+    rnd = random.Random(42)
+    words = ["".join(rnd.choices(string.ascii_lowercase, k=rnd.randint(2, 9))) for _ in range(500)]
+    messages = []
+    for i in range(count):
+        text = ""
+        while len(text) < text_size:
+            text += rnd.choice(words) + " "
+        messages.append({
+            "id": i + 1,
+            "chat_id": 1,
+            "sender_id": rnd.randint(1, 5),
+            "sender_name": rnd.choice(["Alice", "Bob", "Carol", "Dave"]),
+            "text": text,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "is_read": False,
+        })
+    return json.dumps(messages).encode("utf-8")
+
+
+def bench_ws(payload: bytes, connects: int, window_bits: int, level: int) -> tuple[int, float]:
+    started = time.process_time()
+    size = 0
+    for _ in range(connects):
+        # Новый контекст на каждое соединение, как при permessage-deflate без takeover
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -window_bits, 5)
+        data = compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        size = len(data) - 4
+    return size, (time.process_time() - started) / connects * 1e6
+
+
+def bench_http(payload: bytes, connects: int, encoding: str, level: int) -> tuple[int, float]:
+    started = time.process_time()
+    size = 0
+    for _ in range(connects):
+        if encoding == "br":
+            data = brotli.compress(payload, quality=level)
+        else:
+            data = gzip.compress(payload, compresslevel=level, mtime=0)
+        size = len(data)
+    return size, (time.process_time() - started) / connects * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connects", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--text-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    payload = build_history(args.messages, args.text_size)
+    print(f"history frame: {len(payload)} bytes, {args.connects} connects\n")
+    print(f"{'mode':<28}{'bytes':>10}{'ratio':>8}{'cpu us/connect':>16}")
+    print(f"{'uncompressed':<28}{len(payload):>10}{1:>8.2f}{0:>16.1f}")
+    for window_bits in (9, 12, 15):
+        for level in (1, 6, 9):
+            size, cpu = bench_ws(payload, args.connects, window_bits, level)
+            name = f"ws deflate w={window_bits} l={level}"
+            print(f"{name:<28}{size:>10}{len(payload) / size:>8.2f}{cpu:>16.1f}")
+    for level in (1, 6):
+        size, cpu = bench_http(payload, args.connects, "gzip", level)
+        name = f"http gzip l={level}"
+        print(f"{name:<28}{size:>10}{len(payload) / size:>8.2f}{cpu:>16.1f}")
+    if brotli is not None:
+        for quality in (4, 5, 8):
+            size, cpu = bench_http(payload, args.connects, "br", quality)
+            name = f"http br q={quality}"
+            print(f"{name:<28}{size:>10}{len(payload) / size:>8.2f}{cpu:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
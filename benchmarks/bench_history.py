@@ -0,0 +1,136 @@
+"""
+Задержка чтения страницы истории: прежний запрос с join users (имя отправителя
+в каждой строке) против запроса только по messages с кэшем имён.
+
+Скрипт создаёт чат с --messages сообщениями от --users отправителей в БД из
+DATABASE_URL (или берёт существующий чат через --chat) и читает страницы по
+--limit сообщений после случайного seq (как догрузка по after_seq).
+
+Запуск: python benchmarks/bench_history.py --messages 200000 --users 1000
+"""
+
+import argparse
+import asyncio
+import pathlib
+import random
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "app"))
+
+from database import engine, get_db  # noqa: E402
+from models import Attachment, Chat, Message, User  # noqa: E402
+from sqlalchemy import func, insert, join, select  # noqa: E402
+from user_names import user_names  # noqa: E402
+from ws_queries import (ATTACHMENT_COLUMNS, message_rows,  # noqa: E402
+                        messages_select)
+
+
+def join_select():
+    """Прежний запрос истории: messages join users left join attachments"""
+    return (
+        select(
+            Message.id,
+            Message.chat_id,
+            Message.seq,
+            Message.sender_id,
+            User.name.label("sender_name"),
+            Message.text,
+            Message.timestamp,
+            Message.is_read,
+            *(column.label(f"attachment_{column.key}") for column in ATTACHMENT_COLUMNS),
+        )
+        .select_from(
+            join(Message, User, Message.sender_id == User.id).outerjoin(
+                Attachment, Message.attachment_id == Attachment.id
+            )
+        )
+        .order_by(Message.seq.asc())
+    )
+
+
+async def seed(messages: int, users: int) -> int:
+    async with get_db() as db:
+        prefix = uuid.uuid4().hex[:8]
+        user_ids = (
+            await db.execute(
+                insert(User).returning(User.id),
+                [
+                    {"name": f"user {i}", "email": f"{prefix}_{i}@bench.local", "password_hash": ""}
+                    for i in range(users)
+                ],
+            )
+        ).scalars().all()
+        chat = Chat(name="bench history", type="personal", last_seq=messages)
+        db.add(chat)
+        await db.flush()
+        for start in range(0, messages, 10000):
+            await db.execute(
+                insert(Message),
+                [
+                    {
+                        "chat_id": chat.id,
+                        "sender_id": random.choice(user_ids),
+                        "seq": seq + 1,
+                        "text": "Привет! Как дела? " * 3,
+                    }
+                    for seq in range(start, min(start + 10000, messages))
+                ],
+            )
+        await db.commit()
+        return chat.id
+
+
+async def measure(chat_id: int, limit: int, requests: int) -> None:
+    async with get_db() as db:
+        total = await db.scalar(select(func.count()).where(Message.chat_id == chat_id))
+        offsets = [random.randrange(max(1, total - limit)) for _ in range(requests)]
+
+        async def with_join(offset: int) -> None:
+            stmt = join_select().where(Message.chat_id == chat_id, Message.seq > offset)
+            stmt = stmt.limit(limit)
+            [dict(row) for row in (await db.execute(stmt)).mappings()]
+
+        async def with_cache(offset: int) -> None:
+            stmt = messages_select().where(Message.chat_id == chat_id, Message.seq > offset)
+            stmt = stmt.limit(limit)
+            await message_rows(await db.execute(stmt), db)
+
+        print(f"messages in chat: {total}, page: {limit}, requests: {requests}")
+        for name, read_page in (("join users", with_join), ("name cache", with_cache)):
+            user_names.clear()
+            for offset in offsets[:20]:
+                await read_page(offset)
+            latencies = []
+            for offset in offsets:
+                started = time.perf_counter()
+                await read_page(offset)
+                latencies.append(time.perf_counter() - started)
+            latencies.sort()
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            print(
+                f"{name:>11}: p50={statistics.median(latencies) * 1000:.2f} ms "
+                f"p95={p95 * 1000:.2f} ms"
+            )
+
+
+async def run(args: argparse.Namespace) -> None:
+    chat_id = args.chat or await seed(args.messages, args.users)
+    await measure(chat_id, args.limit, args.requests)
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chat", type=int, default=None, help="существующий чат")
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Сравнение прежнего и быстрого пути сериализации страницы истории.
+
+Прежний путь: модель MessageWithSender на каждую строку, повторная валидация
+по response_model, сериализация в JSON-совместимые данные и json.dumps.
+Быстрый путь: словарь строки БД сразу кодируется orjson (FastJSONResponse).
+
+Запуск: python benchmarks/bench_serialization.py
+"""
+
+import json
+import pathlib
+import sys
+import timeit
+from datetime import datetime, timezone
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "app"))
+
+from pydantic import TypeAdapter  # noqa: E402
+from responses import dumps  # noqa: E402
+from schemas import MessageWithSender  # noqa: E402
+
+response_adapter = TypeAdapter(list[MessageWithSender])
+
+
+def build_rows(count: int) -> list[dict]:
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "id": i,
+            "chat_id": 1,
+            "sender_id": i % 7,
+            "sender_name": f"user {i % 7}",
+            "text": "Привет! Как дела? " * 5,
+            "timestamp": now,
+            "is_read": False,
+        }
+        for i in range(count)
+    ]
+
+
+def old_path(rows: list[dict]) -> bytes:
+    models = [MessageWithSender(**row) for row in rows]
+    validated = response_adapter.validate_python(models, from_attributes=True)
+    content = response_adapter.dump_python(validated, mode="json")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def fast_path(rows: list[dict]) -> bytes:
+    return dumps([dict(row) for row in rows])
+
+
+def main() -> None:
+    print(f"{'rows':>6}{'old, ms':>12}{'fast, ms':>12}{'speedup':>10}")
+    for count in (50, 500, 5000):
+        rows = build_rows(count)
+        number = max(1, 20000 // count)
+        old = min(timeit.repeat(lambda: old_path(rows), number=number, repeat=5)) / number
+        fast = min(timeit.repeat(lambda: fast_path(rows), number=number, repeat=5)) / number
+        print(f"{count:>6}{old * 1000:>12.3f}{fast * 1000:>12.3f}{old / fast:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
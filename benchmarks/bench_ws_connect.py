@@ -0,0 +1,84 @@
+"""
+Нагрузочный тест подключений к /ws/chat/{chat_id} («шторм переподключений»).
+
+Открывает N соединений с заданной параллельностью, дожидается кадра session
+(после истории чата или досылки при возобновлении) и закрывает соединение.
+Печатает скорость подключений и перцентили.
+
+С флагом --resume каждый поток один раз подключается по JWT, а дальше
+переподключается по resume-токену из предыдущего соединения (без БД на сервере).
+
+Запуск (сервер должен быть запущен):
+    python benchmarks/bench_ws_connect.py --token <JWT> --chat 1 --connections 500
+    python benchmarks/bench_ws_connect.py --token <JWT> --chat 1 --connections 500 --resume
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import websockets
+
+
+async def connect_once(url: str, latencies: list[float]) -> str:
+    started = time.perf_counter()
+    async with websockets.connect(url) as ws:
+        while True:
+            frame = json.loads(await ws.recv())
+            if isinstance(frame, dict) and frame.get("type") == "session":
+                break
+    latencies.append(time.perf_counter() - started)
+    return frame["resume_token"]
+
+
+async def run(
+    base_url: str, token: str, connections: int, concurrency: int, resume: bool
+) -> None:
+    latencies: list[float] = []
+    per_worker = [connections // concurrency] * concurrency
+    for i in range(connections % concurrency):
+        per_worker[i] += 1
+
+    async def worker(count: int) -> None:
+        # Первое подключение по JWT в замер не входит, если проверяется возобновление
+        resume_token = await connect_once(f"{base_url}?token={token}", []) if resume else None
+        for _ in range(count):
+            if resume_token:
+                url = f"{base_url}?resume={resume_token}"
+            else:
+                url = f"{base_url}?token={token}"
+            new_token = await connect_once(url, latencies)
+            if resume:
+                resume_token = new_token
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(worker(n) for n in per_worker), return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    errors = sum(isinstance(r, Exception) for r in results)
+
+    latencies.sort()
+    mode = "resume" if resume else "full"
+    print(f"mode: {mode}, connections: {connections}, concurrency: {concurrency}, errors: {errors}")
+    print(f"rate: {len(latencies) / elapsed:.0f} connects/s")
+    if latencies:
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(f"latency ms: p50={statistics.median(latencies) * 1000:.1f} p95={p95 * 1000:.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="ws://127.0.0.1:8000")
+    parser.add_argument("--token", required=True)
+    parser.add_argument("--chat", type=int, required=True)
+    parser.add_argument("--connections", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--resume", action="store_true")
+    args = parser.parse_args()
+    base_url = f"{args.host}/ws/chat/{args.chat}"
+    asyncio.run(run(base_url, args.token, args.connections, args.concurrency, args.resume))
+
+
+if __name__ == "__main__":
+    main()
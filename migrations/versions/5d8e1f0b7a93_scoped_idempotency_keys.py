@@ -0,0 +1,46 @@
+"""scoped idempotency keys
+
+Revision ID: 5d8e1f0b7a93
+Revises: 0a6f3c9e4d12
+Create Date: 2025-04-09 16:47:12.903114
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '5d8e1f0b7a93'
+down_revision: Union[str, None] = '0a6f3c9e4d12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('idempotency_keys',
+    sa.Column('sender_id', sa.Integer(), nullable=False),
+    sa.Column('client_id', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['sender_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('sender_id', 'client_id')
+    )
+    op.create_index(op.f('ix_idempotency_keys_created_at'), 'idempotency_keys', ['created_at'], unique=False)
+    # Переносим ключи сообщений, отправленных в пределах окна хранения (сутки)
+    op.execute(
+        """
+        INSERT INTO idempotency_keys (sender_id, client_id, created_at)
+        SELECT sender_id, client_id, timestamp FROM messages
+        WHERE client_id IS NOT NULL AND timestamp > now() - interval '1 day'
+        ON CONFLICT DO NOTHING
+        """
+    )
+    op.drop_constraint('messages_client_id_key', 'messages', type_='unique')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_unique_constraint('messages_client_id_key', 'messages', ['client_id'])
+    op.drop_index(op.f('ix_idempotency_keys_created_at'), table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
@@ -0,0 +1,44 @@
+"""recreate message_reads
+
+Revision ID: a1c5e8f3b604
+Revises: d9a4c7e2f518
+Create Date: 2025-04-20 11:02:17.514388
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1c5e8f3b604'
+down_revision: Union[str, None] = 'd9a4c7e2f518'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # f0e623c260ec удалила таблицу, а модель MessageRead осталась; в БД, где
+    # таблицу уже создал create_all, создаётся только недостающий индекс
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('message_reads'):
+        op.create_table('message_reads',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('message_id', sa.Integer(), nullable=False),
+        sa.Column('read_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['message_id'], ['messages.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id', 'message_id')
+        )
+        indexes = set()
+    else:
+        indexes = {index['name'] for index in inspector.get_indexes('message_reads')}
+    if 'ix_message_reads_message_id' not in indexes:
+        op.create_index('ix_message_reads_message_id', 'message_reads', ['message_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_message_reads_message_id', table_name='message_reads')
+    op.drop_table('message_reads')
@@ -0,0 +1,31 @@
+"""job runs
+
+Revision ID: b3d7f2a9c6e1
+Revises: a1c5e8f3b604
+Create Date: 2025-04-22 10:14:36.802941
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3d7f2a9c6e1'
+down_revision: Union[str, None] = 'a1c5e8f3b604'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('job_runs',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('job_runs')
@@ -0,0 +1,44 @@
+"""attachments
+
+Revision ID: b7e3a91d2c45
+Revises: 5d8e1f0b7a93
+Create Date: 2025-04-11 12:05:37.418265
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3a91d2c45'
+down_revision: Union[str, None] = '5d8e1f0b7a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('attachments',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('uploader_id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(), nullable=False),
+    sa.Column('content_type', sa.String(), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('storage_key', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['uploader_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_attachments_sha256'), 'attachments', ['sha256'], unique=False)
+    op.add_column('messages', sa.Column('attachment_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('messages_attachment_id_fkey', 'messages', 'attachments', ['attachment_id'], ['id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('messages_attachment_id_fkey', 'messages', type_='foreignkey')
+    op.drop_column('messages', 'attachment_id')
+    op.drop_index(op.f('ix_attachments_sha256'), table_name='attachments')
+    op.drop_table('attachments')
@@ -0,0 +1,27 @@
+"""index messages chat_id id
+
+Revision ID: c4e1a9d27b3f
+Revises: 8d23a6ca1ab9
+Create Date: 2025-04-02 12:10:31.804512
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e1a9d27b3f'
+down_revision: Union[str, None] = '8d23a6ca1ab9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_messages_chat_id_id', 'messages', ['chat_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_messages_chat_id_id', table_name='messages')
@@ -0,0 +1,32 @@
+"""chat retention days
+
+Revision ID: d9a4c7e2f518
+Revises: b7e3a91d2c45
+Create Date: 2025-04-14 10:21:48.230117
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9a4c7e2f518'
+down_revision: Union[str, None] = 'b7e3a91d2c45'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chats', sa.Column('retention_days', sa.Integer(), nullable=True))
+    # message_reads создаётся через create_all (миграции её удалили в f0e623c260ec)
+    if sa.inspect(op.get_bind()).has_table('message_reads'):
+        op.create_index('ix_message_reads_message_id', 'message_reads', ['message_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if sa.inspect(op.get_bind()).has_table('message_reads'):
+        op.drop_index('ix_message_reads_message_id', table_name='message_reads')
+    op.drop_column('chats', 'retention_days')
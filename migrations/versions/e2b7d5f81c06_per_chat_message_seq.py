@@ -0,0 +1,50 @@
+"""per chat message seq
+
+Revision ID: e2b7d5f81c06
+Revises: c4e1a9d27b3f
+Create Date: 2025-04-05 18:22:07.511938
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b7d5f81c06'
+down_revision: Union[str, None] = 'c4e1a9d27b3f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chats', sa.Column('last_seq', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('messages', sa.Column('seq', sa.Integer(), nullable=True))
+    # Нумеруем существующие сообщения в порядке отправки внутри каждого чата
+    op.execute(
+        """
+        UPDATE messages AS m SET seq = numbered.rn
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY chat_id ORDER BY timestamp, id) AS rn
+            FROM messages
+        ) AS numbered
+        WHERE m.id = numbered.id
+        """
+    )
+    op.execute(
+        """
+        UPDATE chats SET last_seq = COALESCE(
+            (SELECT max(seq) FROM messages WHERE messages.chat_id = chats.id), 0
+        )
+        """
+    )
+    op.alter_column('messages', 'seq', existing_type=sa.Integer(), nullable=False)
+    op.create_unique_constraint('uq_messages_chat_id_seq', 'messages', ['chat_id', 'seq'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_messages_chat_id_seq', 'messages', type_='unique')
+    op.drop_column('messages', 'seq')
+    op.drop_column('chats', 'last_seq')
@@ -1,21 +1,74 @@
-import asyncio
-
+# ruff: noqa: E402
+import os
+
+# Без внешних сервисов тесты идут на SQLite в памяти; для Postgres задайте DATABASE_URL.
+# У каждого воркера pytest-xdist своя схема Postgres (SQLite в памяти и так своя у процесса)
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+os.environ.setdefault("DATABASE_SCHEMA", f"test_{os.getenv('PYTEST_XDIST_WORKER', 'main')}")
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+import database
 import pytest
 import pytest_asyncio
+from database import engine, recent_writes
 from httpx import ASGITransport, AsyncClient
-from main import app
-
-
-@pytest.fixture(scope="session")
-def event_loop():
+from main import app, create_tables
+from membership import membership_cache
+from read_receipts import pending_reads
+from settings import DATABASE_SCHEMA
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from user_names import user_names
+from ws_queries import recent_client_ids
+from ws_sessions import connection_sessions, recent_messages, sessions
+
+
+@pytest_asyncio.fixture(scope="session", autouse=True)
+async def database_schema():
+    """
+    Создаёт таблицы в тестовой БД один раз на процесс; схема воркера в Postgres
+    удаляется после прогона
+    """
+    if engine.dialect.name == "postgresql":
+        async with engine.begin() as conn:
+            await conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{DATABASE_SCHEMA}"'))
+    await create_tables()
+    yield
+    if engine.dialect.name == "postgresql":
+        async with engine.begin() as conn:
+            await conn.execute(text(f'DROP SCHEMA "{DATABASE_SCHEMA}" CASCADE'))
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def db_connection(monkeypatch):
     """
-    Создаёт новый event loop для асинхронных тестов (scope: session)
+    Изолирует тест: все сессии приложения работают в одной внешней транзакции,
+    их commit/rollback становятся SAVEPOINT, а после теста транзакция откатывается.
+    Кэши процесса очищаются: после отката id в БД могут повториться
 
-    :return: объект asyncio event loop
+    :return: соединение с открытой транзакцией
     """
-    loop = asyncio.get_event_loop_policy().new_event_loop()
-    yield loop
-    loop.close()
+    for cache in (membership_cache, user_names, recent_writes, recent_client_ids, sessions):
+        cache.clear()
+    connection_sessions.clear()
+    recent_messages.clear()
+    pending_reads.clear()
+
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        session_factory = async_sessionmaker(
+            conn,
+            class_=AsyncSession,
+            expire_on_commit=False,
+            join_transaction_mode="create_savepoint",
+        )
+        monkeypatch.setattr(database, "AsyncSessionLocal", session_factory)
+        monkeypatch.setattr(database, "ReadSessionLocal", session_factory)
+        yield conn
+        await transaction.rollback()
 
 
 @pytest.fixture
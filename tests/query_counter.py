@@ -0,0 +1,73 @@
+import re
+from collections import Counter
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# Служебные команды транзакций (в тестах — SAVEPOINT внешней транзакции) не считаются
+TRANSACTION_STATEMENT = re.compile(
+    r"^\s*(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE)\b", re.IGNORECASE
+)
+# Списки параметров IN (...) и числовые литералы не меняют форму запроса
+PARAMETER_LIST = re.compile(r"\((?:\s*(?:\?|\$\d+|%s|:\w+)\s*,?)+\)")
+NUMBER = re.compile(r"\b\d+\b")
+
+
+def statement_shape(statement: str) -> str:
+    """
+    Нормализует текст запроса: одинаковые по форме запросы с разными значениями
+    и длиной списков IN дают одну строку
+
+    :param statement: SQL-запрос
+    :return: форма запроса
+    """
+    shape = " ".join(statement.split())
+    shape = PARAMETER_LIST.sub("(?)", shape)
+    return NUMBER.sub("N", shape)
+
+
+class QueryCounter:
+    """
+    Считает SQL-запросы движка внутри блока with (через событие before_cursor_execute)
+    и находит повторы одинаковых по форме запросов — признак N+1
+    """
+
+    def __init__(self, engine: AsyncEngine) -> None:
+        self.engine = engine
+        self.statements: list[str] = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        if not TRANSACTION_STATEMENT.match(statement):
+            self.statements.append(statement)
+
+    def __enter__(self) -> "QueryCounter":
+        event.listen(self.engine.sync_engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        event.remove(self.engine.sync_engine, "before_cursor_execute", self._record)
+
+    def __len__(self) -> int:
+        return len(self.statements)
+
+    def repeated(self, threshold: int = 3) -> dict[str, int]:
+        """
+        Формы запросов, выполненные не меньше threshold раз
+
+        :param threshold: порог повторов
+        :return: словарь форма -> количество
+        """
+        counts = Counter(statement_shape(statement) for statement in self.statements)
+        return {shape: count for shape, count in counts.items() if count >= threshold}
+
+    def assert_budget(self, budget: int, threshold: int = 3) -> None:
+        """
+        Проверяет, что запросов не больше бюджета и нет N+1
+
+        :param budget: допустимое число запросов
+        :param threshold: сколько одинаковых по форме запросов считать N+1
+        """
+        listing = "\n".join(f"  {statement_shape(s)}" for s in self.statements)
+        assert len(self) <= budget, f"{len(self)} запросов при бюджете {budget}:\n{listing}"
+        repeated = self.repeated(threshold)
+        assert not repeated, f"Повторяющиеся запросы (N+1): {repeated}"
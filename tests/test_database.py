@@ -0,0 +1,40 @@
+from contextlib import asynccontextmanager
+
+import database
+import pytest
+from database import get_read_db, mark_write
+
+
+@pytest.mark.asyncio
+async def test_read_your_writes_guard(monkeypatch):
+    """
+    Чтение идёт на реплику, пока по ключу не было записи;
+    после записи автор читает с основной БД в пределах окна отставания
+    """
+    used = []
+
+    def factory(name):
+        @asynccontextmanager
+        async def session():
+            used.append(name)
+            yield name
+
+        return session
+
+    monkeypatch.setattr(database, "AsyncSessionLocal", factory("primary"))
+    monkeypatch.setattr(database, "ReadSessionLocal", factory("replica"))
+    monkeypatch.setattr(database, "read_engine", object())
+    key = ("message", -1, -1)
+
+    async with get_read_db(key) as db:
+        assert db == "replica"
+    mark_write(key)
+    async with get_read_db(("message", -2, -1), key) as db:
+        assert db == "primary"
+    # Открытая сессия основной БД используется повторно, без второго соединения
+    async with get_read_db(key, primary="request") as db:
+        assert db == "request"
+    database.recent_writes.discard(key)
+    async with get_read_db(key) as db:
+        assert db == "replica"
+    assert used == ["replica", "primary", "replica"]
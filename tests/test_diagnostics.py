@@ -0,0 +1,72 @@
+import json
+import time
+
+import endpoints
+import pytest
+import request_profiling
+import tracing
+from metrics import render_metrics
+from request_profiling import maybe_profile, should_profile
+from slow_queries import parameters_shape
+from tracing import JSONSpanExporter, MessageTrace
+
+
+def test_parameters_shape_hides_values():
+    """
+    Проверяет, что в лог медленных запросов попадает форма параметров, а не значения
+    """
+    assert parameters_shape({"email": "a@b.c", "name": "A"}, False) == "{email,name}"
+    assert parameters_shape([{"id": 1}, {"id": 2}], True) == "2x{id}"
+    assert parameters_shape((1, "secret"), False) == "(2)"
+
+
+def test_profiling_selection(monkeypatch):
+    """
+    Проверяет выбор запросов для профилирования: по токену в заголовке и выключенный режим
+    """
+    monkeypatch.setattr(request_profiling, "PROFILE_TOKEN", None)
+    monkeypatch.setattr(request_profiling, "PROFILE_SAMPLE_RATE", 0)
+    assert maybe_profile("GET /history/1", "token") is request_profiling._NO_PROFILE
+
+    monkeypatch.setattr(request_profiling, "PROFILE_TOKEN", "token")
+    assert should_profile("token")
+    assert not should_profile("wrong")
+    assert not should_profile(None)
+
+
+def test_message_trace_stages(tmp_path, monkeypatch):
+    """
+    Проверяет трассу сообщения: этапы попадают в гистограммы и в JSON-экспорт
+    """
+    trace_file = tmp_path / "traces.jsonl"
+    exporter = JSONSpanExporter(str(trace_file))
+    monkeypatch.setattr(tracing, "exporter", exporter)
+    trace = MessageTrace(time.time_ns())
+    for stage in ("parsed", "persisted", "committed", "fanout_started", "fanout_finished"):
+        trace.mark(stage)
+    trace.finish()
+    exporter.close()
+
+    spans = [json.loads(line) for line in trace_file.read_text().splitlines()]
+    assert [span["name"] for span in spans] == [
+        "ws new_message", "parse", "persist", "commit", "encode", "fanout"
+    ]
+    assert all(span["trace_id"] == spans[0]["trace_id"] for span in spans)
+    assert 'message_stage_seconds_count{stage="commit"}' in render_metrics()
+
+
+@pytest.mark.asyncio
+async def test_metrics_require_token(client, monkeypatch):
+    """
+    /metrics выключен без METRICS_TOKEN и отдаёт метрики только по этому токену
+    """
+    monkeypatch.setattr(endpoints, "METRICS_TOKEN", None)
+    assert (await client.get("/metrics")).status_code == 404
+
+    monkeypatch.setattr(endpoints, "METRICS_TOKEN", "secret")
+    assert (await client.get("/metrics")).status_code == 401
+    wrong = await client.get("/metrics", headers={"Authorization": "Bearer wrong"})
+    assert wrong.status_code == 401
+    response = await client.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert "message_total_seconds" in response.text
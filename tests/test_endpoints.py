@@ -2,10 +2,11 @@ from uuid import uuid4
 
 import pytest
 from conftest import login_user, register_user
-from database import get_db_session
+from database import engine, get_db_session
 from httpx import AsyncClient
 from models import Message, User
-from sqlalchemy import select
+from query_counter import QueryCounter
+from sqlalchemy import select, update
 
 
 @pytest.mark.asyncio
@@ -262,3 +263,298 @@ async def test_chat_history_success(client: AsyncClient):
     assert len(messages) == 3
     assert all("sender_name" in msg for msg in messages)
     assert all(msg["sender_name"] == user_name for msg in messages)
+
+    # После переименования история сразу отдаёт новое имя (кэш имён обновлён)
+    response = await client.patch("/users/me", headers=headers, json={"name": "Летописец"})
+    assert response.status_code == 200
+    messages = (await client.get(f"/history/{chat_id}", headers=headers)).json()
+    assert all(msg["sender_name"] == "Летописец" for msg in messages)
+
+
+@pytest.mark.asyncio
+async def test_chat_history_not_modified(client: AsyncClient):
+    """
+    Проверяет условный запрос истории по ETag:
+    - Первый запрос возвращает ETag
+    - Повторный запрос с If-None-Match возвращает 304 без тела
+    - После нового сообщения ETag меняется и возвращается 200
+    - После переименования отправителя возвращается 200 с новым именем,
+      в том числе если имя сменил другой воркер (кэш имён этого воркера устарел)
+    """
+    email = f"user_{uuid4().hex[:8]}@example.com"
+    password = "Password1"
+    await register_user(client, "Etag", email, password)
+    token = await login_user(client, email, password)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    chat_resp = await client.post(
+        "/create_chats", headers=headers, json={"name": "ETag", "type": "personal"}
+    )
+    chat_id = chat_resp.json()["chat_id"]
+
+    async def add_message(text: str) -> None:
+        async for session in get_db_session():
+            user = (await session.execute(select(User).where(User.email == email))).scalar_one()
+            session.add(Message(chat_id=chat_id, sender_id=user.id, text=text, is_read=False))
+            await session.commit()
+            break
+
+    await add_message("Первое")
+    first = await client.get(f"/history/{chat_id}")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    cached = await client.get(f"/history/{chat_id}", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    await add_message("Второе")
+    changed = await client.get(f"/history/{chat_id}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert len(changed.json()) == 2
+
+    # Переименование отправителя меняет тело истории, значит и ETag
+    etag = changed.headers["etag"]
+    await client.patch("/users/me", headers=headers, json={"name": "Переименован"})
+    renamed = await client.get(f"/history/{chat_id}", headers={"If-None-Match": etag})
+    assert renamed.status_code == 200
+    assert renamed.json()[0]["sender_name"] == "Переименован"
+
+    etag = renamed.headers["etag"]
+    async for session in get_db_session():
+        await session.execute(update(User).where(User.email == email).values(name="Другой воркер"))
+        await session.commit()
+        break
+    elsewhere = await client.get(f"/history/{chat_id}", headers={"If-None-Match": etag})
+    assert elsewhere.status_code == 200
+    assert elsewhere.json()[0]["sender_name"] == "Другой воркер"
+    assert elsewhere.headers["etag"] != etag
+
+
+@pytest.mark.asyncio
+async def test_chat_history_seq_and_after_seq(client: AsyncClient):
+    """
+    Проверяет порядковые номера сообщений в чате:
+    - Сообщения получают seq 1, 2, 3 без пропусков
+    - Запрос с after_seq возвращает только недостающий диапазон
+    """
+    email = f"user_{uuid4().hex[:8]}@example.com"
+    password = "Password1"
+    await register_user(client, "Seq", email, password)
+    token = await login_user(client, email, password)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    chat_resp = await client.post(
+        "/create_chats", headers=headers, json={"name": "Seq", "type": "personal"}
+    )
+    chat_id = chat_resp.json()["chat_id"]
+
+    async for session in get_db_session():
+        user = (await session.execute(select(User).where(User.email == email))).scalar_one()
+        for i in range(3):
+            session.add(Message(chat_id=chat_id, sender_id=user.id, text=f"№{i + 1}"))
+        await session.commit()
+        break
+
+    response = await client.get(f"/history/{chat_id}")
+    assert [msg["seq"] for msg in response.json()] == [1, 2, 3]
+
+    missing = await client.get(f"/history/{chat_id}", params={"after_seq": 1})
+    assert [msg["text"] for msg in missing.json()] == ["№2", "№3"]
+
+
+@pytest.mark.asyncio
+async def test_create_chats_batch(client: AsyncClient):
+    """
+    Проверяет массовое создание чатов:
+    - Создаёт личный и групповой чат с дополнительным участником одним запросом
+    - Проверяет порядок ответа и совпадение group_id с chat_id
+    - Участник видит групповой чат в своём списке
+    """
+    password = "Password1"
+    owner_email = f"owner_{uuid4().hex[:8]}@example.com"
+    member_email = f"member_{uuid4().hex[:8]}@example.com"
+    await register_user(client, "Owner", owner_email, password)
+    member = await client.post(
+        "/register", data={"name": "Member", "email": member_email, "password": password}
+    )
+    owner_token = await login_user(client, owner_email, password)
+
+    response = await client.post(
+        "/create_chats/batch",
+        headers={"Authorization": f"Bearer {owner_token}"},
+        json={
+            "chats": [
+                {"name": "Batch personal", "type": "personal"},
+                {"name": "Batch group", "type": "group", "member_ids": [member.json()["id"]]},
+            ]
+        },
+    )
+    assert response.status_code == 200
+    personal, group = response.json()
+    assert personal["name"] == "Batch personal"
+    assert "group_id" not in personal
+    assert group["group_id"] == group["chat_id"]
+
+    member_token = await login_user(client, member_email, password)
+    chats = await client.get("/get_chats", headers={"Authorization": f"Bearer {member_token}"})
+    assert any(chat["id"] == group["chat_id"] for chat in chats.json())
+
+
+@pytest.mark.asyncio
+async def test_create_chats_batch_unknown_member(client: AsyncClient):
+    """
+    Проверяет, что пачка с несуществующим участником отклоняется целиком (400)
+    """
+    email = f"user_{uuid4().hex[:8]}@example.com"
+    password = "Password1"
+    await register_user(client, "User", email, password)
+    token = await login_user(client, email, password)
+
+    response = await client.post(
+        "/create_chats/batch",
+        headers={"Authorization": f"Bearer {token}"},
+        json={"chats": [{"name": "Bad group", "type": "group", "member_ids": [10**9]}]},
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_pending_without_opened_socket(client: AsyncClient):
+    """
+    Проверяет /pending для группы, сокет которой пользователь не открывал:
+    - Другой пользователь создаёт группу с ним и пишет в неё
+    - Группа попадает в /pending с нулевой позицией доставки
+    """
+    member_email = f"member_{uuid4().hex[:8]}@example.com"
+    creator_email = f"creator_{uuid4().hex[:8]}@example.com"
+    password = "Password1"
+    member = await client.post(
+        "/register", data={"name": "Member", "email": member_email, "password": password}
+    )
+    creator = await client.post(
+        "/register", data={"name": "Creator", "email": creator_email, "password": password}
+    )
+    member_token = await login_user(client, member_email, password)
+    creator_token = await login_user(client, creator_email, password)
+
+    chat_resp = await client.post(
+        "/create_chats",
+        headers={"Authorization": f"Bearer {creator_token}"},
+        json={"name": "Unopened", "type": "group", "member_ids": [member.json()["id"]]},
+    )
+    chat_id = chat_resp.json()["chat_id"]
+
+    async for session in get_db_session():
+        for i in range(2):
+            session.add(Message(chat_id=chat_id, sender_id=creator.json()["id"], text=f"№{i}"))
+        await session.commit()
+        break
+
+    response = await client.get("/pending", headers={"Authorization": f"Bearer {member_token}"})
+    assert response.status_code == 200
+    assert response.json() == [
+        {"chat_id": chat_id, "delivered_seq": 0, "last_seq": 2, "pending": 2}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_attachment_upload_dedupe_and_range(client: AsyncClient, tmp_path, monkeypatch):
+    """
+    Проверяет вложения:
+    - Одинаковое содержимое двух загрузок хранится одним файлом
+    - Файл больше лимита отклоняется с 413
+    - Скачивание поддерживает Range, чужой пользователь получает 404
+    """
+    import queries
+    from storage import storage
+
+    monkeypatch.setattr(storage, "root", tmp_path)
+    monkeypatch.setattr(queries, "ATTACHMENT_MAX_BYTES", 1024)
+    password = "Password1"
+    owner_email = f"owner_{uuid4().hex[:8]}@example.com"
+    other_email = f"other_{uuid4().hex[:8]}@example.com"
+    await register_user(client, "Owner", owner_email, password)
+    await register_user(client, "Other", other_email, password)
+    headers = {"Authorization": f"Bearer {await login_user(client, owner_email, password)}"}
+
+    body = b"0123456789" * 10
+    uploads = [
+        await client.post(
+            "/attachments",
+            params={"filename": name},
+            content=body,
+            headers={**headers, "Content-Type": "text/plain"},
+        )
+        for name in ("a.txt", "../b.txt")
+    ]
+    assert [upload.status_code for upload in uploads] == [201, 201]
+    first, second = (upload.json() for upload in uploads)
+    assert second["filename"] == "b.txt"
+    assert first["size"] == 100
+    assert len([path for path in tmp_path.rglob("*") if path.is_file()]) == 1
+
+    too_large = await client.post(
+        "/attachments", params={"filename": "big.bin"}, content=b"x" * 2048, headers=headers
+    )
+    assert too_large.status_code == 413
+
+    part = await client.get(
+        f"/attachments/{first['id']}", headers={**headers, "Range": "bytes=10-19"}
+    )
+    assert part.status_code == 206
+    assert part.content == body[10:20]
+
+    other_headers = {"Authorization": f"Bearer {await login_user(client, other_email, password)}"}
+    denied = await client.get(f"/attachments/{first['id']}", headers=other_headers)
+    assert denied.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_query_budgets(client: AsyncClient):
+    """
+    Бюджеты SQL-запросов основных эндпоинтов и отсутствие N+1:
+    история с сообщениями трёх отправителей догружает имена одним запросом
+    """
+    password = "Password1"
+    emails = [f"budget_{uuid4().hex[:8]}@example.com" for _ in range(3)]
+
+    with QueryCounter(engine) as queries:
+        await register_user(client, "Бюджет", emails[0], password)
+    queries.assert_budget(3)
+    for email in emails[1:]:
+        await register_user(client, "Бюджет", email, password)
+
+    with QueryCounter(engine) as queries:
+        token = await login_user(client, emails[0], password)
+    queries.assert_budget(1)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    with QueryCounter(engine) as queries:
+        response = await client.post(
+            "/create_chats", headers=headers, json={"name": "Бюджет", "type": "group"}
+        )
+    queries.assert_budget(4)
+    chat_id = response.json()["chat_id"]
+
+    with QueryCounter(engine) as queries:
+        await client.get("/get_chats", headers=headers)
+    queries.assert_budget(3)
+
+    async for session in get_db_session():
+        senders = (await session.execute(select(User.id).where(User.email.in_(emails)))).scalars()
+        for i, sender_id in enumerate(senders):
+            session.add(Message(chat_id=chat_id, sender_id=sender_id, text=f"Сообщение {i}"))
+        await session.commit()
+        break
+
+    with QueryCounter(engine) as queries:
+        response = await client.get(f"/history/{chat_id}", headers=headers)
+    assert len(response.json()) == 3
+    # версия истории, имена отправителей страницы, проверка чата, сообщения
+    queries.assert_budget(4)
+
+    with QueryCounter(engine) as queries:
+        await client.get("/pending", headers=headers)
+    queries.assert_budget(2)
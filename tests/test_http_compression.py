@@ -0,0 +1,70 @@
+import pytest
+from fastapi import FastAPI
+from http_compression import CompressionMiddleware, choose_encoding
+from httpx import ASGITransport, AsyncClient
+
+compressed_app = FastAPI()
+compressed_app.add_middleware(CompressionMiddleware, paths=["/history"], minimum_size=100)
+
+
+@compressed_app.get("/history/big")
+async def big_history() -> list[dict]:
+    return [{"text": "сообщение " * 20} for _ in range(10)]
+
+
+@compressed_app.get("/history/small")
+async def small_history() -> list[dict]:
+    return [{"text": "hi"}]
+
+
+@compressed_app.get("/other")
+async def other() -> list[dict]:
+    return [{"text": "сообщение " * 20} for _ in range(10)]
+
+
+@compressed_app.get("/historyfoo")
+async def similar_prefix() -> list[dict]:
+    return [{"text": "сообщение " * 20} for _ in range(10)]
+
+
+def test_choose_encoding():
+    """
+    Проверяет выбор алгоритма по заголовку Accept-Encoding:
+    - gzip выбирается, если клиент его поддерживает
+    - q=0 исключает алгоритм
+    """
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0") is None
+    assert choose_encoding("") is None
+
+
+@pytest.mark.asyncio
+async def test_compression_above_threshold():
+    """
+    Проверяет сжатие ответа больше порога:
+    - Заголовок Content-Encoding равен gzip
+    - Распакованное тело совпадает с исходным JSON
+    """
+    transport = ASGITransport(app=compressed_app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.get("/history/big", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert len(response.json()) == 10
+
+
+@pytest.mark.asyncio
+async def test_no_compression_below_threshold_or_other_path():
+    """
+    Проверяет, что маленькие ответы и другие пути (в том числе с тем же
+    строковым префиксом) не сжимаются
+    """
+    transport = ASGITransport(app=compressed_app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        small = await ac.get("/history/small", headers={"Accept-Encoding": "gzip"})
+        other = await ac.get("/other", headers={"Accept-Encoding": "gzip"})
+        similar = await ac.get("/historyfoo", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    assert "content-encoding" not in other.headers
+    assert "content-encoding" not in similar.headers
+    assert small.json() == [{"text": "hi"}]
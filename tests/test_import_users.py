@@ -0,0 +1,88 @@
+import io
+import json
+import uuid
+
+import pytest
+from auth import verify_password
+from database import get_db
+from import_users import import_users, read_records, validate_records
+from models import User
+from sqlalchemy import select
+
+
+def test_read_records_csv_and_ndjson():
+    """
+    Тест чтения пользователей из CSV и NDJSON
+    """
+    csv_stream = io.StringIO("name,email,password\nAnn,ann@example.com,Password1\n")
+    ndjson_stream = io.StringIO(
+        '{"name": "Ann", "email": "ann@example.com", "password": "Password1"}\n\n'
+    )
+
+    expected = [{"name": "Ann", "email": "ann@example.com", "password": "Password1"}]
+    assert list(read_records(csv_stream, "csv")) == expected
+    assert list(read_records(ndjson_stream, "ndjson")) == expected
+
+
+def test_validate_records_rejects_invalid_and_duplicates():
+    """
+    Тест отбраковки невалидных записей и повторов email внутри пачки
+    """
+    users, rejected = validate_records(
+        [
+            {"name": "Ann", "email": "ann@example.com", "password": "Password1"},
+            {"name": "Ann 2", "email": "ann@example.com", "password": "Password2"},
+            {"name": "Bob", "email": "not-an-email", "password": "Password1"},
+            {"name": "Eve", "email": "eve@example.com", "password": "short"},
+        ]
+    )
+
+    assert [user.name for user in users] == ["Ann"]
+    assert rejected == 2
+
+
+def test_read_records_malformed_ndjson_is_rejected():
+    """
+    Битая строка NDJSON не прерывает импорт, а считается отклонённой записью
+    """
+    stream = io.StringIO(
+        '{"name": "Ann", "email": "ann@example.com", "password": "Password1"}\n'
+        '{"name": "Bob", "email": \n'
+        "[1, 2]\n"
+    )
+
+    users, rejected = validate_records(read_records(stream, "ndjson"))
+
+    assert [user.name for user in users] == ["Ann"]
+    assert rejected == 2
+
+
+@pytest.mark.asyncio
+async def test_import_users_inserts_and_skips_existing():
+    """
+    Импорт в БД: новые пользователи добавляются с bcrypt-хешем, существующие
+    email пропускаются, невалидные и битые строки отклоняются
+    """
+    prefix = uuid.uuid4().hex[:8]
+    existing = f"{prefix}_old@example.com"
+    async with get_db() as db:
+        db.add(User(name="Old", email=existing, password_hash="x"))
+        await db.commit()
+    lines = [
+        {"name": "Ann", "email": f"{prefix}_ann@example.com", "password": "Password1"},
+        {"name": "Bob", "email": f"{prefix}_bob@example.com", "password": "Password2"},
+        {"name": "Old", "email": existing, "password": "Password3"},
+        {"name": "Eve", "email": f"{prefix}_eve@example.com", "password": "short"},
+    ]
+    stream = io.StringIO("\n".join(json.dumps(line) for line in lines) + "\n{broken\n")
+
+    assert await import_users(stream, "ndjson", batch_size=2, workers=1) == (2, 1, 2)
+
+    async with get_db() as db:
+        users = (
+            await db.execute(select(User).where(User.email.like(f"{prefix}_%")))
+        ).scalars().all()
+    by_email = {user.email: user for user in users}
+    assert set(by_email) == {existing, f"{prefix}_ann@example.com", f"{prefix}_bob@example.com"}
+    assert by_email[existing].password_hash == "x"
+    assert verify_password("Password1", by_email[f"{prefix}_ann@example.com"].password_hash)
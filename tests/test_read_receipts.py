@@ -0,0 +1,115 @@
+import uuid
+
+import orjson
+import pytest
+from database import get_db
+from models import Chat, Message, MessageRead, User
+from read_receipts import pending_reads, record_read
+from ws_endpoints import active_connections, flush_read_receipts
+
+
+class RecordingSocket:
+    """Соединение, запоминающее отправленные кадры"""
+
+    def __init__(self) -> None:
+        self.frames: list[dict] = []
+
+    async def send_text(self, text: str) -> None:
+        self.frames.append(orjson.loads(text))
+
+
+def test_record_read_keeps_highest_message():
+    """
+    Отметки одного читателя в окне схлопываются в «прочитано до»;
+    рассылку нужно планировать только при открытии окна
+    """
+    assert record_read(-1, 1, 10) is True
+    assert record_read(-1, 1, 30) is False
+    assert record_read(-1, 1, 20) is False
+    assert record_read(-1, 2, 15) is False
+    assert pending_reads[-1] == {1: 30, 2: 15}
+
+
+@pytest.mark.asyncio
+async def test_flush_sends_one_frame_per_reader(monkeypatch):
+    """
+    200 прочтений одного пользователя уходят каждому соединению одним кадром read_up_to
+    """
+    sockets = [RecordingSocket() for _ in range(3)]
+    monkeypatch.setitem(active_connections, -1, set(sockets))
+    for message_id in range(1, 201):
+        record_read(-1, 7, message_id)
+
+    await flush_read_receipts(-1, delay=0)
+
+    for socket in sockets:
+        assert socket.frames == [{"type": "read_up_to", "reader_id": 7, "message_id": 200}]
+    assert -1 not in pending_reads
+
+
+class ClosedSocket:
+    """Соединение, закрытое клиентом до рассылки"""
+
+    async def send_text(self, text: str) -> None:
+        raise RuntimeError('Cannot call "send" once a close message has been sent.')
+
+
+@pytest.mark.asyncio
+async def test_flush_skips_closed_connections(monkeypatch):
+    """
+    Закрытое соединение не мешает рассылке остальным
+    """
+    alive = RecordingSocket()
+    monkeypatch.setitem(active_connections, -1, {ClosedSocket(), alive})
+    record_read(-1, 7, 5)
+
+    await flush_read_receipts(-1, delay=0)
+
+    assert alive.frames == [{"type": "read_up_to", "reader_id": 7, "message_id": 5}]
+
+
+@pytest.mark.asyncio
+async def test_flush_aggregates_large_chats(monkeypatch):
+    """
+    В большом чате вместо кадров по читателям уходит один кадр read_counts
+    с числом прочитавших из БД
+    """
+    async with get_db() as db:
+        readers = [
+            User(name=f"Reader {i}", email=f"{uuid.uuid4().hex}@test.com", password_hash="x")
+            for i in range(3)
+        ]
+        chat = Chat(name="receipts", type="group")
+        db.add_all([*readers, chat])
+        await db.flush()
+        first = Message(chat_id=chat.id, sender_id=readers[0].id, seq=1, text="1")
+        second = Message(chat_id=chat.id, sender_id=readers[0].id, seq=2, text="2")
+        db.add_all([first, second])
+        await db.flush()
+        db.add_all([
+            MessageRead(user_id=readers[1].id, message_id=first.id),
+            MessageRead(user_id=readers[1].id, message_id=second.id),
+            MessageRead(user_id=readers[2].id, message_id=first.id),
+        ])
+        await db.commit()
+        chat_id, first_id, second_id = chat.id, first.id, second.id
+        reader_ids = [reader.id for reader in readers]
+
+    monkeypatch.setattr("ws_endpoints.READ_RECEIPT_GROUP_THRESHOLD", 2)
+    sockets = [RecordingSocket() for _ in range(2)]
+    monkeypatch.setitem(active_connections, chat_id, set(sockets))
+    record_read(chat_id, reader_ids[1], first_id)
+    record_read(chat_id, reader_ids[1], second_id)
+    record_read(chat_id, reader_ids[2], first_id)
+
+    await flush_read_receipts(chat_id, delay=0)
+
+    expected = {
+        "type": "read_counts",
+        "messages": [
+            {"message_id": first_id, "readers": 2},
+            {"message_id": second_id, "readers": 1},
+        ],
+    }
+    for socket in sockets:
+        assert socket.frames == [expected]
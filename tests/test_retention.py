@@ -0,0 +1,98 @@
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from database import get_db
+from models import Attachment, Chat, Message, MessageRead, User
+from retention import purge_expired_messages, purge_unsent_attachments
+from sqlalchemy import func, select
+from storage import storage
+
+
+@pytest.mark.asyncio
+async def test_purge_expired_messages():
+    """
+    Сообщения старше срока хранения чата удаляются пачками вместе с отметками прочтения,
+    свежие сообщения и чаты без срока не затрагиваются
+    """
+    old = datetime.now(timezone.utc) - timedelta(days=40)
+    async with get_db() as db:
+        user = User(name="Retention", email=f"{uuid.uuid4().hex}@test.com", password_hash="x")
+        chat = Chat(name="retention", type="group", retention_days=30)
+        db.add_all([user, chat])
+        await db.flush()
+        messages = [
+            Message(chat_id=chat.id, sender_id=user.id, text=str(i), timestamp=old)
+            for i in range(5)
+        ]
+        messages.append(Message(chat_id=chat.id, sender_id=user.id, text="fresh"))
+        db.add_all(messages)
+        await db.flush()
+        db.add(MessageRead(user_id=user.id, message_id=messages[0].id))
+        await db.commit()
+        chat_id, read_message_id = chat.id, messages[0].id
+
+    stats = await purge_expired_messages(default_days=0, batch_size=2, pause=0)
+
+    assert stats.messages == 5
+    assert stats.reads == 1
+    async with get_db() as db:
+        texts = (await db.execute(select(Message.text).where(Message.chat_id == chat_id))).scalars()
+        assert list(texts) == ["fresh"]
+        reads = await db.scalar(
+            select(func.count()).where(MessageRead.message_id == read_message_id)
+        )
+        assert reads == 0
+
+
+@pytest.mark.asyncio
+async def test_purge_unsent_attachments(tmp_path, monkeypatch):
+    """
+    Старые вложения без сообщений удаляются вместе с файлом; файл, на который
+    ссылается отправленное вложение с тем же содержимым, остаётся
+    """
+    monkeypatch.setattr(storage, "root", tmp_path)
+    old = datetime.now(timezone.utc) - timedelta(hours=48)
+    for key in ("aa/aa/orphan", "bb/bb/shared", "cc/cc/fresh"):
+        path = storage.path(key)
+        path.parent.mkdir(parents=True)
+        path.write_bytes(b"data")
+        os.utime(path, (old.timestamp(), old.timestamp()))
+
+    async with get_db() as db:
+        user = User(name="Uploader", email=f"{uuid.uuid4().hex}@test.com", password_hash="x")
+        chat = Chat(name="attachments", type="personal")
+        db.add_all([user, chat])
+        await db.flush()
+
+        def attachment(key: str, created_at: datetime) -> Attachment:
+            return Attachment(
+                uploader_id=user.id,
+                filename="f.bin",
+                content_type="application/octet-stream",
+                size=4,
+                sha256="0" * 64,
+                storage_key=key,
+                created_at=created_at,
+            )
+
+        orphan = attachment("aa/aa/orphan", old)
+        sent = attachment("bb/bb/shared", old)
+        unsent_shared = attachment("bb/bb/shared", old)
+        fresh = attachment("cc/cc/fresh", datetime.now(timezone.utc))
+        db.add_all([orphan, sent, unsent_shared, fresh])
+        await db.flush()
+        db.add(Message(chat_id=chat.id, sender_id=user.id, text="", attachment_id=sent.id))
+        await db.commit()
+        kept_ids = {sent.id, fresh.id}
+        all_ids = [orphan.id, sent.id, unsent_shared.id, fresh.id]
+
+    assert await purge_unsent_attachments(max_age_hours=24, batch_size=1) == (2, 1)
+
+    async with get_db() as db:
+        left = (await db.execute(select(Attachment.id).where(Attachment.id.in_(all_ids)))).scalars()
+        assert set(left) == kept_ids
+    assert not storage.path("aa/aa/orphan").exists()
+    assert storage.path("bb/bb/shared").exists()
+    assert storage.path("cc/cc/fresh").exists()
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock
+
+import pytest
+import scheduler as scheduler_module
+from database import engine, get_db
+from models import JobRun
+from scheduler import CronSchedule, Job, Scheduler, job_duration_seconds
+from sqlalchemy import update
+from starlette.websockets import WebSocketState
+from ws_endpoints import active_connections, reap_dead_connections
+
+
+def test_cron_next_after():
+    """
+    Ближайший запуск по cron: шаги, диапазоны и дни недели (0 — воскресенье)
+    """
+    assert CronSchedule("*/15 * * * *").next_after(datetime(2025, 1, 1, 10, 7)) == datetime(
+        2025, 1, 1, 10, 15
+    )
+    assert CronSchedule("30 3 * * *").next_after(datetime(2025, 1, 1, 3, 30)) == datetime(
+        2025, 1, 2, 3, 30
+    )
+    # 2025-01-01 — среда, ближайшие будни после вечера пятницы — понедельник
+    assert CronSchedule("0 9 * * 1-5").next_after(datetime(2025, 1, 3, 18, 0)) == datetime(
+        2025, 1, 6, 9, 0
+    )
+    with pytest.raises(ValueError):
+        CronSchedule("61 * * * *")
+
+
+@pytest.mark.asyncio
+async def test_run_job_records_duration_and_survives_errors():
+    """
+    Ошибка задачи логируется и не останавливает планировщик; длительность
+    каждого запуска попадает в гистограмму со статусом
+    """
+    calls = []
+
+    async def failing() -> None:
+        calls.append("run")
+        raise RuntimeError("boom")
+
+    scheduler = Scheduler(engine)
+    job = scheduler.add_interval("test_failing", failing, 60)
+    await scheduler.run_job(job)
+    await scheduler.run_job(job)
+
+    assert calls == ["run", "run"]
+    _, (_, count) = job_duration_seconds._series[("test_failing", "error")]
+    assert count == 2
+
+
+@pytest.mark.asyncio
+async def test_single_instance_job_runs_once_per_period():
+    """
+    Задача одного экземпляра выполняется одним воркером за период: второй воркер
+    в том же периоде пропускает запуск, после окончания периода задача снова выполняется
+    """
+    calls = []
+
+    async def job_func() -> None:
+        calls.append("run")
+
+    workers = [Scheduler(engine), Scheduler(engine)]
+    jobs = [
+        worker.add_interval("test_once", job_func, 3600, single_instance=True)
+        for worker in workers
+    ]
+    for worker, job in zip(workers, jobs):
+        await worker.run_job(job)
+    assert calls == ["run"]
+
+    async with get_db() as db:
+        await db.execute(
+            update(JobRun)
+            .where(JobRun.name == "test_once")
+            .values(started_at=datetime.now(timezone.utc) - timedelta(hours=2))
+        )
+        await db.commit()
+    await workers[1].run_job(jobs[1])
+    assert calls == ["run", "run"]
+
+
+@pytest.mark.asyncio
+async def test_run_job_survives_claim_errors(monkeypatch):
+    """
+    Ошибка отметки запуска (недоступна БД) логируется и не роняет цикл задачи
+    """
+    async def broken_claim(job: Job) -> bool:
+        raise OSError("БД недоступна")
+
+    monkeypatch.setattr(scheduler_module, "claim_run", broken_claim)
+    scheduler = Scheduler(engine)
+    job = scheduler.add_interval("test_broken", AsyncMock(), 60, single_instance=True)
+    await scheduler.run_job(job)
+    job.func.assert_not_called()
+
+
+class FakeSocket:
+    """Соединение с заданным состоянием клиента"""
+
+    def __init__(self, client_state: WebSocketState) -> None:
+        self.client_state = client_state
+        self.application_state = WebSocketState.CONNECTED
+
+
+def test_reap_dead_connections():
+    """
+    Закрытые соединения и опустевшие чаты убираются из реестра
+    """
+    alive = FakeSocket(WebSocketState.CONNECTED)
+    dead = FakeSocket(WebSocketState.DISCONNECTED)
+    active_connections[-1] = {alive, dead}
+    active_connections[-2] = {dead}
+
+    assert reap_dead_connections() == 2
+    assert active_connections[-1] == {alive}
+    assert -2 not in active_connections
+    active_connections.pop(-1)
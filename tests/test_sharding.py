@@ -0,0 +1,61 @@
+import pytest
+import sharding
+from fastapi.testclient import TestClient
+from main import app
+from sharding import HashRing, parse_nodes
+from starlette.websockets import WebSocketDisconnect
+
+NODES = {f"node{i}": f"ws://10.0.0.{i}:8000" for i in range(1, 4)}
+
+
+def test_parse_nodes():
+    """
+    Список узлов разбирается из SHARD_NODES, ошибки формата не пропускаются
+    """
+    assert parse_nodes(" a=ws://h1:8000/, b=ws://h2:8000 ,") == {
+        "a": "ws://h1:8000",
+        "b": "ws://h2:8000",
+    }
+    assert parse_nodes("") == {}
+    with pytest.raises(ValueError):
+        parse_nodes("a=ws://h1:8000,ws://h2:8000")
+
+
+def test_ring_balances_and_moves_few_chats():
+    """
+    Чаты распределяются по узлам примерно поровну; при добавлении узла
+    переезжает около 1/N чатов и только на новый узел
+    """
+    chats = range(1, 30001)
+    ring = HashRing(NODES)
+    owners = {chat_id: ring.node_for(chat_id) for chat_id in chats}
+    for node_id in NODES:
+        share = sum(owner == node_id for owner in owners.values()) / len(chats)
+        assert 0.28 < share < 0.39
+
+    grown = HashRing({**NODES, "node4": "ws://10.0.0.4:8000"})
+    moved = [chat_id for chat_id in chats if grown.node_for(chat_id) != owners[chat_id]]
+    assert 0.18 < len(moved) / len(chats) < 0.32
+    assert {grown.node_for(chat_id) for chat_id in moved} == {"node4"}
+
+
+def test_foreign_chat_is_redirected(monkeypatch):
+    """
+    Подключение к чату другого узла получает кадр redirect и закрывается кодом 4300;
+    /route сообщает владельца чата
+    """
+    ring = HashRing(NODES)
+    monkeypatch.setattr(sharding, "ring", ring)
+    monkeypatch.setattr(sharding, "SHARD_NODE_ID", "node1")
+    chat_id = next(chat_id for chat_id in range(1, 100) if ring.node_for(chat_id) != "node1")
+    client = TestClient(app)
+
+    route = client.get(f"/route/{chat_id}").json()
+    assert route["node"] == ring.node_for(chat_id)
+    assert route["url"] == f"{NODES[route['node']]}/ws/chat/{chat_id}"
+
+    with client.websocket_connect(f"/ws/chat/{chat_id}") as ws:
+        assert ws.receive_json() == {"type": "redirect", "url": route["url"]}
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+    assert closed.value.code == 4300
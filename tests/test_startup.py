@@ -0,0 +1,37 @@
+import main
+import pytest
+import startup
+from main import app, lifespan
+from models import Base
+from sqlalchemy.ext.asyncio import create_async_engine
+from startup import check_schema_revision
+
+
+@pytest.mark.asyncio
+async def test_check_schema_requires_model_tables(monkeypatch):
+    """
+    Режим check не пропускает БД, в которой нет таблиц моделей,
+    даже если ревизия совпадает с head
+    """
+    # Отдельная БД без alembic_version: текущая ревизия — пустое множество
+    monkeypatch.setattr(startup, "get_head_revisions", set)
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        await check_schema_revision(engine, Base.metadata.tables)
+        with pytest.raises(RuntimeError, match="no_such_table"):
+            await check_schema_revision(engine, [*Base.metadata.tables, "no_such_table"])
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_unknown_schema_mode_fails_startup(monkeypatch):
+    """
+    Опечатка в SCHEMA_MODE останавливает старт, а не пропускает подготовку схемы
+    """
+    monkeypatch.setattr(main, "SCHEMA_MODE", "chek")
+    with pytest.raises(RuntimeError, match="SCHEMA_MODE"):
+        async with lifespan(app):
+            pass
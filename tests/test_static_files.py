@@ -0,0 +1,47 @@
+import gzip
+
+import pytest
+from build_static import build_variants
+from httpx import ASGITransport, AsyncClient
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from static_files import PrecompressedStaticFiles
+
+
+@pytest.mark.asyncio
+async def test_precompressed_static_files(tmp_path):
+    """
+    Проверяет отдачу статики:
+    - Выбирается заранее сжатый gzip-вариант, без Accept-Encoding — исходный файл
+    - Повторный запрос с ETag получает 304
+    - Файлы с хешем в имени кэшируются как immutable, остальные перепроверяются
+    """
+    body = b"<html>" + b"hello " * 500 + b"</html>"
+    (tmp_path / "index.html").write_bytes(body)
+    (tmp_path / "app.3f2a9c1d.js").write_bytes(b"console.log(1);" * 100)
+    for name in ("index.html", "app.3f2a9c1d.js"):
+        build_variants(tmp_path / name)
+
+    app = Starlette(routes=[Mount("/static", PrecompressedStaticFiles(directory=tmp_path))])
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        compressed = await client.get("/static/index.html", headers={"Accept-Encoding": "gzip"})
+        assert compressed.headers["content-encoding"] == "gzip"
+        assert compressed.headers["cache-control"] == "no-cache"
+        assert compressed.content == body
+        assert int(compressed.headers["content-length"]) < len(body)
+
+        plain = await client.get("/static/index.html", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in plain.headers
+        assert plain.content == body
+        assert plain.headers["etag"] != compressed.headers["etag"]
+
+        cached = await client.get(
+            "/static/index.html",
+            headers={"Accept-Encoding": "gzip", "If-None-Match": compressed.headers["etag"]},
+        )
+        assert cached.status_code == 304
+
+        asset = await client.get("/static/app.3f2a9c1d.js")
+        assert "immutable" in asset.headers["cache-control"]
+
+    assert gzip.decompress((tmp_path / "index.html.gz").read_bytes()) == body
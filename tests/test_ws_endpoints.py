@@ -0,0 +1,48 @@
+from uuid import uuid4
+
+from database import engine
+from fastapi.testclient import TestClient
+from main import app
+from query_counter import QueryCounter
+
+
+def test_websocket_message_roundtrip_and_resume():
+    """
+    Полный сценарий WebSocket на тестовой БД:
+    - подключение по JWT: история и кадр session с resume-токеном
+    - new_message возвращается отправителю с именем за три запроса
+    - переподключение по resume-токену: новый токен без истории
+    """
+    client = TestClient(app)
+    email = f"ws_{uuid4().hex[:8]}@example.com"
+    client.post("/register", data={"name": "Сокет", "email": email, "password": "Password1"})
+    token = client.post("/login", data={"username": email, "password": "Password1"}).json()[
+        "access_token"
+    ]
+    headers = {"Authorization": f"Bearer {token}"}
+    chat_id = client.post(
+        "/create_chats", headers=headers, json={"name": "WS", "type": "personal"}
+    ).json()["chat_id"]
+
+    with client.websocket_connect(f"/ws/chat/{chat_id}?token={token}") as ws:
+        assert ws.receive_json() == []
+        session = ws.receive_json()
+        assert session["type"] == "session"
+        ws.send_json({"type": "new_message", "text": "Привет", "client_id": uuid4().hex})
+        frame = ws.receive_json()
+        assert frame["type"] == "new_message"
+        assert frame["message"]["text"] == "Привет"
+        assert frame["message"]["sender_name"] == "Сокет"
+        assert frame["message"]["seq"] == 1
+
+        # Досылка после session уже завершена: считаются только запросы нового сообщения
+        with QueryCounter(engine) as queries:
+            ws.send_json({"type": "new_message", "text": "Ещё", "client_id": uuid4().hex})
+            assert ws.receive_json()["message"]["seq"] == 2
+        # ключ идемпотентности, номер seq в чате, сообщение
+        queries.assert_budget(3)
+
+    with client.websocket_connect(f"/ws/chat/{chat_id}?resume={session['resume_token']}") as ws:
+        resumed = ws.receive_json()
+        assert resumed["type"] == "session"
+        assert resumed["resume_token"] != session["resume_token"]
@@ -1,9 +1,15 @@
-from unittest.mock import AsyncMock
+import uuid
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
-from models import Message, User
+from database import get_db
+from membership import invalidate_membership, is_chat_member, membership_cache
+from models import Chat, Message, MessageRead, User
 from schemas import MessageWithSender
-from ws_queries import (fetch_last_messages, mark_message_as_read,
+from sqlalchemy import func, select
+from user_names import remember_user_name
+from ws_queries import (ack_delivery, fetch_last_messages, get_delivery_cursor,
+                        mark_message_as_read, recent_client_ids,
                         save_new_message)
 
 
@@ -12,43 +18,46 @@ async def test_fetch_last_messages():
     """
     Проверяет получение последних сообщений из чата.
 
-    :return: список сообщений, преобразованных в MessageWithSender
+    :return: список словарей в формате MessageWithSender
     """
     mock_db = AsyncMock()
-    mock_result = AsyncMock()
-    mock_result.__iter__.return_value = [
-        type(
-            "Row",
-            (),
-            {
-                "id": 1,
-                "chat_id": 10,
-                "sender_id": 2,
-                "sender_name": "Alice",
-                "text": "Hello",
-                "timestamp": "2024-01-01T00:00:00",
-                "is_read": False,
-            },
-        )()
+    mock_result = MagicMock()
+    mock_result.mappings.return_value = [
+        {
+            "id": 1,
+            "chat_id": 10,
+            "seq": 1,
+            "sender_id": 2,
+            "text": "Hello",
+            "timestamp": "2024-01-01T00:00:00",
+            "is_read": False,
+            "attachment_id": None,
+        }
     ]
     mock_db.execute.return_value = mock_result
+    # Имя отправителя берётся из кэша, без запроса к users
+    remember_user_name(2, "Alice")
 
     messages = await fetch_last_messages(chat_id=10, db=mock_db)
     assert len(messages) == 1
-    assert isinstance(messages[0], MessageWithSender)
-    assert messages[0].text == "Hello"
+    assert messages[0]["text"] == "Hello"
+    assert MessageWithSender.model_validate(messages[0]).sender_name == "Alice"
+    assert mock_db.execute.await_count == 1
 
 
 @pytest.mark.asyncio
 async def test_save_new_message_skip_if_duplicate():
     """
     Проверяет поведение при попытке сохранить дубликат сообщения.
+    Ключ (sender_id, client_id) уже есть в БД, вставка ключа ничего не возвращает.
 
     :param client_id: уже существующий client_id
     :return: None, если сообщение уже существует
     """
+    recent_client_ids.clear()
     mock_db = AsyncMock()
-    mock_db.execute.return_value.scalar_one_or_none.return_value = Message()
+    mock_db.add = MagicMock()
+    mock_db.execute.return_value = MagicMock(first=MagicMock(return_value=None))
 
     user = User(id=1, name="Samvel", email="s@example.com",
                 password_hash="hashed")
@@ -57,6 +66,47 @@ async def test_save_new_message_skip_if_duplicate():
         chat_id=5, user=user, text="Hey!", client_id="abc123", db=mock_db
     )
     assert result is None
+    mock_db.add.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_save_new_message_duplicate_rejected_from_cache():
+    """
+    Проверяет, что повтор недавно принятого client_id отсекается без обращения к БД,
+    а тот же client_id другого отправителя проходит в БД.
+    """
+    recent_client_ids.clear()
+    recent_client_ids.set((1, "abc123"), True)
+    mock_db = AsyncMock()
+    mock_db.add = MagicMock()
+
+    user = User(id=1, name="Samvel", email="s@example.com", password_hash="hashed")
+    assert await save_new_message(5, user, "Hey!", "abc123", mock_db) is None
+    mock_db.execute.assert_not_called()
+
+    other = User(id=2, name="Other", email="o@example.com", password_hash="hashed")
+    mock_db.execute.return_value = MagicMock(first=MagicMock(return_value=None))
+    await save_new_message(5, other, "Hey!", "abc123", mock_db)
+    mock_db.execute.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_save_new_message_without_client_id():
+    """
+    Проверяет, что сообщение без client_id сохраняется без ключа идемпотентности,
+    а повтор такого сообщения не отсекается
+    """
+    async with get_db() as db:
+        user = User(name="Legacy", email=f"{uuid.uuid4().hex}@test.com", password_hash="x")
+        chat = Chat(name="legacy", type="personal")
+        db.add_all([user, chat])
+        await db.commit()
+
+        first = await save_new_message(chat.id, user, "Без id", None, db)
+        second = await save_new_message(chat.id, user, "Без id", None, db)
+        assert first is not None and second is not None
+        assert (first.seq, second.seq) == (1, 2)
+        assert len(recent_client_ids) == 0
 
 
 @pytest.mark.asyncio
@@ -69,7 +119,95 @@ async def test_mark_message_as_read():
     :return: True, если запись успешно добавлена
     """
     mock_db = AsyncMock()
-    result = await mark_message_as_read(user_id=1, message_id=99, db=mock_db)
+    mock_db.scalar.return_value = 99
+    result = await mark_message_as_read(user_id=1, message_id=99, chat_id=10, db=mock_db)
     assert result is True
     mock_db.execute.assert_called()
     mock_db.commit.assert_called()
+
+
+@pytest.mark.asyncio
+async def test_mark_message_as_read_rejects_foreign_messages():
+    """
+    Сообщение другого чата и несуществующее сообщение не отмечаются
+    (и не роняют соединение ошибкой внешнего ключа)
+    """
+    async with get_db() as db:
+        user = User(name="Reader", email=f"{uuid.uuid4().hex}@test.com", password_hash="x")
+        chat = Chat(name="mine", type="personal")
+        other_chat = Chat(name="other", type="personal")
+        db.add_all([user, chat, other_chat])
+        await db.flush()
+        foreign = Message(chat_id=other_chat.id, sender_id=user.id, seq=1, text="чужое")
+        db.add(foreign)
+        await db.commit()
+
+        assert not await mark_message_as_read(user.id, foreign.id, chat.id, db)
+        assert not await mark_message_as_read(user.id, 10**9, chat.id, db)
+        assert await mark_message_as_read(user.id, foreign.id, other_chat.id, db)
+        reads = await db.scalar(select(func.count()).where(MessageRead.user_id == user.id))
+        assert reads == 1
+
+
+@pytest.mark.asyncio
+async def test_is_chat_member_cached():
+    """
+    Проверяет кэш членства в чате:
+    - Первая проверка обращается к БД
+    - Повторная проверка берётся из кэша без запроса
+    - После инвалидации снова выполняется запрос
+    """
+    membership_cache.clear()
+    mock_db = AsyncMock()
+    row = MagicMock(type="group", is_member=True)
+    mock_db.execute.return_value = MagicMock(first=MagicMock(return_value=row))
+
+    assert await is_chat_member(user_id=1, chat_id=7, db=mock_db) is True
+    assert await is_chat_member(user_id=1, chat_id=7, db=mock_db) is True
+    assert mock_db.execute.call_count == 1
+
+    invalidate_membership(1, 7)
+    row.is_member = False
+    assert await is_chat_member(user_id=1, chat_id=7, db=mock_db) is False
+    assert mock_db.execute.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_ack_delivery_capped_at_last_seq():
+    """
+    Подтверждение дальше последнего сообщения чата обрезается до last_seq,
+    отрицательное игнорируется: следующие сообщения не теряются из очереди
+    """
+    async with get_db() as db:
+        user = User(name="Ack", email=f"{uuid.uuid4().hex}@test.com", password_hash="x")
+        chat = Chat(name="ack", type="personal", last_seq=5)
+        db.add_all([user, chat])
+        await db.commit()
+
+        await ack_delivery(user.id, chat.id, 10**9, db)
+        assert await get_delivery_cursor(user.id, chat.id, db) == 5
+        await ack_delivery(user.id, chat.id, -1, db)
+        assert await get_delivery_cursor(user.id, chat.id, db) == 5
+        await ack_delivery(user.id, chat.id, 3, db)
+        assert await get_delivery_cursor(user.id, chat.id, db) == 5
+
+
+@pytest.mark.asyncio
+async def test_fetch_last_messages_returns_latest_page():
+    """
+    История при подключении — последние 50 сообщений чата в порядке seq, а не первые
+    """
+    async with get_db() as db:
+        user = User(name="History", email=f"{uuid.uuid4().hex}@test.com", password_hash="x")
+        chat = Chat(name="long", type="personal", last_seq=60)
+        db.add_all([user, chat])
+        await db.flush()
+        db.add_all(
+            Message(chat_id=chat.id, sender_id=user.id, seq=seq, text=str(seq))
+            for seq in range(1, 61)
+        )
+        await db.commit()
+
+        messages = await fetch_last_messages(chat.id, db)
+
+    assert [message["seq"] for message in messages] == list(range(11, 61))
@@ -0,0 +1,35 @@
+from ws_sessions import (WSSession, remember_message, replay_since,
+                         resume_session, sessions)
+
+
+def test_resume_token_single_use():
+    """
+    Resume-токен действует только для своего чата и только один раз
+    """
+    sessions.set("token", WSSession(user_id=1, user_name="Alice", chat_id=10, last_seq=3))
+
+    assert resume_session("token", 11) is None
+    session = resume_session("token", 10)
+    assert session is not None and session.last_seq == 3
+    assert resume_session("token", 10) is None
+
+
+def test_replay_since_ring_buffer():
+    """
+    Досылка из буфера идёт по порядку seq; если буфер не покрывает пропуск
+    до Chat.last_seq (сообщения мог разослать другой воркер), нужна БД
+    """
+    chat_id = -42
+    for seq in (5, 7, 6):
+        remember_message(chat_id, {"seq": seq})
+
+    assert [m["seq"] for m in replay_since(chat_id, 5, 7)] == [6, 7]
+    assert replay_since(chat_id, 7, 7) == []
+    assert replay_since(chat_id, 2, 7) is None
+    # Сообщение 8 разослал другой воркер
+    assert replay_since(chat_id, 5, 8) is None
+    remember_message(chat_id, {"seq": 10})
+    # В буфере дыра: 8 и 9 пришли через другие воркеры
+    assert replay_since(chat_id, 7, 10) is None
+    assert replay_since(-43, 0, 0) == []
+    assert replay_since(-43, 0, 1) is None